@@ -0,0 +1,203 @@
+#! /usr/bin/env python3
+"""
+Time detangle_bedmap's segment_indices and find_gaps against the loops
+they replaced, and check that both give the same results.
+
+Given a data directory, this runs them on each campaign's matched BEDMAP1
+indices (loaded and matched as detangle_bedmap.py does). Otherwise, it
+uses synthetic indices that mimic matched BEDMAP1 points: runs of
+consecutive indices, with short gaps (a few unmatched points) and longer
+ones between them. The old find_gaps grows its output with np.append, so
+it is quadratic; keep --num-indices modest (BEDMAP1 is ~2.5M points,
+which takes minutes).
+"""
+
+import time
+
+import numpy as np
+
+from detangle_bedmap import (
+    default_parameters,
+    find_campaign_matches,
+    find_gaps,
+    load_data,
+    segment_indices,
+)
+
+
+def loop_find_gaps(segments, max_skip):
+    """
+    find_gaps, before it was vectorized.
+    """
+    gaps = np.array([])
+    for idx in np.arange(len(segments) - 1):
+        s0, s1 = segments[idx]
+        s2, s3 = segments[idx + 1]
+        assert s1 >= s0  # There are single-length "segments"
+        assert s2 > s1
+        assert s3 >= s2
+        if s2 - s1 < max_skip:
+            gaps = np.append(gaps, np.arange(s1 + 1, s2))
+    return gaps.astype(int)
+
+
+def loop_segment_indices(idxs, max_skips, min_length):
+    """
+    segment_indices, before it was vectorized.
+    """
+    segments = []
+    idxs.sort()
+    start_idx = idxs[0]
+    curr_idx = start_idx
+    length = 1
+    for idx in idxs:
+        if idx - curr_idx > max_skips:
+            if length > min_length:
+                segments.append((int(start_idx), int(curr_idx)))
+            start_idx = idx
+            length = 1
+        else:
+            length += 1
+        curr_idx = idx
+    segments.append((int(start_idx), int(curr_idx)))
+    return segments
+
+
+def make_indices(num_indices: int, seed: int = 0) -> np.ndarray:
+    """
+    Runs of consecutive indices (geometric lengths, mean 5), separated by
+    gaps that are mostly a few points long, and sometimes much longer.
+    """
+    rng = np.random.default_rng(seed)
+    # Every run has at least one index, so this is always enough
+    num_runs = num_indices
+    run_lengths = rng.geometric(0.2, size=num_runs)
+    gap_lengths = np.where(
+        rng.random(num_runs) < 0.8,
+        rng.integers(2, 10, size=num_runs),
+        rng.integers(10, 1000, size=num_runs),
+    )
+    starts = np.cumsum(run_lengths + gap_lengths) - run_lengths
+    offsets = np.cumsum(run_lengths) - run_lengths
+    idxs = np.repeat(starts - offsets, run_lengths) + np.arange(run_lengths.sum())
+    return idxs[:num_indices]
+
+
+def time_functions(idxs, max_skips: int, min_length: int, max_gap_length: int):
+    """
+    Run both versions of segment_indices then find_gaps on idxs.
+    Returns (new, loop) timings for each, the number of segments and gap
+    indices, and whether both versions agreed.
+    """
+    t0 = time.time()
+    segments = segment_indices(idxs.copy(), max_skips, min_length)
+    dt_segments = time.time() - t0
+    t0 = time.time()
+    old_segments = loop_segment_indices(idxs.copy(), max_skips, min_length)
+    old_dt_segments = time.time() - t0
+
+    t0 = time.time()
+    gaps = find_gaps(segments, max_gap_length)
+    dt_gaps = time.time() - t0
+    t0 = time.time()
+    old_gaps = loop_find_gaps(old_segments, max_gap_length)
+    old_dt_gaps = time.time() - t0
+
+    same = segments == old_segments and np.array_equal(gaps, old_gaps)
+    timings = np.array([dt_segments, old_dt_segments, dt_gaps, old_dt_gaps])
+    return timings, len(segments), len(gaps), same
+
+
+def print_timings(timings, num_segments: int, num_gaps: int) -> None:
+    dt_segments, old_dt_segments, dt_gaps, old_dt_gaps = timings
+    print(
+        "segment_indices: {:0.2f} s (loop: {:0.2f} s); {} segments".format(
+            dt_segments, old_dt_segments, num_segments
+        )
+    )
+    print(
+        "find_gaps: {:0.2f} s (loop: {:0.2f} s); {} gap indices".format(
+            dt_gaps, old_dt_gaps, num_gaps
+        )
+    )
+
+
+def benchmark(num_indices: int, max_skips: int, min_length: int, max_gap_length: int) -> bool:
+    idxs = make_indices(num_indices)
+    print(f"{len(idxs)} indices, spanning {idxs[-1] + 1}")
+    timings, num_segments, num_gaps, same = time_functions(
+        idxs, max_skips, min_length, max_gap_length
+    )
+    print_timings(timings, num_segments, num_gaps)
+    print(f"Results match: {same}")
+    return same
+
+
+def benchmark_bedmap(data_dir: str, cache_dir: str) -> bool:
+    """
+    The real workload: each campaign's matched BEDMAP1 indices, with
+    the parameters select_bedmap_indices uses.
+    """
+    bm1_points, campaign_points = load_data(data_dir, cache_dir)
+    max_dists, max_gap_lengths, _ = default_parameters(campaign_points)
+    matched_idxs, _ = find_campaign_matches(bm1_points, campaign_points, max_dists)
+
+    total_timings = np.zeros(4)
+    total_segments = 0
+    total_gaps = 0
+    all_same = True
+    for campaign, idxs in matched_idxs.items():
+        if len(idxs) == 0:
+            # The old segment_indices can't handle an empty list
+            continue
+        timings, num_segments, num_gaps, same = time_functions(
+            idxs.astype(int), 1, 1, max_gap_lengths[campaign]
+        )
+        if not same:
+            print(f"{campaign}: results differ")
+        total_timings += timings
+        total_segments += num_segments
+        total_gaps += num_gaps
+        all_same = all_same and same
+
+    print(f"{len(bm1_points)} BEDMAP1 points; {len(matched_idxs)} campaigns")
+    print_timings(total_timings, total_segments, total_gaps)
+    print(f"Results match: {all_same}")
+    return all_same
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import sys
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "data_directory",
+        nargs="?",
+        help="Root directory for all data; if given, time the matched BEDMAP1 "
+        "indices rather than synthetic ones",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory for cached intermediate arrays. "
+        "Defaults to {data_directory}/targ/ANTARCTIC/detangle_cache",
+    )
+    parser.add_argument("--num-indices", type=int, default=200_000)
+    # Defaults are the values select_bedmap_indices uses
+    parser.add_argument("--max-skips", type=int, default=1)
+    parser.add_argument("--min-length", type=int, default=1)
+    parser.add_argument("--max-gap-length", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.data_directory is not None:
+        cache_dir = args.cache_dir
+        if cache_dir is None:
+            cache_dir = os.path.join(
+                args.data_directory, "targ", "ANTARCTIC", "detangle_cache"
+            )
+        ok = benchmark_bedmap(args.data_directory, cache_dir)
+    else:
+        ok = benchmark(args.num_indices, args.max_skips, args.min_length, args.max_gap_length)
+    if not ok:
+        sys.exit(1)
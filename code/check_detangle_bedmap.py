@@ -0,0 +1,120 @@
+#! /usr/bin/env python3
+"""
+Check detangle_bedmap's vectorized cross-track test against the
+shapely implementation it replaced, on a small saved fixture.
+
+The fixture is a synthetic survey line (including repeated points, which
+give zero-length segments) with bedmap-like points scattered around it,
+plus the cross-track distances that the old per-point shapely loop gave.
+Only --regenerate needs shapely; checking just needs numpy.
+"""
+
+import numpy as np
+import scipy.spatial  # Used for cKDTree
+
+from detangle_bedmap import closest_segment_distances
+
+default_fixture = "../data/detangle_bedmap_crosstrack.npz"
+
+
+def shapely_closest_segment_distances(points, campaign_xy, campaign_idxs):
+    """
+    The per-point loop from select_bedmap_indices, before it was vectorized.
+    Returns the smallest distance to a segment that the point projects
+    strictly within (inf if there isn't one), which is what decided
+    whether a gap point was accepted.
+    """
+    from shapely.geometry import LineString, Point
+
+    sx = campaign_xy[:, 0]
+    sy = campaign_xy[:, 1]
+    dists = np.full(len(points), np.inf)
+    for ii, c_idx in enumerate(campaign_idxs):
+        if c_idx + 1 < len(sx):
+            seg1 = LineString(
+                [Point(sx[c_idx], sy[c_idx]), Point(sx[c_idx + 1], sy[c_idx + 1])]
+            )
+        else:
+            seg1 = None
+        if c_idx > 0:
+            seg2 = LineString(
+                [Point(sx[c_idx], sy[c_idx]), Point(sx[c_idx - 1], sy[c_idx - 1])]
+            )
+        else:
+            seg2 = None
+        bm1_pt = Point(points[ii, 0], points[ii, 1])
+        for seg in [seg1, seg2]:
+            if seg is None:
+                continue
+            pp = seg.project(bm1_pt)  # Project bedmap point onto line segment
+            dd = seg.distance(bm1_pt)
+            if pp > 0 and pp < seg.length:
+                dists[ii] = min(dists[ii], dd)
+    return dists
+
+
+def make_fixture(filepath: str, seed: int = 0) -> None:
+    rng = np.random.default_rng(seed)
+    # A wandering survey line, ~1 km between points
+    steps = rng.normal(scale=1000.0, size=(200, 2)) + [800.0, 0.0]
+    campaign_xy = np.cumsum(steps, axis=0)
+    # Repeated points give zero-length segments, which are rejected
+    campaign_xy[50] = campaign_xy[49]
+    campaign_xy[120:123] = campaign_xy[119]
+
+    # Points near the line, a few far from it, and some exactly on survey points
+    idxs = rng.integers(0, len(campaign_xy), size=400)
+    points = campaign_xy[idxs] + rng.normal(scale=600.0, size=(400, 2))
+    points[:20] += rng.normal(scale=20000.0, size=(20, 2))
+    points[20:30] = campaign_xy[idxs[20:30]]
+    points = np.concatenate([points, campaign_xy[[0, -1]] + [[-500.0, 10.0], [500.0, 10.0]]])
+
+    _, campaign_idxs = scipy.spatial.cKDTree(campaign_xy).query(points)
+    expected = shapely_closest_segment_distances(points, campaign_xy, campaign_idxs)
+    np.savez(
+        filepath,
+        points=points,
+        campaign_xy=campaign_xy,
+        campaign_idxs=campaign_idxs,
+        expected=expected,
+    )
+    print(
+        f"Wrote {len(points)} points to {filepath} "
+        f"({np.isfinite(expected).sum()} within a segment)"
+    )
+
+
+def check_fixture(filepath: str) -> bool:
+    fixture = np.load(filepath)
+    expected = fixture["expected"]
+    dists = closest_segment_distances(
+        fixture["points"], fixture["campaign_xy"], fixture["campaign_idxs"]
+    )
+    same_segments = np.array_equal(np.isfinite(dists), np.isfinite(expected))
+    finite = np.isfinite(expected)
+    max_error = np.max(np.abs(dists[finite] - expected[finite]), initial=0.0)
+    print(
+        "{}: {} points; same segments: {}; max distance error = {:0.3g} m".format(
+            filepath, len(expected), same_segments, max_error
+        )
+    )
+    return same_segments and max_error < 1e-6
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixture", default=default_fixture)
+    parser.add_argument(
+        "--regenerate",
+        action="store_true",
+        help="Rewrite the fixture using the old shapely implementation (needs shapely)",
+    )
+    args = parser.parse_args()
+
+    if args.regenerate:
+        make_fixture(args.fixture)
+    if not check_fixture(args.fixture):
+        sys.exit(1)
@@ -4,12 +4,16 @@ import pathlib
 import re
 import sqlite3
 import time
+from typing import Optional
 
 import geopandas as gpd
 import numpy as np
 import pandas as pd
 from bedmap_labels import available_campaigns
-from radar_index_utils import count_skip_lines
+from radar_index_utils import grid_cell_keys
+from radar_wrangler_utils.gpkg_utils import list_geometry_tables, merged_layer_name
+from radar_wrangler_utils.ingest_utils import read_commented_csv
+from radar_wrangler_utils.inventory_utils import Inventory, find_files, list_directory
 from shapely.geometry import LineString, MultiPoint
 
 
@@ -17,25 +21,22 @@ def load_xy(filepath):
     """
     Extract xy coords from CSV file with ps71_easting and ps71_northing fields.
     """
-    skip_lines = count_skip_lines(filepath)
-    data = pd.read_csv(filepath, skiprows=skip_lines)
-
-    x_index = [col for col in data.columns if "ps71_easting" in col][0]
-    y_index = [col for col in data.columns if "ps71_northing" in col][0]
-    xx = data[x_index]
-    yy = data[y_index]
-    good_idxs = [
-        idx
-        for idx, x, y in zip(np.arange(len(xx)), xx, yy)
-        if not (np.isnan(x) or np.isnan(y))
-    ]
-    xx = xx[good_idxs]
-    yy = yy[good_idxs]
-    return xx, yy
+    _, data = read_commented_csv(filepath, ["ps71_easting", "ps71_northing"])
+    xx = data["ps71_easting"]
+    yy = data["ps71_northing"]
+    good_idxs = ~(np.isnan(xx) | np.isnan(yy))
+    return xx[good_idxs], yy[good_idxs]
 
 
 def add_campaign_directory_gpkg(
-    gpkg_filepath, campaign_dir, layer_name, region, campaign, institution, availability
+    gpkg_filepath,
+    campaign_dir,
+    layer_name,
+    region,
+    campaign,
+    institution,
+    availability,
+    inventory=None,
 ):
     """
     QGIS can't handle having a separate layer for each flight or segment,
@@ -60,10 +61,10 @@ def add_campaign_directory_gpkg(
     granules = []
     segments = []
     t0 = time.time()
-    # TODO: This is another place that running on my new Mac Air
-    # cause problems thanks to ._ files added to the directory structure
-    for csv_filepath in [pp for pp in pathlib.Path(campaign_dir).rglob("*.csv") if not pp.stem.startswith(".")]:
-        relative_path = pathlib.Path(csv_filepath).relative_to(campaign_dir)
+    # NB: find_files skips the ._ files that my new Mac Air
+    # adds to the directory structure.
+    for csv_filepath in find_files(campaign_dir, (".csv",), inventory):
+        relative_path = pathlib.Path(os.path.relpath(csv_filepath, campaign_dir))
         granule = None
         if institution == "AWI":
             filename = relative_path.stem
@@ -144,8 +145,7 @@ def add_campaign_directory_gpkg(
         if len(xx) < 2:
             print(f"Cannot create feature from {csv_filepath}; too few points")
         else:
-            coords = np.array([[x1, y1] for x1, y1 in zip(xx, yy)])
-            points = LineString(coords)
+            points = LineString(np.column_stack([xx, yy]))
             geometry_names.append(geometry_name)
             granules.append(granule)
             segments.append(segment)
@@ -214,6 +214,33 @@ def add_campaign_directory_gpkg(
     )
 
 
+def tile_points(coords, tile_size=None, max_points=None):
+    """
+    Split an (N, 2) array of points into chunks covering tile_size x tile_size
+    grid cells, with no more than max_points per chunk.
+
+    Writing each chunk as its own feature gives every feature a small
+    bounding box, so the GeoPackage's R-tree can cull most of a campaign
+    when rendering a small area. Points keep their input order within a chunk.
+    With neither option set, all points are returned as a single chunk.
+    """
+    if tile_size is None or len(coords) == 0:
+        tiles = [coords]
+    else:
+        tile_keys = grid_cell_keys(coords[:, 0], coords[:, 1], tile_size)
+        order = np.argsort(tile_keys, kind="stable")
+        breaks = np.flatnonzero(np.diff(tile_keys[order])) + 1
+        tiles = [coords[idxs] for idxs in np.split(order, breaks)]
+
+    if max_points is None:
+        return tiles
+    return [
+        tile[start : start + max_points]
+        for tile in tiles
+        for start in range(0, len(tile), max_points)
+    ]
+
+
 # QUESTION: Should I be passing around pathlib.Path objects, rather than strings?
 def add_csv_gpkg(
     gpkg_filepath: str,
@@ -226,6 +253,8 @@ def add_csv_gpkg(
     institution: str,
     uri: str,
     availability: str,
+    tile_size: Optional[float] = None,
+    max_points: Optional[int] = None,
 ):
     """ "
     Add data in the CSV to the Geopackage, and create a QGIS layer with
@@ -242,14 +271,16 @@ def add_csv_gpkg(
     * layer_name: needs to be unique
     * gpkg_filepath: GeoPackage
     * availability: 's'upported, 'a'vailable (but not supported), 'u'navailable
+    * tile_size, max_points: split the points into multiple MultiPoint
+      features (with identical attributes); see tile_points
     """
     # Add a layer with these features to the GeoPackage
     xx, yy = load_xy(csv_filepath)
-    coords = np.array([[x1, y1] for x1, y1 in zip(xx, yy)])
+    coords = np.column_stack([xx, yy])
 
     # points = LineString(coords)
-    points = MultiPoint(coords)
-    geometries = [points]
+    geometries = [MultiPoint(tile) for tile in tile_points(coords, tile_size, max_points)]
+    print(f"{layer_name}: {len(coords)} points in {len(geometries)} features")
     gdf = gpd.GeoDataFrame(geometries, columns=["geometry"])
     gdf["name"] = layer_name
     gdf["uri"] = uri
@@ -272,16 +303,18 @@ def add_csv_gpkg(
     gdf.to_file(gpkg_filepath, driver="GPKG", layer=layer_name)
 
 
-def add_bedmap_layers(data_dir, gpkg_filepath):
+def add_bedmap_layers(
+    data_dir, gpkg_filepath, tile_size=None, max_points=None, inventory=None
+):
     bedmap_dir = os.path.join(data_dir, "ANTARCTIC", "BEDMAP")
 
-    institutions = [dd for dd in os.listdir(bedmap_dir) if not dd.startswith('.')]
-    institutions.sort()
+    institutions, _ = list_directory(bedmap_dir, inventory)
 
     for institution in institutions:
         institution_dir = os.path.join(bedmap_dir, institution)
         print(f"Adding Bedmap layers for institution {institution}; dir = {institution_dir}")
-        filenames = [ff for ff in os.listdir(institution_dir) if ff.endswith("csv") and not ff.startswith('.')]
+        _, filenames = list_directory(institution_dir, inventory)
+        filenames = [ff for ff in filenames if ff.endswith("csv")]
 
         # TODO: This sorts by *year*, rather than by campaign name
         filenames.sort()  # QUESTION: Why doesn't this seem to be working?
@@ -316,18 +349,17 @@ def add_bedmap_layers(data_dir, gpkg_filepath):
                 institution,
                 uri,
                 availability,
+                tile_size,
+                max_points,
             )
 
 
-def add_radargram_layers(region, institution, data_dir, gpkg_filepath):
+def add_radargram_layers(region, institution, data_dir, gpkg_filepath, inventory=None):
     data_dir = os.path.join(data_dir, region, institution)
-    if not os.path.isdir(data_dir):
+    campaigns, _ = list_directory(data_dir, inventory)
+    if len(campaigns) == 0:
         print(f"No {region} data from {institution}. dir={data_dir}")
         return
-    campaigns = [
-        dd for dd in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, dd))
-    ]
-    campaigns.sort()
     for campaign in campaigns:
         print("Processing {} radargram tracks".format(campaign))
         availability = "a"
@@ -340,18 +372,18 @@ def add_radargram_layers(region, institution, data_dir, gpkg_filepath):
             campaign,
             institution,
             availability,
+            inventory,
         )
 
 
-def add_icethk_layers(region, institution, data_dir, gpkg_filepath, availability="u"):
+def add_icethk_layers(
+    region, institution, data_dir, gpkg_filepath, availability="u", inventory=None
+):
     data_dir = os.path.join(data_dir, region, institution)
-    if not os.path.isdir(data_dir):
+    campaigns, _ = list_directory(data_dir, inventory)
+    if len(campaigns) == 0:
         print("No {} icethk data from {}".format(region, institution))
         return
-    campaigns = [
-        dd for dd in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, dd))
-    ]
-    campaigns.sort()
     for campaign in campaigns:
         print("Processing {} ice thicknesses".format(campaign))
         availability = availability
@@ -364,10 +396,11 @@ def add_icethk_layers(region, institution, data_dir, gpkg_filepath, availability
             campaign,
             institution,
             availability,
+            inventory,
         )
 
 
-def add_spri_layers(index_dir, gpkg_filepath):
+def add_spri_layers(index_dir, gpkg_filepath, inventory=None):
     institution = "STANFORD"
     campaign = "SPRI_NSF_TUD"
     spri_dir = os.path.join(index_dir, "ANTARCTIC", institution, campaign)
@@ -378,7 +411,49 @@ def add_spri_layers(index_dir, gpkg_filepath):
     #   not yet in a format that I can support.
     availability = "a"  # Available
     add_campaign_directory_gpkg(
-        gpkg_filepath, spri_dir, layer_name, region, campaign, institution, availability
+        gpkg_filepath,
+        spri_dir,
+        layer_name,
+        region,
+        campaign,
+        institution,
+        availability,
+        inventory,
+    )
+
+
+def add_merged_layer(gpkg_filepath):
+    """
+    Copy every campaign's features into a single table, so the index can
+    be loaded as one OGR datasource (with a rule-based renderer) rather than
+    one QGIS layer per campaign.
+
+    The per-campaign tables are left in place; they're still used for
+    metadata and by the per-campaign QLR layout.
+    """
+    with sqlite3.connect(gpkg_filepath) as connection:
+        campaign_tables = [row[0] for row in list_geometry_tables(connection)]
+    campaign_tables.sort()
+
+    t0 = time.time()
+    gdfs = []
+    for table_name in campaign_tables:
+        gdf = gpd.read_file(gpkg_filepath, layer=table_name)
+        if "relative_path" not in gdf.columns:
+            # BEDMAP layers don't point to any radargrams
+            gdf["relative_path"] = ""
+        gdfs.append(gdf)
+    if len(gdfs) == 0:
+        print(f"No campaign tables in {gpkg_filepath}; not creating {merged_layer_name}")
+        return
+    merged = gpd.GeoDataFrame(pd.concat(gdfs, ignore_index=True), crs=gdfs[0].crs)
+    t1 = time.time()
+    merged.to_file(gpkg_filepath, driver="GPKG", layer=merged_layer_name)
+    t2 = time.time()
+    print(
+        "{:0.4f} s loading {} campaigns; {:0.4f} s writing {} features to {}".format(
+            t1 - t0, len(campaign_tables), t2 - t1, len(merged), merged_layer_name
+        )
     )
 
 
@@ -402,7 +477,30 @@ if __name__ == "__main__":
         "arctic_index",
         help="Geopackage database to update with geometry for Arctic radar lines",
     )
+    parser.add_argument(
+        "--merged",
+        action="store_true",
+        help=f"Also combine all campaigns into the single '{merged_layer_name}' table",
+    )
+    parser.add_argument(
+        "--bedmap-tile-size",
+        type=float,
+        default=100_000,
+        help="Split each BEDMAP campaign into features covering grid cells of this size (meters)",
+    )
+    parser.add_argument(
+        "--bedmap-max-points",
+        type=int,
+        default=5000,
+        help="Maximum number of points in a single BEDMAP feature",
+    )
+    parser.add_argument(
+        "--inventory",
+        help="Catalog written by scan_inventory.py for the index directories; "
+        "if given, it is used instead of walking them",
+    )
     args = parser.parse_args()
+    inventory = None if args.inventory is None else Inventory(args.inventory)
 
     for region in ["ANTARCTIC", "ARCTIC"]:
         if region == "ARCTIC":
@@ -413,22 +511,35 @@ if __name__ == "__main__":
         # Add the vostok lines ... these are available, but I don't
         # yet support them, so am treating them like icethk lines
         if region == "ANTARCTIC":
-            add_icethk_layers("ANTARCTIC", "UTIG", args.icethk_index_directory, gpkg_file, "a")
+            add_icethk_layers(
+                "ANTARCTIC", "UTIG", args.icethk_index_directory, gpkg_file, "a", inventory
+            )
 
         if region == "ARCTIC":
             # TODO: Add Bedmachine coverage data?
             pass
         else:
-            add_bedmap_layers(args.radargram_index_directory, gpkg_file)
+            add_bedmap_layers(
+                args.radargram_index_directory,
+                gpkg_file,
+                args.bedmap_tile_size,
+                args.bedmap_max_points,
+                inventory,
+            )
 
         for provider in ["AWI", "BAS", "CRESIS", "KOPRI", "LDEO", "UTIG"]:
             add_radargram_layers(
-                region, provider, args.radargram_index_directory, gpkg_file
+                region, provider, args.radargram_index_directory, gpkg_file, inventory
             )
 
         # TODO: For arctic, this may need to include UTIG
         for provider in ["BAS"]:
-            add_icethk_layers(region, provider, args.icethk_index_directory, gpkg_file, "u")
+            add_icethk_layers(
+                region, provider, args.icethk_index_directory, gpkg_file, "u", inventory
+            )
 
         if region == "ANTARCTIC":
-            add_spri_layers(args.icethk_index_directory, gpkg_file)
+            add_spri_layers(args.icethk_index_directory, gpkg_file, inventory)
+
+        if args.merged:
+            add_merged_layer(gpkg_file)
@@ -47,20 +47,23 @@ There are 3 parameters controlling the matching behavior.
 
 import matplotlib.pyplot as plt
 
-import csv
+import concurrent.futures
+import hashlib
 import json
 import numpy as np
 import os
 import pathlib
-import pandas as pd
-import pickle
 import pyproj
-import scipy.spatial  # Used for KDTree
-from shapely.geometry import (
-    LineString,
-    Point,
-)  # Used for projecting BM1 points onto survey segments
+import scipy.spatial  # Used for cKDTree
 import time
+from dataclasses import dataclass
+
+from radar_wrangler_utils.ingest_utils import (
+    read_batch,
+    read_bedmap_lonlat,
+    read_respac_seasons,
+    read_spri_lonlat,
+)
 
 duplicate_bm2_campaigns = [
     "AWI_1994_DML1_AIR_BM2",
@@ -75,13 +78,12 @@ duplicate_bm2_campaigns = [
     "UTIG_1991_CASERTZ_AIR_BM2",
 ]
 
+# Bump this when the matching logic changes, to invalidate cached results.
+cache_version = 2
+
 
-def load_bedmap_xy(filepath) -> np.ndarray:
-    data = pd.read_csv(filepath, skiprows=18)
-    lon_index = [col for col in data.columns if "longitude" in col][0]
-    lat_index = [col for col in data.columns if "latitude" in col][0]
-    lon = data[lon_index]
-    lat = data[lat_index]
+def load_bedmap_xy(filepath, cache_dir=None) -> np.ndarray:
+    lon, lat = read_bedmap_lonlat(filepath, cache_dir)
     ps71 = pyproj.Proj("epsg:3031")
     xx, yy = ps71.transform(lon, lat)
     coords = np.array([xx, yy]).transpose()
@@ -93,57 +95,27 @@ def load_respac_surveys(filepath):
     The raw data was provided in a format I haven't seen before.
     There are labeled columns, with different campaigns separated by a single line saying "Line ####"
     """
-    seasons = {}
-    season = None
-    curr_line = None
     ps71 = pyproj.Proj("epsg:3031")
-    with open(filepath, "r") as fp:
-        for line in fp:
-            if line.startswith("/"):
-                continue
-            if "Line" in line:
-                season = line.split()[1]
-                season_name = "BAS_RESPAC_{}".format(season)
-                if curr_line is not None:
-                    lon, lat = zip(*curr_line)
-                    xx, yy = ps71.transform(lon, lat)
-                    seasons[season_name] = np.array([xx, yy]).transpose()
-                curr_line = []
-            else:
-                tokens = line.split()
-                _, _, lon, lat, _, _, _, _, _, _ = tokens
-                try:
-                    curr_line.append((float(lon), float(lat)))
-                except Exception:
-                    # Some records don't have position data; just skip them.
-                    continue
+    seasons = {}
+    for season, points in read_respac_seasons(filepath).items():
+        xx, yy = ps71.transform(points[:, 0], points[:, 1])
+        seasons["BAS_RESPAC_{}".format(season)] = np.array([xx, yy]).transpose()
     return seasons
 
 
-def load_spri_xy(filepath):
-    # Without specifying the encoding, most of the files have \ufeff in the first fieldname.
-    with open(filepath, encoding="utf-8-sig") as csvfile:
-        csv_reader = csv.DictReader(csvfile)
-        coords = [
-            map(float, (elem["LAT"], elem["LON"]))
-            for elem in csv_reader
-            if len(elem["LAT"]) > 0
-        ]  # Some of the files end with lines of the form ",,,,"
-
-    lat, lon = zip(*coords)
-    ps71 = pyproj.Proj("epsg:3031")
-    xx, yy = ps71.transform(lon, lat)
-    return np.array([xx, yy]).transpose()
-
-
-def load_data(data_dir):
+def find_input_files(data_dir):
+    """
+    Returns:
+    * bm1_path: BEDMAP1 CSV
+    * campaign_paths: dict mapping BM2/BM3 campaign to its CSV
+    * respac_filepath: BAS RESPAC .xyz file
+    * spri_filepaths: sorted list of Stanford's SPRI flight CSVs
+    """
     bm1_path = os.path.join(
         data_dir, "ANTARCTIC/BEDMAP/BEDMAP1/BEDMAP1_1966-2000_AIR_BM1.csv"
     )
-    bm1 = load_bedmap_xy(bm1_path)
 
-    campaign_points = {}
-    # Start with campaigns from Bedmap2/3
+    campaign_paths = {}
     for campaign in duplicate_bm2_campaigns:
         campaign_path = os.path.join(
             data_dir, "ANTARCTIC/BEDMAP/BEDMAP2/{}.csv".format(campaign)
@@ -152,75 +124,184 @@ def load_data(data_dir):
             campaign_path = os.path.join(
                 data_dir, "ANTARCTIC/BEDMAP/BEDMAP3/{}.csv".format(campaign)
             )
-        campaign_points[campaign] = load_bedmap_xy(campaign_path)
+        campaign_paths[campaign] = campaign_path
 
     # BAS released their data from 69-88 in one big file
     respac_filepath = os.path.join(data_dir, "ANTARCTIC/BAS/BAS_RESPAC_Radar.xyz")
-    respac_campaigns = load_respac_surveys(respac_filepath)
-    campaign_points.update(respac_campaigns)
 
     # Stanford has released some of the SPRI paths as individual CSVs
     spri_path = os.path.join(
         data_dir, "ANTARCTIC/STANFORD/radarfilmstudio/antarctica_original_positioning"
     )
-    spri_filepaths = [
+    spri_filepaths = sorted(
         os.path.join(spri_path, ff)
         for ff in os.listdir(spri_path)
         if ff.endswith("csv") and not ff.startswith(".")
-    ]
-    all_spri = []
-    for filepath in spri_filepaths:
-        # flight = pathlib.Path(filepath).stem
-        spri_flight = load_spri_xy(filepath)
-        xx = spri_flight[:, 0]
-        yy = spri_flight[:, 1]
-        all_spri.extend(zip(xx, yy))
-    all_spri = np.array(all_spri)
-    campaign_points["SPRI"] = all_spri
+    )
+    return bm1_path, campaign_paths, respac_filepath, spri_filepaths
+
+
+def load_data(data_dir, cache_dir=None):
+    """
+    * cache_dir: if set, cache parsed BEDMAP coordinates here as Parquet
+    """
+    bm1_path, campaign_paths, respac_filepath, spri_filepaths = find_input_files(
+        data_dir
+    )
+    bm1 = load_bedmap_xy(bm1_path, cache_dir)
+
+    campaign_points = {}
+    # Start with campaigns from Bedmap2/3
+    for campaign, campaign_path in campaign_paths.items():
+        campaign_points[campaign] = load_bedmap_xy(campaign_path, cache_dir)
+
+    respac_campaigns = load_respac_surveys(respac_filepath)
+    campaign_points.update(respac_campaigns)
+
+    # Stanford's SPRI flights are many small files; load them all at once
+    spri = read_batch(read_spri_lonlat, spri_filepaths)
+    ps71 = pyproj.Proj("epsg:3031")
+    xx, yy = ps71.transform(spri.lon, spri.lat)
+    campaign_points["SPRI"] = np.array([xx, yy]).transpose()
 
     return bm1, campaign_points
 
 
+def file_digests(filepaths, cache_dir) -> list[str]:
+    """
+    sha256 of each file's contents. Digests are remembered in cache_dir,
+    keyed on the file's absolute path, size and modification time (as in
+    parquet_cache_filepath), so a file is only read again once it changes.
+    """
+    digests_filepath = os.path.join(cache_dir, "input_digests.json")
+    try:
+        with open(digests_filepath, "r") as fp:
+            known_digests = json.load(fp)
+    except (FileNotFoundError, json.JSONDecodeError):
+        known_digests = {}
+
+    keys = []
+    digests = {}
+    for filepath in filepaths:
+        stat = os.stat(filepath)
+        key = f"{os.path.abspath(filepath)}:{stat.st_size}:{stat.st_mtime_ns}"
+        keys.append(key)
+        if key in digests:
+            continue
+        if key in known_digests:
+            digests[key] = known_digests[key]
+            continue
+        hasher = hashlib.sha256()
+        with open(filepath, "rb") as fp:
+            for chunk in iter(lambda: fp.read(2**20), b""):
+                hasher.update(chunk)
+        digests[key] = hasher.hexdigest()
+
+    # Only the current inputs are kept, so stale entries don't accumulate
+    if digests != known_digests:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp_filepath = f"{digests_filepath}.{os.getpid()}.tmp"
+        with open(temp_filepath, "w") as fp:
+            json.dump(digests, fp, indent=1)
+        os.replace(temp_filepath, digests_filepath)
+    return [digests[key] for key in keys]
+
+
+def hash_inputs(data_dir, cache_dir, parameters=None) -> str:
+    """
+    sha256 over the contents of every input file (and the matching
+    parameters, if given), used to name cached results so that changed
+    inputs are recomputed rather than silently reused.
+    """
+    bm1_path, campaign_paths, respac_filepath, spri_filepaths = find_input_files(
+        data_dir
+    )
+    filepaths = [bm1_path, *campaign_paths.values(), respac_filepath, *spri_filepaths]
+    hasher = hashlib.sha256()
+    hasher.update("cache_version={}".format(cache_version).encode())
+    for filepath, digest in zip(filepaths, file_digests(filepaths, cache_dir)):
+        hasher.update(os.path.basename(filepath).encode())
+        hasher.update(digest.encode())
+    if parameters is not None:
+        hasher.update(json.dumps(parameters, sort_keys=True).encode())
+    return hasher.hexdigest()
+
+
+def match_campaign(bm1_points, points, max_dist):
+    """
+    Find the bedmap points within max_dist of any point in the campaign.
+
+    The query is bounded by max_dist, so points that are far from the
+    survey don't need to walk the tree to find their true nearest neighbor.
+    """
+    t0 = time.time()
+    campaign_tree = scipy.spatial.cKDTree(points)
+    t1 = time.time()
+    campaign_from_bedmap_dists, _ = campaign_tree.query(
+        bm1_points, k=1, distance_upper_bound=max_dist, workers=-1
+    )
+    t2 = time.time()
+    # Unmatched points have a distance of inf
+    (candidate_bedmap_idxs,) = np.nonzero(campaign_from_bedmap_dists < max_dist)
+    return candidate_bedmap_idxs, campaign_tree, t1 - t0, t2 - t1
+
+
 def find_campaign_matches(bm1_points, campaign_points, max_dists):
+    """
+    Returns:
+    * selected_idxs: dict mapping campaign to array of matched bedmap indices
+    * campaign_trees: dict mapping campaign to the cKDTree of its points,
+      for looking up the closest campaign point to gap indices.
+    """
     selected_idxs = {}
-    campaign_from_bedmap = {}
-
-    for campaign, points in campaign_points.items():
-        print("Processing {}".format(campaign))
-        t0 = time.time()
-        campaign_tree = scipy.spatial.KDTree(points)
-        t1 = time.time()
-        campaign_from_bedmap_dists, campaign_from_bedmap_idxs = campaign_tree.query(
-            bm1_points, k=1
-        )
-        t2 = time.time()
-        print(
-            "Found closest indices. construction dt = {}, query dt = {}".format(
-                t1 - t0, t2 - t1
-            )
-        )
+    campaign_trees = {}
 
-        (candidate_bedmap_idxs,) = np.where(
-            campaign_from_bedmap_dists < max_dists[campaign]
-        )
-        selected_idxs[campaign] = candidate_bedmap_idxs
-        campaign_from_bedmap[campaign] = dict(enumerate(campaign_from_bedmap_idxs))
+    t0 = time.time()
+    # cKDTree releases the GIL during construction and queries,
+    # so campaigns can be matched concurrently in threads.
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        futures = {
+            campaign: executor.submit(
+                match_campaign, bm1_points, points, max_dists[campaign]
+            )
+            for campaign, points in campaign_points.items()
+        }
+        for campaign, future in futures.items():
+            candidate_bedmap_idxs, campaign_tree, build_dt, query_dt = future.result()
+            print(
+                "{}: {} matches. construction dt = {:0.2f}, query dt = {:0.2f}".format(
+                    campaign, len(candidate_bedmap_idxs), build_dt, query_dt
+                )
+            )
+            selected_idxs[campaign] = candidate_bedmap_idxs
+            campaign_trees[campaign] = campaign_tree
 
-        dt = time.time() - t0
-        print("... {:0.2f} seconds".format(dt))
-    return selected_idxs, campaign_from_bedmap
+    dt = time.time() - t0
+    print("Matched {} campaigns in {:0.2f} seconds".format(len(campaign_points), dt))
+    return selected_idxs, campaign_trees
 
 
 def find_gaps(segments, max_skip):
-    gaps = np.array([])
-    for idx in np.arange(len(segments) - 1):
-        s0, s1 = segments[idx]
-        s2, s3 = segments[idx + 1]
-        assert s1 >= s0  # There are single-length "segments"
-        assert s2 > s1
-        assert s3 >= s2
-        if s2 - s1 < max_skip:
-            gaps = np.append(gaps, np.arange(s1 + 1, s2))
+    """
+    Return all indices falling between consecutive segments, for
+    gaps shorter than max_skip.
+    """
+    if len(segments) < 2:
+        return np.array([], dtype=int)
+    segments = np.asarray(segments, dtype=int)
+    assert np.all(segments[:, 1] >= segments[:, 0])  # There are single-length "segments"
+    gap_starts = segments[:-1, 1] + 1
+    gap_ends = segments[1:, 0]
+    assert np.all(gap_ends >= gap_starts)
+    short_gaps = gap_ends - gap_starts + 1 < max_skip
+    gap_starts = gap_starts[short_gaps]
+    gap_lengths = gap_ends[short_gaps] - gap_starts
+    # Expand each (start, length) run into its indices: every output
+    # position gets its gap's start, offset by its position within the gap.
+    run_offsets = np.cumsum(gap_lengths) - gap_lengths
+    gaps = np.repeat(gap_starts - run_offsets, gap_lengths) + np.arange(
+        gap_lengths.sum()
+    )
     return gaps.astype(int)
 
 
@@ -229,30 +310,75 @@ def segment_indices(idxs, max_skips, min_length):
     Split a list of indices into sequential chunks.
     * max_skips: maximum gap between indices within the same chunk
     * min_length: minimum points to create a chunk (smaller will be discarded)
+      The final chunk is always kept, and the first chunk's length
+      is counted as one more than its number of indices.
     """
-    segments = []
-    idxs.sort()
-    start_idx = idxs[0]
-    curr_idx = start_idx
-    length = 1
-    for idx in idxs:
-        if idx - curr_idx > max_skips:
-            if length > min_length:
-                segments.append((int(start_idx), int(curr_idx)))
-            start_idx = idx
-            length = 1
-        else:
-            length += 1
-        curr_idx = idx
-    segments.append((int(start_idx), int(curr_idx)))
-    return segments
+    idxs = np.sort(np.asarray(idxs))
+    if len(idxs) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(idxs) > max_skips) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [len(idxs)]))
+    lengths = ends - starts
+    lengths[0] += 1
+    keep = lengths > min_length
+    keep[-1] = True
+    start_idxs = idxs[starts[keep]].astype(int).tolist()
+    end_idxs = idxs[ends[keep] - 1].astype(int).tolist()
+    return list(zip(start_idxs, end_idxs))
+
+
+def crosstrack_distances(points, seg_start, seg_end):
+    """
+    Distance from each point to the line through the corresponding segment.
+
+    Points whose projection doesn't fall strictly within the segment get
+    a distance of inf, as do degenerate (zero-length) segments.
+    This follows the math GEOS uses for LineString.project/distance
+    on a single segment, so it makes the same decisions as doing the
+    comparison point by point with shapely.
+    """
+    dx = seg_end[:, 0] - seg_start[:, 0]
+    dy = seg_end[:, 1] - seg_start[:, 1]
+    len2 = dx * dx + dy * dy
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Fractional position of the projected point along the segment
+        rr = (
+            (points[:, 0] - seg_start[:, 0]) * dx + (points[:, 1] - seg_start[:, 1]) * dy
+        ) / len2
+        ss = (
+            (seg_start[:, 1] - points[:, 1]) * dx - (seg_start[:, 0] - points[:, 0]) * dy
+        ) / len2
+        dists = np.abs(ss) * np.sqrt(len2)
+    in_segment = (len2 > 0) & (rr > 0) & (rr < 1)
+    return np.where(in_segment, dists, np.inf)
+
+
+def closest_segment_distances(points, campaign_xy, campaign_idxs):
+    """
+    Cross-track distance from each point to the survey segments on either
+    side of its closest survey point (campaign_idxs), whichever is smaller.
+    inf if the point doesn't project onto either segment.
+    """
+    num_points = len(campaign_xy)
+    next_idxs = np.minimum(campaign_idxs + 1, num_points - 1)
+    prev_idxs = np.maximum(campaign_idxs - 1, 0)
+    next_dists = crosstrack_distances(
+        points, campaign_xy[campaign_idxs], campaign_xy[next_idxs]
+    )
+    prev_dists = crosstrack_distances(
+        points, campaign_xy[campaign_idxs], campaign_xy[prev_idxs]
+    )
+    next_dists[campaign_idxs + 1 >= num_points] = np.inf
+    prev_dists[campaign_idxs <= 0] = np.inf
+    return np.minimum(next_dists, prev_dists)
 
 
 def select_bedmap_indices(
     bm1_points,
     campaign_points,
     matched_idxs,
-    campaign_from_bedmap,
+    campaign_trees,
     max_gap_lengths,
     max_crosstrack_dists,
 ):
@@ -261,43 +387,19 @@ def select_bedmap_indices(
         segments = segment_indices(idxs.astype(int), 1, 1)
         gap_idxs = find_gaps(segments, max_gap_lengths[campaign])
 
-        sx = campaign_points[campaign][:, 0]
-        sy = campaign_points[campaign][:, 1]
-
-        good_gap_idxs = []
-        good_gap_dists = []
-        for gap_idx in gap_idxs:
-            c_idx = campaign_from_bedmap[campaign][gap_idx]
+        # Gap points are (by construction) further than max_dist from
+        # the campaign, so they need an unbounded nearest-neighbor query.
+        if len(gap_idxs) > 0:
+            _, gap_campaign_idxs = campaign_trees[campaign].query(
+                bm1_points[gap_idxs], k=1, workers=-1
+            )
+        else:
+            gap_campaign_idxs = np.array([], dtype=int)
 
-            if c_idx + 1 < len(sx):
-                seg1 = LineString(
-                    [Point(sx[c_idx], sy[c_idx]), Point(sx[c_idx + 1], sy[c_idx + 1])]
-                )
-            else:
-                seg1 = None
-            if c_idx > 0:
-                seg2 = LineString(
-                    [Point(sx[c_idx], sy[c_idx]), Point(sx[c_idx - 1], sy[c_idx - 1])]
-                )
-            else:
-                seg2 = None
-            bm1_pt = Point(bm1_points[gap_idx, 0], bm1_points[gap_idx, 1])
-            in_bounds = False
-            min_dist = np.inf
-            for seg in [seg1, seg2]:
-                if seg is None:
-                    continue
-                seg_len = seg.length
-                pp = seg.project(bm1_pt)  # Project bedmap point onto line segment
-                dd = seg.distance(bm1_pt)
-                min_dist = min(dd, min_dist)
-
-                if pp > 0 and pp < seg_len:
-                    if dd < max_crosstrack_dists[campaign]:
-                        in_bounds = True
-            if in_bounds:
-                good_gap_idxs.append(gap_idx)
-                good_gap_dists.append(min_dist)
+        gap_dists = closest_segment_distances(
+            bm1_points[gap_idxs], campaign_points[campaign], gap_campaign_idxs
+        )
+        good_gap_idxs = gap_idxs[gap_dists < max_crosstrack_dists[campaign]]
 
         selected_idxs[campaign] = np.append(idxs, good_gap_idxs)
         print(
@@ -358,6 +460,125 @@ def plot_selected_indices(bm1_points, campaign_points, selected_idxs):
         fig.savefig("../../figures/detangling_bedmap_{}.png".format(campaign))
 
 
+@dataclass
+class SweepResult:
+    campaign: str
+    max_dist: float
+    max_gap_length: int
+    max_crosstrack_dist: float
+    num_matched: int  # BEDMAP1 points within max_dist of a survey point
+    num_gap_accepted: int
+    num_gap_rejected: int
+
+
+# Per-campaign arrays (one value per BEDMAP1 point) that are enough to
+# evaluate any combination of matching parameters.
+sweep_arrays = ["nearest_dists", "nearest_idxs", "crosstrack_dists"]
+
+
+def compute_sweep_arrays(bm1_points, campaign_xy):
+    campaign_tree = scipy.spatial.cKDTree(campaign_xy)
+    nearest_dists, nearest_idxs = campaign_tree.query(bm1_points, k=1, workers=-1)
+    crosstrack_dists = closest_segment_distances(bm1_points, campaign_xy, nearest_idxs)
+    return {
+        "nearest_dists": nearest_dists,
+        "nearest_idxs": nearest_idxs,
+        "crosstrack_dists": crosstrack_dists,
+    }
+
+
+def load_sweep_arrays(cache_dir, inputs_key, campaign, bm1_points, campaign_xy, force):
+    """
+    Load the campaign's sweep arrays (memory-mapped) from cache_dir,
+    computing and saving them first if necessary.
+
+    inputs_key is the hash of the input files (see hash_inputs)
+    """
+    filepaths = {
+        name: os.path.join(
+            cache_dir, "{}_{}_{}.npy".format(campaign, name, inputs_key[:16])
+        )
+        for name in sweep_arrays
+    }
+    if not force and all(os.path.exists(fp) for fp in filepaths.values()):
+        return {name: np.load(fp, mmap_mode="r") for name, fp in filepaths.items()}
+
+    t0 = time.time()
+    arrays = compute_sweep_arrays(bm1_points, campaign_xy)
+    for name, fp in filepaths.items():
+        np.save(fp, arrays[name])
+    dt = time.time() - t0
+    print("{}: computed sweep arrays in {:0.2f} seconds".format(campaign, dt))
+    return {name: np.load(fp, mmap_mode="r") for name, fp in filepaths.items()}
+
+
+def sweep_campaign(
+    campaign, arrays, max_dists, max_gap_lengths, max_crosstrack_dists
+) -> list[SweepResult]:
+    """
+    Evaluate every combination of parameters for a single campaign.
+
+    This makes the same decisions as find_campaign_matches followed by
+    select_bedmap_indices, but only segments once per (max_dist,
+    max_gap_length) pair and compares all crosstrack thresholds at once.
+    """
+    results = []
+    crosstrack_thresholds = np.asarray(max_crosstrack_dists)
+    for max_dist in max_dists:
+        matched_idxs = np.flatnonzero(arrays["nearest_dists"] < max_dist)
+        segments = segment_indices(matched_idxs, 1, 1)
+        for max_gap_length in max_gap_lengths:
+            gap_idxs = find_gaps(segments, max_gap_length)
+            gap_dists = arrays["crosstrack_dists"][gap_idxs]
+            num_accepted = np.sum(
+                gap_dists[:, np.newaxis] < crosstrack_thresholds[np.newaxis, :], axis=0
+            )
+            for max_crosstrack_dist, num_gap_accepted in zip(
+                max_crosstrack_dists, num_accepted
+            ):
+                results.append(
+                    SweepResult(
+                        campaign,
+                        max_dist,
+                        max_gap_length,
+                        max_crosstrack_dist,
+                        len(matched_idxs),
+                        int(num_gap_accepted),
+                        len(gap_idxs) - int(num_gap_accepted),
+                    )
+                )
+    return results
+
+
+def print_sweep_results(results, num_bm1_points):
+    print(
+        "{:<30} {:>10} {:>8} {:>10} {:>10} {:>10} {:>10} {:>10}".format(
+            "campaign",
+            "max_dist",
+            "max_gap",
+            "max_xtrack",
+            "matched",
+            "gap_good",
+            "gap_bad",
+            "unmatched",
+        )
+    )
+    for result in results:
+        num_unmatched = num_bm1_points - result.num_matched - result.num_gap_accepted
+        print(
+            "{:<30} {:>10g} {:>8d} {:>10g} {:>10d} {:>10d} {:>10d} {:>10d}".format(
+                result.campaign,
+                result.max_dist,
+                result.max_gap_length,
+                result.max_crosstrack_dist,
+                result.num_matched,
+                result.num_gap_accepted,
+                result.num_gap_rejected,
+                num_unmatched,
+            )
+        )
+
+
 def export_segments(selected_idxs, filepath):
     all_idxs = []
     for idxs in selected_idxs.values():
@@ -366,10 +587,13 @@ def export_segments(selected_idxs, filepath):
     json.dump(segments, open(filepath, "w"))
 
 
-def main(data_directory, force):
-    bm1_points, campaign_points = load_data(data_directory)
-    # Set up configuration. These values were chosen interactively
-    # using detangle_bedmap_general.ipynb
+def default_parameters(campaign_points):
+    """
+    Per-campaign matching parameters. These values were chosen interactively
+    using detangle_bedmap_general.ipynb, and can be re-tuned with --sweep.
+
+    Returns max_dists, max_gap_lengths, max_crosstrack_dists
+    """
     # 1) Distance from bm1 point to campaign point for a match (meters)
     max_dists = dict.fromkeys(campaign_points, 1)
     max_dists["BAS_1998_Dufek_AIR_BM2"] = 100
@@ -394,32 +618,87 @@ def main(data_directory, force):
             # AWI is pretty continuous, so grab everythign in the gaps.
             max_crosstrack_dists[campaign] = 50000
     max_crosstrack_dists["NIPR_1992_JARE33_GRN_BM3"] = 500
+    return max_dists, max_gap_lengths, max_crosstrack_dists
+
+
+def sweep(
+    data_directory, cache_dir, force, max_dists, max_gap_lengths, max_crosstrack_dists
+):
+    """
+    Report how many BEDMAP1 points each campaign would claim for every
+    combination of the given parameter values.
+
+    For any grid that isn't specified, each campaign's default value is used.
+    """
+    bm1_points, campaign_points = load_data(data_directory, cache_dir)
+    defaults = default_parameters(campaign_points)
+    inputs_key = hash_inputs(data_directory, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    t0 = time.time()
+    results = []
+    for campaign, campaign_xy in campaign_points.items():
+        arrays = load_sweep_arrays(
+            cache_dir, inputs_key, campaign, bm1_points, campaign_xy, force
+        )
+        campaign_grids = [
+            grid if grid is not None else [default[campaign]]
+            for grid, default in zip(
+                [max_dists, max_gap_lengths, max_crosstrack_dists], defaults
+            )
+        ]
+        results.extend(sweep_campaign(campaign, arrays, *campaign_grids))
+    dt = time.time() - t0
+    print("{:0.2f} secs to evaluate {} parameter combinations".format(dt, len(results)))
+    print_sweep_results(results, len(bm1_points))
+
+
+def load_selected_idxs(filepath):
+    with np.load(filepath) as data:
+        return {campaign: data[campaign] for campaign in data.files}
+
+
+def main(data_directory, force, cache_dir):
+    bm1_points, campaign_points = load_data(data_directory, cache_dir)
+    max_dists, max_gap_lengths, max_crosstrack_dists = default_parameters(
+        campaign_points
+    )
 
     ########
     # Find / plot /export the matched segments
     ######
     t0 = time.time()
-    try:
-        if force:
-            raise Exception("Recreating match.")
-        selected_idxs = pickle.load(open("selected_idxs.pkl", "rb"))
-    except Exception as ex:
-        print(ex)
-        print("Could not load selected_idxs; generating")
-        # Do both steps here because campaign_from_bedmap is large enough
-        # that pickling takes longer than recreating it.
-        matched_idxs, campaign_from_bedmap = find_campaign_matches(
+    parameters = {
+        "max_dists": max_dists,
+        "max_gap_lengths": max_gap_lengths,
+        "max_crosstrack_dists": max_crosstrack_dists,
+    }
+    inputs_key = hash_inputs(data_directory, cache_dir, parameters)
+    selected_idxs_filepath = os.path.join(
+        cache_dir, "selected_idxs_{}.npz".format(inputs_key[:16])
+    )
+    if not force and os.path.exists(selected_idxs_filepath):
+        print("Loading cached matches from {}".format(selected_idxs_filepath))
+        selected_idxs = load_selected_idxs(selected_idxs_filepath)
+    else:
+        # Do both steps here because the campaign trees are large enough
+        # that caching them takes longer than recreating them.
+        matched_idxs, campaign_trees = find_campaign_matches(
             bm1_points, campaign_points, max_dists
         )
         selected_idxs = select_bedmap_indices(
             bm1_points,
             campaign_points,
             matched_idxs,
-            campaign_from_bedmap,
+            campaign_trees,
             max_gap_lengths,
             max_crosstrack_dists,
         )
-        pickle.dump(selected_idxs, open("selected_idxs.pkl", "wb"))
+        os.makedirs(cache_dir, exist_ok=True)
+        np.savez_compressed(
+            selected_idxs_filepath,
+            **{campaign: idxs.astype(int) for campaign, idxs in selected_idxs.items()},
+        )
     t1 = time.time()
     print("{:02f} secs to load/create index matches".format(t1 - t0))
 
@@ -439,6 +718,45 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument("data_directory", help="Root directory for all data")
-    parser.add_argument("--force", action="store_true")
+    parser.add_argument(
+        "--force", action="store_true", help="Recompute, ignoring any cached results"
+    )
+    parser.add_argument(
+        "--sweep",
+        action="store_true",
+        help="Report match counts over a grid of parameters, rather than exporting segments",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory for cached intermediate arrays. "
+        "Defaults to {data_directory}/targ/ANTARCTIC/detangle_cache",
+    )
+    parser.add_argument(
+        "--max-dists", type=float, nargs="+", help="Grid of max_dist values (meters)"
+    )
+    parser.add_argument(
+        "--max-gap-lengths", type=int, nargs="+", help="Grid of max_gap_length values"
+    )
+    parser.add_argument(
+        "--max-crosstrack-dists",
+        type=float,
+        nargs="+",
+        help="Grid of max_crosstrack_dist values (meters)",
+    )
     args = parser.parse_args()
-    main(args.data_directory, args.force)
+    cache_dir = args.cache_dir
+    if cache_dir is None:
+        cache_dir = os.path.join(
+            args.data_directory, "targ", "ANTARCTIC", "detangle_cache"
+        )
+    if args.sweep:
+        sweep(
+            args.data_directory,
+            cache_dir,
+            args.force,
+            args.max_dists,
+            args.max_gap_lengths,
+            args.max_crosstrack_dists,
+        )
+    else:
+        main(args.data_directory, args.force, cache_dir)
@@ -9,9 +9,14 @@ which was copy-pasted from their accompanying README files.
 import pathlib  # for creating directory data will be saved to
 import subprocess
 
-import requests  # For downloading index page
 from bs4 import BeautifulSoup  # For parsing html and extracting the links
 
+from radar_wrangler_utils.http_utils import (  # For downloading index page
+    HTTPCache,
+    add_http_cache_arguments,
+    http_cache_from_args,
+)
+
 # TODO: This should probably be moved into data/AWI, mirroring the BAS indices
 datasets = {
     "ANTARCTIC": (
@@ -27,14 +32,14 @@ datasets = {
 }
 
 
-def list_awi_data(dataset_id):
+def list_awi_data(dataset_id, http_cache: HTTPCache):
     dataset_link = (
         "https://doi.pangaea.de/10.1594/PANGAEA.{}?format=html#download".format(
             dataset_id
         )
     )
     print("Scraping: {}".format(dataset_link))
-    reqs = requests.get(dataset_link)
+    reqs = http_cache.get(dataset_link)
     soup = BeautifulSoup(reqs.text, "html.parser")
 
     # Two places the data could be ...
@@ -50,7 +55,7 @@ def list_awi_data(dataset_id):
     return all_urls
 
 
-def download_awi():
+def download_awi(http_cache: HTTPCache):
     for pole, dataset_ids in datasets.items():
         print(pole)
         for dataset_id in dataset_ids:
@@ -65,7 +70,7 @@ def download_awi():
 
             # if dataset_id in [907146, 942989, 928569, 949391, 914258]:
             #    continue
-            data_urls = list_awi_data(dataset_id)
+            data_urls = list_awi_data(dataset_id, http_cache)
             print("\n".join(data_urls))
 
             # `wget --content-on-error` is required; for some reason, plain wget gives error code 500.
@@ -89,4 +94,10 @@ def download_awi():
 
 
 if __name__ == "__main__":
-    download_awi()
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    add_http_cache_arguments(parser)
+    args = parser.parse_args()
+
+    download_awi(http_cache_from_args(args))
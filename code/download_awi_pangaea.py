@@ -11,8 +11,11 @@ import os.path
 import pathlib
 import re
 import sqlite3
-import subprocess
-import tempfile
+from typing import Optional
+
+from radar_wrangler_utils.fetch_utils import Fetcher
+from radar_wrangler_utils.gpkg_utils import upsert_granule
+from radar_wrangler_utils.inventory_utils import Inventory, local_filesize
 
 # mapping from campaign to dataset
 datasets = {}
@@ -20,7 +23,12 @@ datasets["JuRaS_2018"] = 962670
 datasets["CHIRP_2019"] = 963264
 
 
-def download_awi(root_dir: str, antarctic_index: str, campaign: str) -> None:
+def download_awi(
+    root_dir: str,
+    antarctic_index: str,
+    campaign: str,
+    inventory: Optional[Inventory] = None,
+) -> None:
     dataset = datasets[campaign]
     root_url = f"https://download.pangaea.de/dataset/{dataset}/files/"
 
@@ -37,6 +45,7 @@ def download_awi(root_dir: str, antarctic_index: str, campaign: str) -> None:
     #   (That would match how UTIG/CReSIS organize their granules.)
     dest_dir = os.path.join(root_dir, region, institution, campaign)
 
+    fetcher = Fetcher()
     expr = "Data_(?P<flight>[0-9]{8}_[0-9]{2})_(?P<granule>[0-9]{3})_standard.nc"
 
     try:
@@ -61,25 +70,22 @@ def download_awi(root_dir: str, antarctic_index: str, campaign: str) -> None:
         relative_filepath = os.path.join(region, institution, campaign, filename)
         url = f"{root_url}{filename}"
 
-        if os.path.exists(dest_filepath):
-            filesize = os.path.getsize(dest_filepath)
+        filesize = local_filesize(dest_filepath, inventory)
+        if filesize is not None:
             print(f"Skipping {dest_filepath}: file already exists with size {filesize}")
         else:
             print(f"Downloading {filename} to {dest_filepath}")
-            try:
-                with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                    curl_cmd = ["curl", url, "--output", temp_file.name]
-                    print(f"downloading to {temp_file.name}")
-                    subprocess.check_call(curl_cmd)
-                    # TODO: for plugin download, replace this with
-                    #       `shutil.move` for cross-platform compatibility
-                    move_cmd = ["mv", temp_file.name, dest_filepath]
-                    subprocess.check_call(move_cmd)
-                    filesize = os.path.getsize(dest_filepath)
-            except subprocess.CalledProcessError as ex:
-                print(f"Failed to download {dataset}, {filename}: {ex}")
+            result = fetcher.fetch(url, dest_filepath)
+            if result.ok:
+                print(result.summary())
+                filesize = result.num_bytes
+                if inventory is not None:
+                    inventory.record(dest_filepath, result.sha256)
+            else:
+                print(f"Failed to download {dataset}, {filename}: {result.error}")
+                filesize = -1
         cursor.execute(
-            "INSERT OR REPLACE INTO granules VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            upsert_granule,
             [
                 str(granule_name),
                 institution,
@@ -113,8 +119,14 @@ if __name__ == "__main__":
     #     "arctic_index",
     #     help="Geopackage database to update with metadata about Arctic campaigns and granules",
     # )
+    parser.add_argument(
+        "--inventory",
+        help="Catalog written by scan_inventory.py; if given, it is used to "
+        "check for already-downloaded files, and updated with new ones",
+    )
     args = parser.parse_args()
+    inventory = None if args.inventory is None else Inventory(args.inventory)
 
     for campaign, dataset in datasets.items():
         print(f"Downloading dataset {dataset}")
-        download_awi(args.data_directory, args.antarctic_index, campaign)
+        download_awi(args.data_directory, args.antarctic_index, campaign, inventory)
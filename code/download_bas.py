@@ -6,17 +6,26 @@ import os.path
 import pathlib
 import re
 import sqlite3
-import subprocess
-import tempfile
+from typing import Optional
 
+from radar_wrangler_utils.fetch_utils import Fetcher
+from radar_wrangler_utils.gpkg_utils import upsert_granule
+from radar_wrangler_utils.inventory_utils import Inventory, local_filesize
 
-def download_all_bas(qiceradar_dir: str, antarctic_index: str, arctic_index: str):
+
+def download_all_bas(
+    qiceradar_dir: str,
+    antarctic_index: str,
+    arctic_index: str,
+    inventory: Optional[Inventory] = None,
+):
     """
     Ensures that all BAS data has been downloaded to the specified root
     directory, and updates the input index database with url and path info.
     """
     institution = "BAS"
     index_dir = "../../data/BAS"
+    fetcher = Fetcher()
 
     campaign_indices = {
         ff.split(".")[0]: f"{index_dir}/{ff}"
@@ -104,43 +113,27 @@ def download_all_bas(qiceradar_dir: str, antarctic_index: str, arctic_index: str
                 else:
                     data_format = "bas_netcdf"
                 download_method = "wget"
-                filesize = -1
-                if os.path.exists(dest_filepath):
-                    filesize = os.path.getsize(dest_filepath)
+                filesize = local_filesize(dest_filepath, inventory)
+                if filesize is not None:
                     print(
                         "Skipping {}: file already exists with size {}".format(
                             flight["name"], filesize
                         )
                     )
                 else:
-                    try:
-                        # Create a temporary file to avoid having to clean up partial downloads.
-                        # This may not be ideal if the temporary file is created in a different filesystem than the
-                        # output file belongs in. (I expect to eventually be downloading data to an external drive/NAS)
-                        # TODO: create the temporary file in the same directory? or in the RadarData directory?
-                        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                            # wget_cmd = ["wget", "--no-clobber", "--quiet", "--output-document", dest_filepath, flight['url']]
-                            # If saving to a temp file, get rid of --no-clobber, since the file will already have been created.
-                            wget_cmd = [
-                                "wget",
-                                "--quiet",
-                                "--output-document",
-                                temp_file.name,
-                                "{}".format(flight["url"]),
-                            ]
-
-                            subprocess.check_call(wget_cmd)
-                            # TODO: for plugin download, replace this with
-                            #       `shutil.move` for cross-platform compatibility
-                            move_cmd = ["mv", temp_file.name, dest_filepath]
-                            subprocess.check_call(move_cmd)
-                            print("Got {}!".format(flight["name"]))
-                            filesize = os.path.getsize(dest_filepath)
-
-                    except subprocess.CalledProcessError as ex:
-                        print("Failed to download {}: {}".format(flight["name"], ex))
+                    # Downloads to a temporary file in dest_dir, so partial
+                    # downloads never end up under the final name.
+                    result = fetcher.fetch(flight["url"], dest_filepath)
+                    if result.ok:
+                        print("Got {}! {}".format(flight["name"], result.summary()))
+                        filesize = result.num_bytes
+                        if inventory is not None:
+                            inventory.record(dest_filepath, result.sha256)
+                    else:
+                        print("Failed to download {}: {}".format(flight["name"], result.error))
+                        filesize = -1
                 cursor.execute(
-                    "INSERT OR REPLACE INTO granules VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    upsert_granule,
                     [
                         str(granule_name),
                         institution,
@@ -174,5 +167,13 @@ if __name__ == "__main__":
         "arctic_index",
         help="Geopackage database to update with metadata about Arctic campaigns and granules",
     )
+    parser.add_argument(
+        "--inventory",
+        help="Catalog written by scan_inventory.py; if given, it is used to "
+        "check for already-downloaded files, and updated with new ones",
+    )
     args = parser.parse_args()
-    download_all_bas(args.data_directory, args.antarctic_index, args.arctic_index)
+    inventory = None if args.inventory is None else Inventory(args.inventory)
+    download_all_bas(
+        args.data_directory, args.antarctic_index, args.arctic_index, inventory
+    )
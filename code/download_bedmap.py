@@ -5,50 +5,38 @@ from bs4 import BeautifulSoup
 import os
 import os.path
 import pathlib
-import requests
-import subprocess
-import tempfile
 
+from radar_wrangler_utils.fetch_utils import Fetcher
+from radar_wrangler_utils.http_utils import add_http_cache_arguments, http_cache_from_args
+from radar_wrangler_utils.inventory_utils import Inventory, local_filesize
 
-def download_file(filename, url, dest_dir):
+
+def download_file(filename, url, dest_dir, fetcher, inventory=None):
     """
     Download the file at input url and put it in dest_dir as filename.
     * Skips download if file with same name already exists
-    * Initially downloads to a temporary file to avoid corrupting the
-      data directory with partially-downloaded files.
+      (according to the inventory, if one is given)
+    * Initially downloads to a temporary file (in dest_dir) to avoid
+      corrupting the data directory with partially-downloaded files.
     """
     dest_filepath = os.path.join(dest_dir, filename)
 
-    if os.path.exists(dest_filepath):
+    filesize = local_filesize(dest_filepath, inventory)
+    if filesize is not None:
         print(
-            "Skipping {}: file already exists with size {}".format(
-                filename, os.path.getsize(dest_filepath)
-            )
+            "Skipping {}: file already exists with size {}".format(filename, filesize)
         )
     else:
-        try:
-            # Create a temporary file to avoid having to clean up partial downloads.
-            # This may not be ideal if the temporary file is created in a different filesystem than the
-            # output file belongs in. (I expect to eventually be downloading data to an external drive/NAS)
-            with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                # wget_cmd = ["wget", "--no-clobber", "--quiet", "--output-document", dest_filepath, flight['url']]
-                # If saving to a temp file, get rid of --no-clobber, since the file will already have been created.
-                wget_cmd = [
-                    "wget",
-                    "--quiet",
-                    "--output-document",
-                    temp_file.name,
-                    "{}".format(url),
-                ]
-                subprocess.check_call(wget_cmd)
-                move_cmd = ["mv", temp_file.name, dest_filepath]
-                subprocess.check_call(move_cmd)
-                print("Got {}!".format(filename))
-        except subprocess.CalledProcessError as ex:
-            print("Failed to download BEDMAP: {}".format(ex))
-
-
-def download_rammada(doi, dest_dir):
+        result = fetcher.fetch(url, dest_filepath)
+        if result.ok:
+            print("Got {}! {}".format(filename, result.summary()))
+            if inventory is not None:
+                inventory.record(dest_filepath, result.sha256)
+        else:
+            print("Failed to download BEDMAP: {}".format(result.summary()))
+
+
+def download_rammada(doi, dest_dir, http_cache, fetcher, inventory=None):
     """
     Find and download all links formatted like data entries on a given rammada page.
     """
@@ -62,7 +50,7 @@ def download_rammada(doi, dest_dir):
         "https://ramadda.data.bas.ac.uk/repository/entry/show?entryid="
         + doi.split("/")[-1]
     )
-    reqs = requests.get(data_link)
+    reqs = http_cache.get(data_link)
     soup = BeautifulSoup(reqs.text, "html.parser")
 
     base_url = "https://ramadda.data.bas.ac.uk"
@@ -73,22 +61,23 @@ def download_rammada(doi, dest_dir):
     filenames = [url.strip(base_url + prefix).split("?")[0] for url in download_urls]
 
     for ff, uu in zip(filenames, download_urls):
-        download_file(ff, uu, dest_dir)
+        download_file(ff, uu, dest_dir, fetcher, inventory)
 
 
-def download_all_bedmap(bedmap_data_dir):
+def download_all_bedmap(bedmap_data_dir, http_cache, inventory=None):
+    fetcher = Fetcher()
     bedmap1_doi = "https://doi.org/10.5285/f64815ec-4077-4432-9f55-0ce230f46029"
     bedmap2_doi = "https://doi.org/10.5285/2fd95199-365e-4da1-ae26-3b6d48b3e6ac"
     bedmap3_doi = "https://doi.org/10.5285/91523ff9-d621-46b3-87f7-ffb6efcd1847"
 
     bedmap1_dest_dir = os.path.join(bedmap_data_dir, "BEDMAP1")
-    download_rammada(bedmap1_doi, bedmap1_dest_dir)
+    download_rammada(bedmap1_doi, bedmap1_dest_dir, http_cache, fetcher, inventory)
 
     bedmap2_dest_dir = os.path.join(bedmap_data_dir, "BEDMAP2")
-    download_rammada(bedmap2_doi, bedmap2_dest_dir)
+    download_rammada(bedmap2_doi, bedmap2_dest_dir, http_cache, fetcher, inventory)
 
     bedmap3_dest_dir = os.path.join(bedmap_data_dir, "BEDMAP3")
-    download_rammada(bedmap3_doi, bedmap3_dest_dir)
+    download_rammada(bedmap3_doi, bedmap3_dest_dir, http_cache, fetcher, inventory)
 
 
 if __name__ == "__main__":
@@ -96,6 +85,13 @@ if __name__ == "__main__":
     parser.add_argument(
         "data_directory", help="Root directory for all QIceRadar-managed radargrams."
     )
+    parser.add_argument(
+        "--inventory",
+        help="Catalog written by scan_inventory.py; if given, it is used to "
+        "check for already-downloaded files, and updated with new ones",
+    )
+    add_http_cache_arguments(parser)
     args = parser.parse_args()
+    inventory = None if args.inventory is None else Inventory(args.inventory)
     bedmap_data_dir = os.path.join(args.data_directory, "ANTARCTIC", "BEDMAP")
-    download_all_bedmap(bedmap_data_dir)
+    download_all_bedmap(bedmap_data_dir, http_cache_from_args(args), inventory)
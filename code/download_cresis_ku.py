@@ -8,58 +8,134 @@ have good metadata for who actually owns the data.
 """
 
 
-import pathlib
-import subprocess
-import tempfile
-
-from radar_wrangler_utils import Granule, read_granule_list
-
-
-def download_cresis(data_dir: str, granules: list[Granule]):
+import os
+import socket
+import time
+from typing import Iterable, Optional
+
+from radar_wrangler_utils import Granule, iter_granules
+from radar_wrangler_utils.fetch_utils import Fetcher
+from radar_wrangler_utils.index_utils import granule_fields
+from radar_wrangler_utils.inventory_utils import Inventory, local_filesize
+from radar_wrangler_utils.queue_utils import JobQueue
+
+
+def download_granule(
+    data_dir: str,
+    granule: Granule,
+    fetcher: Fetcher,
+    inventory: Optional[Inventory] = None,
+    replace_existing: bool = False,
+) -> Optional[str]:
     """
-    Download all CReSIS data from the KU servers.
+    Download a single granule, unless it already exists (or replace_existing).
+    Returns None if the file exists afterwards, otherwise why not.
     """
+    dest_filepath = os.path.join(data_dir, granule.relative_filepath)
 
-    for granule in granules:
-        dest_filepath = pathlib.Path(data_dir, granule.relative_filepath)
-        try:
-            pp = dest_filepath.parent
-            pp.mkdir(parents=True, exist_ok=True)
-        except FileExistsError:
-            raise Exception("Could not create {}.".format(pp))
-            continue
-
-        if not dest_filepath.is_file():
-            with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                wget_cmd = [
-                    "wget",
-                    "--quiet",
-                    "--output-document",
-                    temp_file.name,
-                    granule.download_url,
-                ]
-                print(f"{dest_filepath}: {' '.join(wget_cmd)}")
-                subprocess.check_call(wget_cmd)
-                print("subprocess returned...")
-                move_cmd = ["mv", temp_file.name, dest_filepath]
-                subprocess.check_call(move_cmd)
-                print("Got {}!".format(pathlib.Path(dest_filepath).name))
-
-        # Check if download succeeded
-        if not dest_filepath.is_file():
+    if replace_existing or local_filesize(dest_filepath, inventory) is None:
+        result = fetcher.fetch(granule.download_url, dest_filepath)
+        print(result.summary())
+        if not result.ok:
             # There are a handful of files that are listed in the CReSIS website
             # but where the actual radargram gives
             # "Forbidden: You don't have permission to access this resource".
-            # So, check that download was successful
-            print(f"Cannot find downloaded file {dest_filepath}")
+            return result.error
+        if inventory is not None:
+            inventory.record(dest_filepath, result.sha256)
+    return None
+
+
+def download_cresis(
+    data_dir: str,
+    granules: Iterable[Granule],
+    inventory: Optional[Inventory] = None,
+    replace_existing: bool = False,
+):
+    """
+    Download all CReSIS data from the KU servers.
 
+    If an inventory is given, it is used to check for existing files
+    rather than the filesystem.
 
-def main(data_dir: str) -> None:
-    index_filepath = "../data/cresis_granules.csv"
+    If replace_existing, granules that have already been downloaded are
+    downloaded again (e.g. the delta from plan_sync.py, which includes
+    files whose size has changed on the server).
+    """
+    fetcher = Fetcher()
+    for granule in granules:
+        download_granule(data_dir, granule, fetcher, inventory, replace_existing)
 
-    cresis_granules = read_granule_list(index_filepath)
 
-    download_cresis(data_dir, cresis_granules)
+def enqueue_cresis(queue: JobQueue, granules: Iterable[Granule]) -> None:
+    jobs = (
+        (granule.granule_name, {field: getattr(granule, field) for field in granule_fields})
+        for granule in granules
+    )
+    num_added = queue.enqueue(jobs)
+    print(f"Added {num_added} jobs to {queue.filepath}")
+
+
+def run_worker(
+    data_dir: str,
+    queue: JobQueue,
+    worker: str,
+    lease_seconds: float,
+    inventory: Optional[Inventory] = None,
+    replace_existing: bool = False,
+) -> None:
+    """
+    Claim and download granules from the queue until there are none left
+    to claim. Any number of workers can run at once, on different hosts,
+    so long as they share the queue and the data directory.
+    """
+    fetcher = Fetcher()
+    num_done = 0
+    num_failed = 0
+    t0 = time.time()
+    while True:
+        jobs = queue.claim(worker, lease_seconds)
+        if len(jobs) == 0:
+            break
+        for job in jobs:
+            granule = Granule(**job.payload)
+            try:
+                with queue.keep_lease(job, worker, lease_seconds):
+                    error = download_granule(
+                        data_dir, granule, fetcher, inventory, replace_existing
+                    )
+            except Exception as ex:
+                error = f"{type(ex).__name__}: {ex}"
+            if error is None:
+                recorded = queue.complete(job, worker)
+                num_done += 1
+            else:
+                print(f"Failed to download {granule.granule_name} (attempt {job.attempts}): {error}")
+                recorded = queue.fail(job, worker, error)
+                num_failed += 1
+            if not recorded:
+                print(f"Lease on {job.job_id} expired; it may have been claimed by another worker")
+
+    print(
+        "{}: {:0.2f} s; {} granules downloaded, {} failed".format(
+            worker, time.time() - t0, num_done, num_failed
+        )
+    )
+    print(f"Queue: {queue.counts()}")
+    for job_id, attempts, last_error in queue.failures(limit=20):
+        print(f"  {job_id} failed after {attempts} attempts: {last_error}")
+
+
+def main(
+    data_dir: str,
+    index_filepath: str,
+    campaigns: Optional[list[str]] = None,
+    inventory: Optional[Inventory] = None,
+    replace_existing: bool = False,
+) -> None:
+    cresis_granules = iter_granules(index_filepath, campaigns)
+
+    download_cresis(data_dir, cresis_granules, inventory, replace_existing)
 
 
 if __name__ == "__main__":
@@ -70,7 +146,86 @@ if __name__ == "__main__":
     parser.add_argument(
         "data_directory", help="Root directory for all QIceRadar-managed radargrams."
     )
+    parser.add_argument(
+        "--granule-list",
+        default="../data/cresis_granules.sqlite",
+        help="GranuleStore database (or .csv granule list) written by generate_cresis_ku_index.py",
+    )
+    parser.add_argument(
+        "--campaign",
+        action="append",
+        dest="campaigns",
+        help="Only download granules from this campaign (may be repeated)",
+    )
+    parser.add_argument(
+        "--inventory",
+        help="Catalog written by scan_inventory.py; if given, it is used to "
+        "check for already-downloaded files, and updated with new ones",
+    )
+    parser.add_argument(
+        "--replace-existing",
+        action="store_true",
+        help="Download every granule in the list, even if it already exists "
+        "(for the delta written by plan_sync.py)",
+    )
+    parser.add_argument(
+        "--queue",
+        help="Job queue database shared by workers; without --enqueue, "
+        "run as a worker, downloading granules claimed from the queue",
+    )
+    parser.add_argument(
+        "--enqueue",
+        action="store_true",
+        help="Add the granules in --granule-list to --queue, rather than downloading them",
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="With --enqueue, also give jobs that have failed another set of attempts",
+    )
+    parser.add_argument(
+        "--worker-id",
+        default=f"{socket.gethostname()}:{os.getpid()}",
+        help="Name recorded against the jobs this worker claims",
+    )
+    parser.add_argument(
+        "--lease-seconds",
+        type=float,
+        default=300,
+        help="How long a claimed job is reserved without being renewed (renewal "
+        "happens while it downloads) before another worker may take it over",
+    )
+    parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=3,
+        help="Number of times to try each job before marking it failed",
+    )
 
     args = parser.parse_args()
-
-    main(args.data_directory)
+    inventory = None if args.inventory is None else Inventory(args.inventory)
+
+    if args.queue is None:
+        main(
+            args.data_directory,
+            args.granule_list,
+            args.campaigns,
+            inventory,
+            args.replace_existing,
+        )
+    else:
+        queue = JobQueue(args.queue, args.max_attempts)
+        if args.enqueue:
+            enqueue_cresis(queue, iter_granules(args.granule_list, args.campaigns))
+            if args.retry_failed:
+                print(f"Retrying {queue.retry_failed()} failed jobs")
+            print(f"Queue: {queue.counts()}")
+        else:
+            run_worker(
+                args.data_directory,
+                queue,
+                args.worker_id,
+                args.lease_seconds,
+                inventory,
+                args.replace_existing,
+            )
@@ -28,12 +28,15 @@ import sqlite3
 import subprocess
 import tempfile
 from dataclasses import dataclass
+from typing import Optional
 
 # This required me to run
 # python3 -m pip install boto3
 # In QGIS's python install, I _also_ had to manually upgrade urllib3 to 1.26.20
 # /path/to/QGIS/binaries/pip install urllib3==1.26.20
 import boto3
+from radar_wrangler_utils.gpkg_utils import upsert_granule
+from radar_wrangler_utils.inventory_utils import Inventory, local_filesize
 
 access_keys = {}
 access_keys["OIA"] = os.environ['OIA_ACCESS_KEY']
@@ -158,17 +161,20 @@ def create_aad_s3_index():
 
 # NB: Need to test this briefly before pointing it at a directory where I've
 # already downloaded the data.
-def maybe_download_boto3(url: str, dest_filepath: str, campaign: str) -> int:
+def maybe_download_boto3(
+    url: str, dest_filepath: str, campaign: str, inventory: Optional[Inventory] = None
+) -> int:
 
     s3_client = create_aad_s3_client(campaign)
 
     filename = pathlib.Path(dest_filepath).name
-    if os.path.exists(dest_filepath):
-        filesize = os.path.getsize(dest_filepath)
+    filesize = local_filesize(dest_filepath, inventory)
+    if filesize is not None:
         print(
             "Skipping {}: file already exists with size {}".format(filename, filesize)
         )
     else:
+        filesize = -1
         # Create directory for campaign
         dest_dir = pathlib.Path(dest_filepath).parent
         try:
@@ -191,6 +197,8 @@ def maybe_download_boto3(url: str, dest_filepath: str, campaign: str) -> int:
                 subprocess.check_call(move_cmd)
                 print("Got {}!".format(filename))
                 filesize = os.path.getsize(dest_filepath)
+                if inventory is not None:
+                    inventory.record(dest_filepath)
 
         except subprocess.CalledProcessError as ex:
             print("Failed to download {}: {}".format(filename, ex))
@@ -199,7 +207,7 @@ def maybe_download_boto3(url: str, dest_filepath: str, campaign: str) -> int:
 
 
 def download_utig_aad(
-    qiceradar_dir: str, antarctic_index: str
+    qiceradar_dir: str, antarctic_index: str, inventory: Optional[Inventory] = None
 ):
     """
     Ensures that all data has been downloaded to the specified root
@@ -226,14 +234,16 @@ def download_utig_aad(
             raise Exception(msg)
 
         dest_filepath = f"{qiceradar_dir}/{granule.relpath}"
-        filesize = maybe_download_boto3(granule.url, dest_filepath, granule.campaign)
+        filesize = maybe_download_boto3(
+            granule.url, dest_filepath, granule.campaign, inventory
+        )
 
         # label displayed by Identify Features in QGIS
         granule_name = pathlib.Path(
             f"{granule.institution}_{granule.campaign}_{granule.transect}_{granule.granule}"
         ).with_suffix("")
         cursor.execute(
-            "INSERT OR REPLACE INTO granules VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            upsert_granule,
             [
                 str(granule_name),
                 granule.institution,
@@ -263,7 +273,13 @@ if __name__ == "__main__":
         "antarctic_index",
         help="Geopackage database to update with metadata about Antarctic campaigns and granules",
     )
+    parser.add_argument(
+        "--inventory",
+        help="Catalog written by scan_inventory.py; if given, it is used to "
+        "check for already-downloaded files, and updated with new ones",
+    )
     args = parser.parse_args()
+    inventory = None if args.inventory is None else Inventory(args.inventory)
     download_utig_aad(
-        args.data_directory, args.antarctic_index
+        args.data_directory, args.antarctic_index, inventory
     )
@@ -38,10 +38,14 @@ import sys
 import tempfile
 import time
 from getpass import getpass
+from typing import Optional
 from urllib.error import HTTPError, URLError
 from urllib.parse import urlparse
 from urllib.request import HTTPCookieProcessor, Request, build_opener
 
+from radar_wrangler_utils.gpkg_utils import upsert_granule
+from radar_wrangler_utils.inventory_utils import Inventory, local_filesize
+
 # TODO: how to handle the "date accessed" requirement?
 #   Save that in the index when the user downloads it?
 #   it's easy enough to add a collumn to the granules table that is
@@ -172,7 +176,7 @@ def get_login_response(url, credentials, token):
     return response
 
 
-def nsidc_download(dest_filepath, url) -> int:
+def nsidc_download(dest_filepath, url, inventory: Optional[Inventory] = None) -> int:
     """
     Download file at URL into dest_dir.
     """
@@ -182,8 +186,8 @@ def nsidc_download(dest_filepath, url) -> int:
     credentials = None
     token = None
 
-    if os.path.exists(dest_filepath) and not force:
-        filesize = os.path.getsize(dest_filepath)
+    filesize = local_filesize(dest_filepath, inventory)
+    if filesize is not None and not force:
         print(f"Skipping {dest_filepath}: file already exists with size {filesize}")
         return filesize
 
@@ -221,6 +225,8 @@ def nsidc_download(dest_filepath, url) -> int:
             subprocess.check_call(move_cmd)
             print(f"Got {dest_filepath}!")
             filesize = os.path.getsize(dest_filepath)
+            if inventory is not None:
+                inventory.record(dest_filepath)
         if not quiet:
             print()
     except HTTPError as e:
@@ -232,7 +238,12 @@ def nsidc_download(dest_filepath, url) -> int:
     return os.path.getsize(dest_filepath)
 
 
-def main(url_filepath: str, data_dir: str, antarctic_index: str):
+def main(
+    url_filepath: str,
+    data_dir: str,
+    antarctic_index: str,
+    inventory: Optional[Inventory] = None,
+):
     print("Loading metadata from {}".format(url_filepath))
 
     region = "ANTARCTIC"
@@ -273,10 +284,10 @@ def main(url_filepath: str, data_dir: str, antarctic_index: str):
                 db_campaign = "ICECAP_HiCARS1"
             else:
                 db_campaign = "ICECAP_HiCARS2"
-            filesize = nsidc_download(full_filepath, url)
+            filesize = nsidc_download(full_filepath, url, inventory)
             granule_name = f"{institution}_{campaign}_{segment}_{granule}"
             cursor.execute(
-                "INSERT OR REPLACE INTO granules VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                upsert_granule,
                 [
                     str(granule_name),
                     institution,
@@ -309,6 +320,12 @@ if __name__ == "__main__":
         "antarctic_index",
         help="Geopackage database to update with metadata about Antarctic campaigns and granules",
     )
+    parser.add_argument(
+        "--inventory",
+        help="Catalog written by scan_inventory.py; if given, it is used to "
+        "check for already-downloaded files, and updated with new ones",
+    )
 
     args = parser.parse_args()
-    main(url_list, args.data_directory, args.antarctic_index)
+    inventory = None if args.inventory is None else Inventory(args.inventory)
+    main(url_list, args.data_directory, args.antarctic_index, inventory)
@@ -9,14 +9,19 @@ So far, this is:
 """
 
 import json
-import os
 import pathlib
 import sqlite3
-import subprocess
-import tempfile
 from dataclasses import dataclass
+from typing import Optional
 
-import requests
+from radar_wrangler_utils.fetch_utils import Fetcher
+from radar_wrangler_utils.gpkg_utils import upsert_granule
+from radar_wrangler_utils.http_utils import (
+    HTTPCache,
+    add_http_cache_arguments,
+    http_cache_from_args,
+)
+from radar_wrangler_utils.inventory_utils import Inventory, local_filesize
 
 # The Dataverse API allows querying for information based on DOI
 dois = {}
@@ -44,7 +49,7 @@ class Granule:
     url: str  # download link
 
 
-def create_dataverse_index():
+def create_dataverse_index(http_cache: HTTPCache):
     # First, build the index mapping individual granules to all data about them
     granules = []
     institution = "UTIG"
@@ -52,7 +57,7 @@ def create_dataverse_index():
     for campaign, doi in dois.items():
         query_url = f"{dataverse_url}{doi}"
         print(f"querrying URL: {query_url}")
-        resp = requests.get(query_url)
+        resp = http_cache.get(query_url)
         if resp.status_code != 200:
             msg = f"Could not access data API! status = {resp.status_code}"
             raise Exception(msg)
@@ -89,60 +94,46 @@ def create_dataverse_index():
     return granules
 
 
-def maybe_download_wget(url: str, dest_filepath: str) -> int:
+def maybe_download(
+    url: str, dest_filepath: str, fetcher: Fetcher, inventory: Optional[Inventory] = None
+) -> int:
     filename = pathlib.Path(dest_filepath).name
-    if os.path.exists(dest_filepath):
-        filesize = os.path.getsize(dest_filepath)
+    filesize = local_filesize(dest_filepath, inventory)
+    if filesize is not None:
         print(
             "Skipping {}: file already exists with size {}".format(filename, filesize)
         )
     else:
-        # Create directory for campaign
-        dest_dir = pathlib.Path(dest_filepath).parent
-        try:
-            pp = pathlib.Path(dest_dir)
-            pp.mkdir(parents=True, exist_ok=True)
-        except FileExistsError as ex:
-            raise Exception(f"Could not create {dest_dir}: {ex}.")
-        try:
-            # Create a temporary file to avoid having to clean up partial downloads.
-            # This may not be ideal if the temporary file is created in a different filesystem than the
-            # output file belongs in. (I expect to eventually be downloading data to an external drive/NAS)
-            # TODO: create the temporary file in the same directory? or in the RadarData directory?
-            with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-                # wget_cmd = ["wget", "--no-clobber", "--quiet", "--output-document", dest_filepath, flight['url']]
-                # If saving to a temp file, get rid of --no-clobber, since the file will already have been created.
-                wget_cmd = [
-                    "wget",
-                    "--quiet",
-                    "--output-document",
-                    temp_file.name,
-                    url,
-                ]
-                print(f"{filename}: {wget_cmd}")
-                subprocess.check_call(wget_cmd)
-                # TODO: for plugin download, replace this with
-                #       `shutil.move` for cross-platform compatibility
-                move_cmd = ["mv", temp_file.name, dest_filepath]
-                subprocess.check_call(move_cmd)
-                print("Got {}!".format(filename))
-                filesize = os.path.getsize(dest_filepath)
-
-        except subprocess.CalledProcessError as ex:
-            print("Failed to download {}: {}".format(filename, ex))
+        # Creates the campaign's directory, and downloads to a temporary
+        # file there, so partial downloads never end up under the final name.
+        print(f"{filename}: {url}")
+        result = fetcher.fetch(url, dest_filepath)
+        if result.ok:
+            print("Got {}! {}".format(filename, result.summary()))
+            filesize = result.num_bytes
+            if inventory is not None:
+                inventory.record(dest_filepath, result.sha256)
+        else:
+            print("Failed to download {}: {}".format(filename, result.error))
+            filesize = -1
 
     return filesize
 
 
 def download_utig_dataverse(
-    qiceradar_dir: str, antarctic_index: str, arctic_index: str
+    qiceradar_dir: str,
+    antarctic_index: str,
+    arctic_index: str,
+    http_cache: HTTPCache,
+    inventory: Optional[Inventory] = None,
 ):
     """
     Ensures that all data has been downloaded to the specified root
     directory, and updates the input index database with url and path info.
     """
     # UTIG data is saved to ANTARCTIC/UTIG/{campaign}/{transect}/{granule}.nc
-    granules = create_dataverse_index()
+    granules = create_dataverse_index(http_cache)
+    fetcher = Fetcher()
 
     connection = sqlite3.connect(antarctic_index)
     cursor = connection.cursor()
@@ -162,14 +153,14 @@ def download_utig_dataverse(
             raise Exception(msg)
 
         dest_filepath = f"{qiceradar_dir}/{granule.relpath}"
-        filesize = maybe_download_wget(granule.url, dest_filepath)
+        filesize = maybe_download(granule.url, dest_filepath, fetcher, inventory)
 
         # label displayed by Identify Features in QGIS
         granule_name = pathlib.Path(
             f"{granule.institution}_{granule.campaign}_{granule.transect}_{granule.granule}"
         ).with_suffix("")
         cursor.execute(
-            "INSERT OR REPLACE INTO granules VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            upsert_granule,
             [
                 str(granule_name),
                 granule.institution,
@@ -203,7 +194,18 @@ if __name__ == "__main__":
         "arctic_index",
         help="Geopackage database to update with metadata about Arctic campaigns and granules",
     )
+    parser.add_argument(
+        "--inventory",
+        help="Catalog written by scan_inventory.py; if given, it is used to "
+        "check for already-downloaded files, and updated with new ones",
+    )
+    add_http_cache_arguments(parser)
     args = parser.parse_args()
+    inventory = None if args.inventory is None else Inventory(args.inventory)
     download_utig_dataverse(
-        args.data_directory, args.antarctic_index, args.arctic_index
+        args.data_directory,
+        args.antarctic_index,
+        args.arctic_index,
+        http_cache_from_args(args),
+        inventory,
     )
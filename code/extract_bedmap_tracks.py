@@ -1,28 +1,39 @@
 #! /usr/bin/env python3
 
-from radar_index_utils import count_skip_lines, subsample_tracks
+from radar_index_utils import (
+    segments_to_mask,
+    subsample_grid,
+    subsample_tracks,
+)
+from radar_wrangler_utils.ingest_utils import read_bedmap_lonlat, read_csv_header
 
 import json
 import numpy as np
 import os
-import pandas as pd
 import pathlib
 import pyproj
 
 
-def load_lat_lon(filepath):
+def load_lat_lon(filepath, cache_dir=None):
     """Open file in the BEDMAP CVS format and extract just lat long from it"""
-    skip_rows = count_skip_lines(filepath)
-    data = pd.read_csv(filepath, skiprows=skip_rows)
-
-    lon_index = [col for col in data.columns if "longitude" in col][0]
-    lat_index = [col for col in data.columns if "latitude" in col][0]
-    lon = data[lon_index]
-    lat = data[lat_index]
-    return np.array(lat), np.array(lon)
-
-
-def subsample_bedmap(data_directory, index_directory, force):
+    lon, lat = read_bedmap_lonlat(filepath, cache_dir)
+    return lat, lon
+
+
+def subsample_bedmap(
+    data_directory,
+    index_directory,
+    force,
+    grid_compilations,
+    grid_cell_size,
+    cache_dir=None,
+):
+    """
+    * grid_compilations: compilations (BEDMAP1/2/3) to thin by keeping one
+      point per grid_cell_size grid cell, rather than by along-track spacing.
+      Appropriate where the points aren't ordered along the flight lines.
+    * cache_dir: if set, cache parsed BEDMAP coordinates here as Parquet
+    """
     bedmap_dir = os.path.join(data_directory, "ANTARCTIC", "BEDMAP")
     output_dir = os.path.join(index_directory, "ANTARCTIC", "BEDMAP")
 
@@ -32,9 +43,6 @@ def subsample_bedmap(data_directory, index_directory, force):
         data_directory, "targ", "ANTARCTIC", "bm1_matched_segments.json"
     )
     duplicate_segments = json.load(open(segment_filepath, "r"))
-    duplicate_idxs = set()
-    for s0, s1 in duplicate_segments:
-        duplicate_idxs.update(np.arange(s0, s1 + 1))
 
     institutions = {}
 
@@ -59,7 +67,9 @@ def subsample_bedmap(data_directory, index_directory, force):
                 institutions[institution] = []
             # Cache this for later processing
             filepath = os.path.join(compilation_dir, filename)
-            institutions[institution].append((year, campaign, air, filepath))
+            institutions[institution].append(
+                (year, campaign, air, compilation, filepath)
+            )
 
     ps71 = pyproj.Proj("epsg:3031")
     min_spacing = 200  # meters between successive points
@@ -67,7 +77,7 @@ def subsample_bedmap(data_directory, index_directory, force):
     for institution, campaigns in institutions.items():
         print("Subsampling {}".format(institution))
         for campaign in campaigns:
-            _, cc, _, datafilepath = campaign
+            _, cc, _, compilation, datafilepath = campaign
             institution_dir = os.path.join(output_dir, institution)
             try:
                 pp = pathlib.Path(institution_dir)
@@ -77,31 +87,33 @@ def subsample_bedmap(data_directory, index_directory, force):
             out_filename = datafilepath.split("/")[-1]
             out_filepath = os.path.join(institution_dir, out_filename)
             if force or not os.path.exists(out_filepath):
-                lat, lon = load_lat_lon(datafilepath)
+                lat, lon = load_lat_lon(datafilepath, cache_dir)
 
                 if cc == "BEDMAP1":
-                    good_idxs = [
-                        idx
-                        for idx in np.arange(0, len(lat))
-                        if idx not in duplicate_idxs
-                    ]
+                    good_mask = ~segments_to_mask(duplicate_segments, len(lat))
                     print(
                         "For BEDMAP1, using {} / {} points.".format(
-                            len(good_idxs), len(lat)
+                            np.count_nonzero(good_mask), len(lat)
+                        )
+                    )
+                    lat = lat[good_mask]
+                    lon = lon[good_mask]
+
+                if compilation in grid_compilations:
+                    xx, yy = ps71.transform(lon, lat)
+                    num_points = len(xx)
+                    xx, yy = subsample_grid(xx, yy, grid_cell_size)
+                    print(
+                        "{}: grid subsampled {} -> {}".format(
+                            cc, num_points, len(xx)
                         )
                     )
-                    lat = lat[good_idxs]
-                    lon = lon[good_idxs]
-
-                lat, lon = subsample_tracks(lat, lon, min_spacing)
-                xx, yy = ps71.transform(lon, lat)
-                skip_rows = count_skip_lines(datafilepath)
-                with open(datafilepath, "r") as in_fp, open(
-                    out_filepath, "w"
-                ) as out_fp:
-                    for _ in range(skip_rows):
-                        line = in_fp.readline()
-                        out_fp.write(line)
+                else:
+                    lat, lon = subsample_tracks(lat, lon, min_spacing)
+                    xx, yy = ps71.transform(lon, lat)
+                header = read_csv_header(datafilepath)
+                with open(out_filepath, "w") as out_fp:
+                    out_fp.writelines(header.comment_lines)
                     out_fp.write("ps71_easting,ps71_northing\n")
                     out_fp.writelines(
                         ["{},{}\n".format(pt[0], pt[1]) for pt in zip(xx, yy)]
@@ -119,5 +131,33 @@ if __name__ == "__main__":
         "index_directory", help="Root directory for generated subsampled files"
     )
     parser.add_argument("--force", action="store_true")
+    parser.add_argument(
+        "--grid-compilations",
+        nargs="*",
+        default=["BEDMAP1"],
+        help="Compilations to thin with a spatial grid rather than along-track, "
+        "because their points aren't in flight order. (default: BEDMAP1)",
+    )
+    parser.add_argument(
+        "--grid-cell-size",
+        type=float,
+        default=200,
+        help="Grid cell size (meters) for --grid-compilations",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory for Parquet copies of the BEDMAP coordinates. "
+        "Defaults to {data_directory}/targ/ANTARCTIC/bedmap_cache",
+    )
     args = parser.parse_args()
-    subsample_bedmap(args.data_directory, args.index_directory, args.force)
+    cache_dir = args.cache_dir
+    if cache_dir is None:
+        cache_dir = os.path.join(args.data_directory, "targ", "ANTARCTIC", "bedmap_cache")
+    subsample_bedmap(
+        args.data_directory,
+        args.index_directory,
+        args.force,
+        args.grid_compilations,
+        args.grid_cell_size,
+        cache_dir,
+    )
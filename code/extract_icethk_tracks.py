@@ -1,18 +1,28 @@
 #! /usr/bin/env python3
 
+import concurrent.futures
 import os
 import pathlib
 
 import numpy as np
-import pandas as pd
 import pyproj
-from radar_index_utils import count_skip_lines, subsample_tracks_rdp
+from radar_index_utils import subsample_tracks_rdp
+from radar_wrangler_utils.inventory_utils import Inventory, list_directory, local_filesize
+from radar_wrangler_utils.ingest_utils import (
+    read_batch,
+    read_lvs_nav,
+    read_respac_seasons,
+    read_spri_lonlat,
+)
 
 
-def extract_flightlines(data_directory, index_directory, epsilon, force):
+def extract_flightlines(data_directory, index_directory, epsilon, force, inventory=None):
     """
     Traverse the RadarData directories and extract flight paths for any
     icethickness-only data that are found.
+
+    If an inventory is given, it is used to find the input files and
+    existing outputs, rather than the filesystem.
     """
 
     icethicknesses = [
@@ -33,34 +43,45 @@ def extract_flightlines(data_directory, index_directory, epsilon, force):
 
         # Downloaded data format was a bunch of CSVs
         if provider == "STANFORD":
-            filepaths = pathlib.Path(input_dir).glob("*.csv")
+            suffix = ".csv"
+            reader = read_spri_lonlat
         elif provider == "UTIG" and campaign == "SOAR_LVS":
-            filepaths = pathlib.Path(input_dir).glob("*.nav")
+            suffix = ".nav"
+            reader = read_lvs_nav
         else:
             print(f"Cannot extract campaign {campaign}")
             return
-        for filepath in filepaths:
-            segment = pathlib.Path(filepath).stem
+
+        todo = []
+        # TODO: Can't assume perfectly clean input data directories, so this
+        #       needs to handle detecting that it's been asked to process
+        #       an invalid file.
+        # (list_directory skips the "._" files that my filesystem adds)
+        _, filenames = list_directory(input_dir, inventory)
+        for filename in filenames:
+            if not filename.endswith(suffix):
+                continue
+            filepath = os.path.join(input_dir, filename)
+            segment = pathlib.Path(filename).stem
             output_filepath = os.path.join(
                 index_directory, region, provider, campaign, segment + ".csv"
             )
-            if force or not os.path.exists(output_filepath):
-                print(f"Processing {filepath} -> {output_filepath}".format(filepath))
-                extract_file(
-                    region, provider, filepath, output_filepath, epsilon
-                )
+            if force or local_filesize(output_filepath, inventory) is None:
+                todo.append((filepath, output_filepath))
             else:
                 print(f"SKipping {filepath}")
 
+        # These are many small files, so read them in parallel up front.
+        batch = read_batch(reader, [filepath for filepath, _ in todo])
+        for idx, (filepath, output_filepath) in enumerate(todo):
+            print(f"Processing {filepath} -> {output_filepath}")
+            lon, lat = batch.file_points(idx)
+            extract_file(region, lon, lat, output_filepath, epsilon)
+            if inventory is not None:
+                inventory.record(output_filepath)
 
-def extract_file(region, provider, input_filepath, output_filepath, epsilon):
-    # TODO: Can't assume perfectly clean input data directories, so this
-    #       needs to handle detecting that it's been asked to process
-    #       an invalid file.
-    # I'm not sure why my filesystem adds "._" files...
-    if pathlib.Path(input_filepath).stem.startswith("."):
-        return
 
+def extract_file(region, lon, lat, output_filepath, epsilon):
     # TODO: Figure out how to get the RDP algorithm to use lat/lon
     #   for cross-track error calculations.
     # Output data is in lat/lon, but for subsampling the flight paths we
@@ -76,20 +97,8 @@ def extract_file(region, provider, input_filepath, output_filepath, epsilon):
         print("Unrecognized region {} -- cannot downsample.".format(region))
         return
 
-    if "STANFORD" == provider:
-        result = extract_stanford_coords(input_filepath)
-    elif "UTIG" == provider and "LVS" in str(input_filepath):
-        result = extract_lvs_coords(input_filepath)
-    else:
-        print(
-            "Unsupported data provider: {}. Skipping {}".format(
-                provider, input_filepath
-            )
-        )
-        return
-
-    if result is None:
-        print("Unable to extract data from: {}".format(input_filepath))
+    if len(lon) == 0:
+        print("No points to extract for {}".format(output_filepath))
         return
 
     # Only create output directory if we have something to put there.
@@ -102,19 +111,12 @@ def extract_file(region, provider, input_filepath, output_filepath, epsilon):
         print("Could not create {}".format(output_dir))
         raise (ex)
 
-    lon, lat = result
-    lat = np.array(lat)
-    lon = np.array(lon)
-
     # I don't love transforming into and out of a map projection, but
     # I haven't yet figured out how to run RDP on geographic coordinates.
     xx, yy = proj.transform(lon, lat)
     sx, sy = subsample_tracks_rdp(xx, yy, epsilon)
     # RDP doesn't dramatically reduce the number of points in each SPRI flight, since
     # they were already pretty sparse.
-    sub_lon, sub_lat = proj.transform(
-        np.array(sx), np.array(sy), direction=pyproj.enums.TransformDirection.INVERSE
-    )
 
     print("Saving subsampled data to {}".format(output_filepath))
     with open(output_filepath, "w") as fp:
@@ -123,115 +125,76 @@ def extract_file(region, provider, input_filepath, output_filepath, epsilon):
         fp.writelines(data)
 
 
-def extract_stanford_coords(filepath):
-    # CSV with fields: [CBD,LAT,LON,THK,SRF]
-    skip_lines = count_skip_lines(filepath)
-    data = pd.read_csv(filepath, skiprows=skip_lines)
+def extract_respac_season(index_directory, season, points, epsilon):
+    """
+    Split one season of RESPAC points into continuous segments, and
+    write an RDP-subsampled CSV for each.
 
-    lat_index = [col for col in data.columns if "LAT" in col][0]
-    lon_index = [col for col in data.columns if "LON" in col][0]
-    lat = data[lat_index]
-    lon = data[lon_index]
-    return np.array(lon), np.array(lat)
+    Returns the paths of the CSVs that were written.
+    """
+    ps71 = pyproj.Proj("epsg:3031")
+    season_name = "BAS_19{}_19{}".format(season[0:2], season[2:4])
+    print(season_name)
+    season_dir = os.path.join(index_directory, "ANTARCTIC", "BAS", season_name)
 
+    try:
+        pathlib.Path(season_dir).mkdir(parents=True, exist_ok=True)
+    except FileExistsError as ex:
+        print("Could not create {}".format(season_dir))
+        raise (ex)
 
-# I haven't yet figured out how to extract this data from the segy
-# files (and hope to not support them), so just doing paths
-# for now.
-def extract_lvs_coords(filepath):
-    # tab-separated file with fields: [line, trace, lon, lat, alt]
-    data = pd.read_csv(filepath)
-    field_names = ["line", "trace", "LON", "LAT", "ALT"]
-    data = pd.read_csv(filepath, sep='\s+', names=field_names)  # noqa: W605
-    lat = data["LAT"]
-    lon = data["LON"]
-    return np.array(lon), np.array(lat)
+    # break each season into segments that can be plotted with line segments
+    # Find distance between consecutive points
+    lon = points[:, 0]
+    lat = points[:, 1]
+    xx, yy = ps71.transform(lon, lat)
+    dx = xx[1:] - xx[0:-1]
+    dy = yy[1:] - yy[0:-1]
+    dists = np.sqrt(dx * dx + dy * dy)
+    dists = np.insert(dists, 0, 0)
+    # Find indices of larger jumps and split points into segments
+    (skips,) = np.where(dists > 1000)
+    skips = np.insert(skips, 0, 0)
+    skips = np.append(skips, len(points))
+
+    segment_count = 0
+    segment_filepaths = []
+    for start, end in zip(skips[:-1], skips[1:]):
+        if end - start <= 1:
+            continue
+        segment_filepath = os.path.join(
+            season_dir, "segment{:03d}.csv".format(segment_count)
+        )
+        segment_count += 1
+        sx, sy = subsample_tracks_rdp(xx[start:end], yy[start:end], epsilon)
+        with open(segment_filepath, "w") as fp:
+            fp.write("ps71_easting,ps71_northing\n")
+            data = ["{},{}\n".format(pt[0], pt[1]) for pt in zip(sx, sy)]
+            fp.writelines(data)
+        segment_filepaths.append(segment_filepath)
+    return segment_filepaths
 
 
-def extract_bas_respac(data_directory, index_directory, epsilon):
+def extract_bas_respac(data_directory, index_directory, epsilon, inventory=None):
     # Import data, grouping it into seasons.
     bas_filepath = os.path.join(
         data_directory, "ANTARCTIC", "BAS", "BAS_RESPAC_Radar.xyz"
     )
-    seasons = {}
-    season = None
-    curr_line = None
-    with open(bas_filepath, "r") as fp:
-        for line in fp:
-            if line.startswith("/"):
-                continue
-            if "Line" in line:
-                season = line.split()[1]
-                if curr_line is not None:
-                    seasons[season] = np.array(curr_line)
-                curr_line = []
-            else:
-                tokens = line.split()
-
-                (
-                    current_record,
-                    season,
-                    lon,
-                    lat,
-                    xx,
-                    yy,
-                    wgs84_height,
-                    tice,
-                    srfelev,
-                    bedelev,
-                ) = tokens
-                try:
-                    curr_line.append((float(lon), float(lat)))
-                except Exception:
-                    # Some records don't have position data; just skip them.
-                    continue
-
-    # Split each season into segments that can be plotted as line segments.
-    ps71 = pyproj.Proj("epsg:3031")
-    for season, points in seasons.items():
-        season_name = "BAS_19{}_19{}".format(season[0:2], season[2:4])
-        print(season_name)
-        season_dir = os.path.join(index_directory, "ANTARCTIC", "BAS", season_name)
-
-        try:
-            pathlib.Path(season_dir).mkdir(parents=True, exist_ok=True)
-        except FileExistsError as ex:
-            print("Could not create {}".format(season_dir))
-            raise (ex)
-
-        # break each season into segments that can be plotted with line segments
-        # Find distance between consecutive points
-        lon = points[:, 0]
-        lat = points[:, 1]
-        xx, yy = ps71.transform(lon, lat)
-        dx = xx[1:] - xx[0:-1]
-        dy = yy[1:] - yy[0:-1]
-        dists = np.sqrt(dx * dx + dy * dy)
-        dists = np.insert(dists, 0, 0)
-        # Find indices of larger jumps and split points into segments
-        (skips,) = np.where(dists > 1000)
-        skips = np.insert(skips, 0, 0)
-        skips = np.append(skips, len(points))
-        segments = [
-            points[skips[idx] : skips[idx + 1], :] for idx in range(len(skips) - 1)
-        ]
+    seasons = read_respac_seasons(bas_filepath)
 
-        segment_count = 0
-        for segment in segments:
-            if len(segment) <= 1:
-                continue
-            segment_filepath = os.path.join(
-                season_dir, "segment{:03d}.csv".format(segment_count)
+    # Seasons are independent, and RDP is CPU-bound, so process them in parallel.
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        futures = [
+            executor.submit(
+                extract_respac_season, index_directory, season, points, epsilon
             )
-            segment_count += 1
-            lon = segment[:, 0]
-            lat = segment[:, 1]
-            xx, yy = ps71.transform(lon, lat)
-            sx, sy = subsample_tracks_rdp(xx, yy, epsilon)
-            with open(segment_filepath, "w") as fp:
-                fp.write("ps71_easting,ps71_northing\n")
-                data = ["{},{}\n".format(pt[0], pt[1]) for pt in zip(sx, sy)]
-                fp.writelines(data)
+            for season, points in seasons.items()
+        ]
+        for future in futures:
+            segment_filepaths = future.result()
+            if inventory is not None:
+                for segment_filepath in segment_filepaths:
+                    inventory.record(segment_filepath)
 
 
 def main():
@@ -248,16 +211,24 @@ def main():
         "--epsilon", default=5.0, help="Maximum cross-track error for RDP subsampling."
     )
     parser.add_argument("--force", action="store_true")
+    parser.add_argument(
+        "--inventory",
+        help="Catalog written by scan_inventory.py for both directories; "
+        "if given, it is used instead of listing them",
+    )
     args = parser.parse_args()
+    inventory = None if args.inventory is None else Inventory(args.inventory)
 
     # This is in the hopes that we'll have more data showing up as CSVs
     # For now, only does SPRI
     extract_flightlines(
-        args.data_directory, args.index_directory, args.epsilon, args.force
+        args.data_directory, args.index_directory, args.epsilon, args.force, inventory
     )
 
     # BAS's format for respac data is special and won't generalize.
-    extract_bas_respac(args.data_directory, args.index_directory, args.epsilon)
+    extract_bas_respac(
+        args.data_directory, args.index_directory, args.epsilon, inventory
+    )
 
 
 if __name__ == "__main__":
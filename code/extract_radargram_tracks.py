@@ -10,6 +10,11 @@ import pyproj
 import scipy
 import scipy.io
 from radar_index_utils import subsample_tracks_rdp
+from radar_wrangler_utils.inventory_utils import (
+    Inventory,
+    list_directory,
+    local_filesize,
+)
 
 # We apply an extra filtering step to the positioning data from these files
 # to remove large jumps before the ground tracks are added to the index.
@@ -73,26 +78,24 @@ corrupt_files = [
 ]
 
 
-def extract_flightlines(data_directory, index_directory, epsilon, force):
+def extract_flightlines(data_directory, index_directory, epsilon, force, inventory=None):
     """
     Traverse the RadarData directories and extract flight paths for any
     radargrams that are found.
+
+    If an inventory is given, both directory listings and checks for
+    existing output come from it, rather than the filesystem.
     """
     for region in ["ARCTIC", "ANTARCTIC"]:
         print("Handling {} data".format(region))
         region_dir = os.path.join(data_directory, region)
         for provider in ["AWI", "BAS", "CRESIS", "KOPRI", "LDEO", "UTIG"]:
             provider_dir = os.path.join(region_dir, provider)
-            if not os.path.isdir(provider_dir):
+            campaigns, _ = list_directory(provider_dir, inventory)
+            if len(campaigns) == 0:
                 print(".. No {} data from {}".format(region, provider))
                 continue
             print(".. {}".format(provider))
-            campaigns = [
-                dd
-                for dd in os.listdir(provider_dir)
-                if os.path.isdir(os.path.join(provider_dir, dd))
-            ]
-            campaigns.sort()
             for campaign in campaigns:
                 print(".... Extracting campaign: {}".format(campaign))
                 campaign_dir = os.path.join(provider_dir, campaign)
@@ -100,30 +103,21 @@ def extract_flightlines(data_directory, index_directory, epsilon, force):
                 # TODO: Fix this hack!
                 # TODO: This should just crawl the whole directory structure, rather than having me hard-code it.
                 if "CRESIS" == provider:
-                    products = [
-                        dd
-                        for dd in os.listdir(campaign_dir)
-                        if os.path.isdir(os.path.join(campaign_dir, dd))
-                    ]
+                    products, _ = list_directory(campaign_dir, inventory)
                     # We only need one for the index of flight lines.
                     campaign_dir = os.path.join(campaign_dir, products[0])
 
                 # Each campaign has segments. For some providers,
                 # those will be further split into granules
-                segments = [
-                    dd for dd in os.listdir(campaign_dir) if not dd.startswith(".")
-                ]
-                segments.sort()
-                for segment in segments:
+                segment_dirs, segment_files = list_directory(campaign_dir, inventory)
+                for segment in sorted(segment_dirs + segment_files):
                     # Check if segment is a dir, if so, go to granules.
                     segment_path = os.path.join(campaign_dir, segment)
-                    if os.path.isdir(segment_path):
+                    if segment in segment_dirs:
+                        _, granules = list_directory(segment_path, inventory)
                         granules = [
-                            ss
-                            for ss in os.listdir(segment_path)
-                            if ss.endswith("nc") or ss.endswith("mat")
+                            ss for ss in granules if ss.endswith("nc") or ss.endswith("mat")
                         ]
-                        granules.sort()
                         for granule in granules:
                             granule_filepath = os.path.join(segment_path, granule)
                             filename = pathlib.Path(granule_filepath).stem
@@ -138,7 +132,7 @@ def extract_flightlines(data_directory, index_directory, epsilon, force):
                                 )
                                 + ".csv"
                             )
-                            if force or not os.path.exists(output_granule_filepath):
+                            if force or local_filesize(output_granule_filepath, inventory) is None:
                                 extract_file(
                                     region,
                                     provider,
@@ -146,6 +140,8 @@ def extract_flightlines(data_directory, index_directory, epsilon, force):
                                     output_granule_filepath,
                                     epsilon,
                                 )
+                                if inventory is not None:
+                                    inventory.record(output_granule_filepath)
                     else:
                         filename = pathlib.Path(segment_path).stem
                         output_segment_filepath = (
@@ -154,7 +150,7 @@ def extract_flightlines(data_directory, index_directory, epsilon, force):
                             )
                             + ".csv"
                         )
-                        if force or not os.path.exists(output_segment_filepath):
+                        if force or local_filesize(output_segment_filepath, inventory) is None:
                             extract_file(
                                 region,
                                 provider,
@@ -162,6 +158,8 @@ def extract_flightlines(data_directory, index_directory, epsilon, force):
                                 output_segment_filepath,
                                 epsilon,
                             )
+                            if inventory is not None:
+                                inventory.record(output_segment_filepath)
 
 
 def extract_file(region, provider, input_filepath, output_filepath, epsilon):
@@ -389,9 +387,15 @@ def main():
     parser.add_argument(
         "--force", action="store_true"
     )
+    parser.add_argument(
+        "--inventory",
+        help="Catalog written by scan_inventory.py for both directories; "
+        "if given, it is used instead of walking them",
+    )
     args = parser.parse_args()
+    inventory = None if args.inventory is None else Inventory(args.inventory)
     extract_flightlines(
-        args.data_directory, args.index_directory, args.epsilon, args.force
+        args.data_directory, args.index_directory, args.epsilon, args.force, inventory
     )
 
 
@@ -1,6 +1,8 @@
 #! /usr/bin/env python3
 """
-Generate a CSV file with information about every granule available on CReSIS's server.
+Generate an index with information about every granule available on CReSIS's server.
+
+It is saved as a GranuleStore, and also exported as CSV.
 
 (In retrospect, maybe I should have looked into their FTP server?)
 """
@@ -8,24 +10,32 @@ Generate a CSV file with information about every granule available on CReSIS's s
 import os
 import re
 
-import requests
 from bs4 import BeautifulSoup
 
-from radar_wrangler_utils import Granule, read_granule_list, write_granule_list
+from radar_wrangler_utils import Granule, GranuleStore, open_granule_store
+from radar_wrangler_utils.http_utils import (
+    HTTPCache,
+    add_http_cache_arguments,
+    http_cache_from_args,
+)
 
 
-def reindex_cresis(index_filepath: str, partial: bool) -> None:
+def reindex_cresis(
+    store_filepath: str, csv_filepath: str, partial: bool, http_cache: HTTPCache
+) -> None:
     print("Reindexing Cresis ")
     cresis_url = "https://data.cresis.ku.edu/data/rds"
-    reqs = requests.get(cresis_url)
+    reqs = http_cache.get(cresis_url)
     soup = BeautifulSoup(reqs.text, "html.parser")
 
     if partial:
-        cresis_granules = read_granule_list(index_filepath)
+        # Resumes from the CSV index, if it predates the GranuleStore
+        store = open_granule_store(store_filepath)
     else:
-        cresis_granules = []
+        store = GranuleStore(store_filepath)
+        store.clear()
 
-    loaded_campaigns = {granule.campaign for granule in cresis_granules}
+    loaded_campaigns = set(store.campaigns())
     print(f"Already processed campaigns: {loaded_campaigns}")
 
     institution = "CRESIS"
@@ -58,7 +68,7 @@ def reindex_cresis(index_filepath: str, partial: bool) -> None:
             region = "ARCTIC"
 
         campaign_url = "{}/{}".format(cresis_url, campaign)
-        reqs = requests.get(campaign_url)
+        reqs = http_cache.get(campaign_url)
         soup = BeautifulSoup(reqs.text, "html.parser")
         product_dirs = [link.get("href").strip("/") for link in soup.find_all("a")]
         # From their README: "The standard L1B files are, in order of increasing quality
@@ -80,7 +90,8 @@ def reindex_cresis(index_filepath: str, partial: bool) -> None:
             continue
 
         product_url = "{}/{}".format(campaign_url, product)
-        reqs = requests.get(product_url)
+        cresis_granules = []
+        reqs = http_cache.get(product_url)
         soup = BeautifulSoup(reqs.text, "html.parser")
         segments = set()
         for link in soup.find_all("a"):
@@ -96,7 +107,7 @@ def reindex_cresis(index_filepath: str, partial: bool) -> None:
 
         for segment in segments:  # e.g. "20041118_01"
             segment_url = "{}/{}".format(product_url, segment)
-            reqs = requests.get(segment_url)
+            reqs = http_cache.get(segment_url)
             soup = BeautifulSoup(reqs.text, "html.parser")
             files = set()
             combined_regex = "Data_[0-9]{8}_[0-9]{2}_[0-9]{3}.mat"
@@ -137,13 +148,16 @@ def reindex_cresis(index_filepath: str, partial: bool) -> None:
 
         loaded_campaigns.add(campaign)
         # Cache progress, since this is so slow
-        write_granule_list(index_filepath, cresis_granules)
+        store.write(cresis_granules)
+
+    store.export_csv(csv_filepath)
 
 
-def main(partial: bool):
-    index_filepath = "../data/cresis_granules.csv"
+def main(partial: bool, http_cache: HTTPCache):
+    store_filepath = "../data/cresis_granules.sqlite"
+    csv_filepath = "../data/cresis_granules.csv"
 
-    reindex_cresis(index_filepath, partial)
+    reindex_cresis(store_filepath, csv_filepath, partial, http_cache)
 
 
 if __name__ == "__main__":
@@ -156,7 +170,8 @@ if __name__ == "__main__":
         help="If reindexing, start from existing index?",
         action="store_true"
     )
+    add_http_cache_arguments(parser)
 
     args = parser.parse_args()
 
-    main(args.partial)
+    main(args.partial, http_cache_from_args(args))
@@ -22,6 +22,12 @@ import re
 import requests
 from bs4 import BeautifulSoup
 
+from radar_wrangler_utils.http_utils import (
+    HTTPCache,
+    add_http_cache_arguments,
+    http_cache_from_args,
+)
+
 
 def credentials_from_netrc():
     hostname = "urs.earthdata.nasa.gov"
@@ -39,7 +45,7 @@ def credentials_from_netrc():
     return token
 
 
-def main(index_filepath):
+def main(index_filepath: str, http_cache: HTTPCache):
     print("Saving index to: {}".format(index_filepath))
     # Crawling the NSIDC website finding URLs is terribly slow, so we
     # need to be able to resume.
@@ -70,17 +76,20 @@ def main(index_filepath):
     # TODO: update this for CReSIS filenames!
 
     regex = "(?P<instrument>[0-9a-zA-Z]+)_(?P<flight_str>[0-9]{8}_[0-9]{2})_(?P<granule>[0-9]{3}).nc"
-    token = credentials_from_netrc()
-    with requests.sessions.Session() as session, open(index_filepath, "w") as fp:
+    if http_cache.offline:
+        headers = {}
+    else:
+        token = credentials_from_netrc()
+        headers = {"Authorization": "Bearer {0}".format(token)}
+    with open(index_filepath, "w") as fp:
         fp.write("institution,flight,granule,url\n")
         if previous_csv is not None:
             fp.writelines(previous_csv)
 
-        session.headers.update({"Authorization": "Bearer {0}".format(token)})
         for instrument_url in [mcords_url]:
             print("*************")
             print("Checking {}".format(instrument_url))
-            instrument_resp = session.get(instrument_url)
+            instrument_resp = http_cache.get(instrument_url, headers)
             instrument_soup = BeautifulSoup(instrument_resp.text, "html.parser")
 
             # Data is organized into yyyy.mm.dd folders
@@ -101,12 +110,12 @@ def main(index_filepath):
                     print("Skipping {} -- already scraped".format(flight_day))
                     continue
                 try:
-                    flight_resp = session.get(flight_url)
+                    flight_resp = http_cache.get(flight_url, headers)
                 except requests.exceptions.ConnectionError as ex:
                     print(ex)
                     print("...trying again")
                     try:
-                        flight_resp = session.get(flight_url)
+                        flight_resp = http_cache.get(flight_url, headers)
                     except Exception:
                         err_msg = "WARNING: failed to index {}; re-run script".format(
                             flight_url
@@ -133,6 +142,12 @@ def main(index_filepath):
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    add_http_cache_arguments(parser)
+    args = parser.parse_args()
+
     index_dir = "../../data/NASA"
     try:
         pp = pathlib.Path(index_dir)
@@ -144,4 +159,4 @@ if __name__ == "__main__":
     # NB: This creates a file including both arctic and antarctic data!
     # The download step will need to determine which region to put data in.
     index_filepath = os.path.join(index_dir, "cresis_nsidc_index.csv")
-    main(index_filepath)
+    main(index_filepath, http_cache_from_args(args))
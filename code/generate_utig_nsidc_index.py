@@ -28,6 +28,12 @@ import re
 import requests
 from bs4 import BeautifulSoup
 
+from radar_wrangler_utils.http_utils import (
+    HTTPCache,
+    add_http_cache_arguments,
+    http_cache_from_args,
+)
+
 
 def credentials_from_netrc():
     hostname = "urs.earthdata.nasa.gov"
@@ -45,7 +51,7 @@ def credentials_from_netrc():
     return token
 
 
-def main(index_filepath):
+def main(index_filepath: str, http_cache: HTTPCache):
     print("Saving index to: {}".format(index_filepath))
     # Crawling the NSIDC website finding URLs is terribly slow, so we
     # need to be able to resume.
@@ -77,17 +83,20 @@ def main(index_filepath):
     hicars2_url = "https://n5eil01u.ecs.nsidc.org/ICEBRIDGE/IR2HI1B.001"
     # Extract information from the filename
     regex = "(?P<instrument>[0-9a-zA-Z]+)_(?P<year>[0-9]{4})(?P<doy>[0-9]{3})_(?P<project>[0-9a-zA-Z]+)_(?P<set>[0-9a-zA-Z]+)_(?P<transect>[0-9a-zA-Z]*)_(?P<granule>[0-9]*).nc"
-    token = credentials_from_netrc()
-    with requests.sessions.Session() as session, open(index_filepath, "w") as fp:
+    if http_cache.offline:
+        headers = {}
+    else:
+        token = credentials_from_netrc()
+        headers = {"Authorization": "Bearer {0}".format(token)}
+    with open(index_filepath, "w") as fp:
         fp.write("institution,flight,segment,granule,url\n")
         if previous_csv is not None:
             fp.writelines(previous_csv)
 
-        session.headers.update({"Authorization": "Bearer {0}".format(token)})
         for instrument_url in [hicars1_url, hicars2_url]:
             print("*************")
             print("Checking {}".format(instrument_url))
-            instrument_resp = session.get(instrument_url)
+            instrument_resp = http_cache.get(instrument_url, headers)
             instrument_soup = BeautifulSoup(instrument_resp.text, "html.parser")
 
             # Each link shows up a few times
@@ -107,12 +116,12 @@ def main(index_filepath):
                     print("Skipping {} -- already scraped".format(flight_day))
                     continue
                 try:
-                    flight_resp = session.get(flight_url)
+                    flight_resp = http_cache.get(flight_url, headers)
                 except requests.exceptions.ConnectionError as ex:
                     print(ex)
                     print("...trying again")
                     try:
-                        flight_resp = session.get(flight_url)
+                        flight_resp = http_cache.get(flight_url, headers)
                     except Exception:
                         err_msg = "WARNING: failed to index {}; re-run script".format(
                             flight_url
@@ -144,6 +153,12 @@ def main(index_filepath):
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    add_http_cache_arguments(parser)
+    args = parser.parse_args()
+
     index_dir = "../../data/UTIG"
     try:
         pp = pathlib.Path(index_dir)
@@ -153,4 +168,4 @@ if __name__ == "__main__":
         print(ex)
         raise (ex)
     index_filepath = os.path.join(index_dir, "utig_nsidc_index.csv")
-    main(index_filepath)
+    main(index_filepath, http_cache_from_args(args))
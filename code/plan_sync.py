@@ -0,0 +1,346 @@
+#! /usr/bin/env python3
+"""
+Work out what a sync with a provider actually needs to do, by comparing
+three views of the data:
+* the provider's catalog, as crawled by generate_*_index.py
+* the granules table in the geopackage indices
+* the files on disk (from the inventory, if given)
+
+Each granule that differs ends up in the delta as one of:
+* new: in the catalog, but not in the granules table
+* changed_size: downloaded, but the file on the server is a different
+  size (known from probe_remote_sizes.py's cache, or --probe)
+* missing_locally: in the catalog and the granules table, but not downloaded
+* removed_upstream: in the granules table, but no longer in the catalog
+
+The granules that need to be downloaded are written to one granule list
+(--output, for download_cresis_ku.py), and every granule that needs its
+row in the granules table added or updated (including new granules that
+are already on disk) to another (--populate-output, for
+populate_granules.py), so a nightly sync only touches what has changed.
+Granules that were removed upstream are only reported.
+
+For now, this only covers the CReSIS KU data: it needs the catalog as a
+GranuleStore (or CSV granule list), and download_cresis_ku.py is the only
+downloader that reads one.
+"""
+
+import collections
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from radar_wrangler_utils import Granule, GranuleStore, iter_granules, write_granule_list
+from radar_wrangler_utils.inventory_utils import Inventory, local_filesizes
+from radar_wrangler_utils.probe_utils import RemoteGranule, load_remote_sizes, probe_sizes
+
+delta_kinds = ["new", "changed_size", "missing_locally", "removed_upstream"]
+
+
+@dataclass
+class SyncItem:
+    kind: str  # One of delta_kinds
+    granule_name: str
+    region: str
+    campaign: str
+    relative_filepath: str
+    local_size: Optional[int]  # None if not downloaded
+    remote_size: Optional[int]  # None if unknown
+    granule: Optional[Granule]  # None for removed_upstream
+
+    @property
+    def needs_download(self) -> bool:
+        if self.kind == "removed_upstream":
+            return False
+        return self.local_size is None or self.kind == "changed_size"
+
+
+@dataclass
+class IndexedGranule:
+    name: str
+    campaign: str
+    url: str
+    destination_path: str
+    filesize: int  # -1 if unknown
+
+
+def load_indexed(
+    gpkg_filepath: str, institutions: set[str], campaigns: Optional[set[str]] = None
+) -> dict[str, IndexedGranule]:
+    """
+    Granules in the index from any of institutions (and, if given,
+    one of campaigns), by name.
+    """
+    with sqlite3.connect(gpkg_filepath) as connection:
+        rows = connection.execute(
+            "SELECT name, campaign, url, destination_path, filesize FROM granules "
+            f"WHERE institution IN ({', '.join('?' for _ in institutions)})",
+            list(institutions),
+        ).fetchall()
+    indexed = {}
+    for name, campaign, url, destination_path, filesize in rows:
+        if campaigns is not None and campaign not in campaigns:
+            continue
+        try:
+            filesize = int(filesize)
+        except (TypeError, ValueError):
+            filesize = -1
+        indexed[name] = IndexedGranule(name, campaign, url, destination_path, filesize)
+    return indexed
+
+
+def plan_sync(
+    data_dir: str,
+    index_filepaths: dict[str, str],
+    granule_filepaths: list[str],
+    campaigns: Optional[list[str]] = None,
+    inventory: Optional[Inventory] = None,
+    remote_sizes_filepath: Optional[str] = None,
+    max_workers: int = 32,
+) -> list[SyncItem]:
+    """
+    index_filepaths maps region (ANTARCTIC/ARCTIC) to geopackage.
+    Returns the delta, in catalog order, followed by removed granules.
+    """
+    t0 = time.time()
+    catalog = []
+    for granule_filepath in granule_filepaths:
+        catalog.extend(iter_granules(granule_filepath, campaigns))
+    institutions = {granule.institution for granule in catalog}
+    catalog_names = {granule.granule_name for granule in catalog}
+
+    # Compare against every indexed campaign from the catalog's institutions
+    # (or just the ones asked for), so that a campaign that has vanished
+    # from the catalog entirely is reported as removed.
+    indexed = {}
+    for region, index_filepath in index_filepaths.items():
+        indexed[region] = load_indexed(
+            index_filepath, institutions, None if campaigns is None else set(campaigns)
+        )
+    remote_sizes = load_remote_sizes(remote_sizes_filepath)
+    local_sizes = local_filesizes(
+        [os.path.join(data_dir, granule.relative_filepath) for granule in catalog],
+        inventory,
+        max_workers,
+    )
+    t1 = time.time()
+    print(
+        "{:0.2f} s loading {} catalog granules, {} indexed granules, {} remote sizes".format(
+            t1 - t0,
+            len(catalog),
+            sum(len(region_indexed) for region_indexed in indexed.values()),
+            len(remote_sizes),
+        )
+    )
+
+    delta = []
+    for granule, local_size in zip(catalog, local_sizes):
+        indexed_granule = indexed.get(granule.region, {}).get(granule.granule_name)
+        remote_size = remote_sizes.get(granule.download_url)
+        if remote_size is None and local_size is None and indexed_granule is not None:
+            # Not downloaded, so any size in the index came from probing
+            if indexed_granule.filesize >= 0:
+                remote_size = indexed_granule.filesize
+
+        if indexed_granule is None:
+            kind = "new"
+        elif local_size is None:
+            kind = "missing_locally"
+        elif remote_size is not None and remote_size != local_size:
+            kind = "changed_size"
+        else:
+            continue
+        delta.append(
+            SyncItem(
+                kind,
+                granule.granule_name,
+                granule.region,
+                granule.campaign,
+                granule.relative_filepath,
+                local_size,
+                remote_size,
+                granule,
+            )
+        )
+
+    for region, region_indexed in indexed.items():
+        for name, indexed_granule in region_indexed.items():
+            if name in catalog_names:
+                continue
+            delta.append(
+                SyncItem(
+                    "removed_upstream",
+                    name,
+                    region,
+                    indexed_granule.campaign,
+                    indexed_granule.destination_path,
+                    None,
+                    None,
+                    None,
+                )
+            )
+    print("{:0.2f} s computing delta".format(time.time() - t1))
+    return delta
+
+
+def print_delta(delta: list[SyncItem]) -> None:
+    """
+    Summarize the delta by kind, and by campaign within each kind.
+    """
+    # kind -> campaign -> [num granules, num to download, bytes to download, num unknown size]
+    totals = collections.defaultdict(lambda: collections.defaultdict(lambda: [0, 0, 0, 0]))
+    for item in delta:
+        count = totals[item.kind][(item.region, item.campaign)]
+        count[0] += 1
+        if item.needs_download:
+            count[1] += 1
+            if item.remote_size is None:
+                count[3] += 1
+            else:
+                count[2] += item.remote_size
+
+    if len(delta) == 0:
+        print("Everything is in sync")
+        return
+
+    row_format = "{:<18} {:<10} {:<40} {:>10} {:>10} {:>16} {:>10}"
+    print(
+        row_format.format(
+            "kind", "region", "campaign", "granules", "download", "bytes", "unknown"
+        )
+    )
+    total = [0, 0, 0, 0]
+    for kind in delta_kinds:
+        for (region, campaign), count in sorted(totals[kind].items()):
+            print(row_format.format(kind, region, campaign, *count))
+            total = [tt + cc for tt, cc in zip(total, count)]
+    print(row_format.format("total", "", "", *total))
+    if total[3] > 0:
+        print(
+            f"Size unknown for {total[3]} granules to download; "
+            "probe_remote_sizes.py or --probe will fill them in"
+        )
+
+
+def write_granules(filepath: str, granules: list[Granule]) -> None:
+    """
+    Write granules to a .csv granule list, or a GranuleStore otherwise.
+    """
+    if filepath.endswith(".csv"):
+        write_granule_list(filepath, granules)
+    else:
+        store = GranuleStore(filepath)
+        store.clear()
+        store.write(granules)
+
+
+def probe_delta(delta: list[SyncItem], cache_filepath: str, max_workers: int) -> None:
+    """
+    Fill in remote_size for granules to be downloaded whose size isn't known.
+    """
+    to_probe = [
+        item for item in delta if item.needs_download and item.remote_size is None
+    ]
+    remote_granules = [
+        RemoteGranule(
+            item.granule_name,
+            item.campaign,
+            item.granule.download_method,
+            item.granule.download_url,
+            item.relative_filepath,
+            -1,
+        )
+        for item in to_probe
+    ]
+    results = probe_sizes(remote_granules, cache_filepath, 30 * 24 * 3600, max_workers)
+    for item in to_probe:
+        item.remote_size = results[item.granule.download_url].size
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "data_directory", help="Root directory for all QIceRadar-managed radargrams."
+    )
+    parser.add_argument(
+        "antarctic_index",
+        help="Geopackage database with metadata about Antarctic campaigns and granules",
+    )
+    parser.add_argument(
+        "arctic_index",
+        help="Geopackage database with metadata about Arctic campaigns and granules",
+    )
+
+    parser.add_argument(
+        "--granule-list",
+        nargs="+",
+        default=["../data/cresis_granules.sqlite"],
+        help="GranuleStore databases (or .csv granule lists) with the provider's catalog",
+    )
+    parser.add_argument(
+        "--campaign",
+        action="append",
+        dest="campaigns",
+        help="Only plan for granules from this campaign (may be repeated)",
+    )
+    parser.add_argument(
+        "--inventory",
+        help="Catalog written by scan_inventory.py; if given, local file sizes "
+        "are looked up there rather than stat-ing each granule",
+    )
+    parser.add_argument(
+        "--remote-sizes",
+        default="../data/remote_sizes.sqlite",
+        help="Cache written by probe_remote_sizes.py, used to detect changed files",
+    )
+    parser.add_argument(
+        "--probe",
+        action="store_true",
+        help="Ask the servers for the size of granules to download, if not already known",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=32,
+        help="Number of files to stat (or URLs to probe) concurrently",
+    )
+    parser.add_argument(
+        "--output",
+        help="Write the granules that need to be downloaded to this "
+        "granule list (.csv, or a GranuleStore otherwise)",
+    )
+    parser.add_argument(
+        "--populate-output",
+        help="Write every granule whose row in the granules table needs to be "
+        "added or updated (new, changed or missing) to this granule list",
+    )
+
+    args = parser.parse_args()
+    inventory = None if args.inventory is None else Inventory(args.inventory)
+
+    delta = plan_sync(
+        args.data_directory,
+        {"ANTARCTIC": args.antarctic_index, "ARCTIC": args.arctic_index},
+        args.granule_list,
+        args.campaigns,
+        inventory,
+        args.remote_sizes,
+        args.max_workers,
+    )
+    if args.probe:
+        probe_delta(delta, args.remote_sizes, args.max_workers)
+    print_delta(delta)
+
+    if args.output is not None:
+        to_download = [item.granule for item in delta if item.needs_download]
+        write_granules(args.output, to_download)
+        print(f"Wrote {len(to_download)} granules to download to {args.output}")
+    if args.populate_output is not None:
+        to_populate = [item.granule for item in delta if item.granule is not None]
+        write_granules(args.populate_output, to_populate)
+        print(f"Wrote {len(to_populate)} granules to populate to {args.populate_output}")
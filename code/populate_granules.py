@@ -3,61 +3,110 @@
 Update the granules table using generated index files and filesizes from locally downloaded radargrams.
 """
 
-import pathlib
+import collections
+import itertools
+import os
 import sqlite3
-
-from radar_wrangler_utils import read_granule_list
-
-
-def main(data_dir: str, antarctic_index: str, arctic_index: str) -> None:
-    granule_filepaths = [
-        "../data/cresis_granules.csv",
-    ]
-
+import time
+from typing import Optional
+
+from radar_wrangler_utils import iter_granules
+from radar_wrangler_utils.gpkg_utils import upsert_granule
+from radar_wrangler_utils.inventory_utils import Inventory, local_filesizes
+
+
+def main(
+    data_dir: str,
+    antarctic_index: str,
+    arctic_index: str,
+    granule_filepaths: list[str],
+    campaigns: Optional[list[str]] = None,
+    inventory: Optional[Inventory] = None,
+    batch_size: int = 10000,
+    max_workers: int = 32,
+) -> None:
+    """
+    Granules are handled batch_size at a time: sizes for the whole batch
+    are looked up at once (from the inventory, or by stat-ing in parallel),
+    then inserted with executemany. Each region's index is updated in a
+    single transaction, committed at the end.
+    """
     connections = {}
-    cursors = {}
     connections["ANTARCTIC"] = sqlite3.connect(antarctic_index)
     connections["ARCTIC"] = sqlite3.connect(arctic_index)
-    for region in ["ANTARCTIC", "ARCTIC"]:
-        cursors[region] = connections[region].cursor()
-        cursors[region].execute("PRAGMA foreign_keys = ON")
+    for connection in connections.values():
+        connection.execute("PRAGMA foreign_keys = ON")
 
+    # (region, campaign) -> [num granules, num missing]
+    counts = collections.defaultdict(lambda: [0, 0])
+    t0 = time.time()
     for granule_filepath in granule_filepaths:
-        granules = read_granule_list(granule_filepath)
-
-        for granule in granules:
-            dest_filepath = pathlib.Path(data_dir, granule.relative_filepath)
-            try:
-                filesize = dest_filepath.stat().st_size
-            except Exception:
-                # There are a handful of files that are listed in the CReSIS website
-                # but where the actual radargram gives
-                # "Forbidden: You don't have permission to access this resource".
-                # So, check that download was successful
-                print(f"Cannot find downloaded file {dest_filepath}")
-                filesize = -1
-
-            cursors[granule.region].execute(
-                "INSERT OR REPLACE INTO granules VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                [
-                    granule.granule_name,
-                    granule.institution,
-                    granule.campaign,
-                    granule.segment,
-                    granule.granule,
-                    granule.data_product,
-                    granule.data_format,
-                    granule.download_method,
-                    granule.download_url,
-                    granule.relative_filepath,
-                    str(filesize),
-                ],
-            )
-
-        connections[region].commit()
-
-    for _region, connection in connections.items():
+        granules = iter_granules(granule_filepath, campaigns)
+        while True:
+            batch = list(itertools.islice(granules, batch_size))
+            if len(batch) == 0:
+                break
+            dest_filepaths = [
+                os.path.join(data_dir, granule.relative_filepath) for granule in batch
+            ]
+            filesizes = local_filesizes(dest_filepaths, inventory, max_workers)
+
+            rows = collections.defaultdict(list)
+            for granule, filesize in zip(batch, filesizes):
+                count = counts[(granule.region, granule.campaign)]
+                count[0] += 1
+                if filesize is None:
+                    # There are a handful of files that are listed in the CReSIS website
+                    # but where the actual radargram gives
+                    # "Forbidden: You don't have permission to access this resource".
+                    # So, check that download was successful
+                    count[1] += 1
+                    filesize = -1
+                rows[granule.region].append(
+                    [
+                        granule.granule_name,
+                        granule.institution,
+                        granule.campaign,
+                        granule.segment,
+                        granule.granule,
+                        granule.data_product,
+                        granule.data_format,
+                        granule.download_method,
+                        granule.download_url,
+                        granule.relative_filepath,
+                        str(filesize),
+                    ]
+                )
+            for region, region_rows in rows.items():
+                connections[region].executemany(upsert_granule, region_rows)
+    t1 = time.time()
+
+    for connection in connections.values():
+        connection.commit()
         connection.close()
+    t2 = time.time()
+
+    num_granules = sum(count[0] for count in counts.values())
+    print(
+        "{:0.2f} s updating {} granules; {:0.2f} s committing".format(
+            t1 - t0, num_granules, t2 - t1
+        )
+    )
+    print_missing(counts)
+
+
+def print_missing(counts: dict[tuple[str, str], list[int]]) -> None:
+    """
+    Summarize which campaigns have granules that haven't been downloaded.
+    """
+    missing = [(key, count) for key, count in sorted(counts.items()) if count[1] > 0]
+    if len(missing) == 0:
+        print("All granules were found locally")
+        return
+    print("Granules that could not be found locally:")
+    print("{:<10} {:<40} {:>10} {:>10}".format("region", "campaign", "missing", "total"))
+    for (region, campaign), (total, num_missing) in missing:
+        print("{:<10} {:<40} {:>10} {:>10}".format(region, campaign, num_missing, total))
 
 
 if __name__ == "__main__":
@@ -77,6 +126,39 @@ if __name__ == "__main__":
         help="Geopackage database to update with metadata about Arctic campaigns and granules",
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "--granule-list",
+        nargs="+",
+        default=["../data/cresis_granules.sqlite"],
+        help="GranuleStore databases (or .csv granule lists) to load granules from",
+    )
+    parser.add_argument(
+        "--campaign",
+        action="append",
+        dest="campaigns",
+        help="Only update granules from this campaign (may be repeated)",
+    )
+    parser.add_argument(
+        "--inventory",
+        help="Catalog written by scan_inventory.py; if given, file sizes "
+        "are looked up there rather than stat-ing each granule",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=32,
+        help="Number of files to stat concurrently (without --inventory)",
+    )
 
-    main(args.data_directory, args.antarctic_index, args.arctic_index)
+    args = parser.parse_args()
+    inventory = None if args.inventory is None else Inventory(args.inventory)
+
+    main(
+        args.data_directory,
+        args.antarctic_index,
+        args.arctic_index,
+        args.granule_list,
+        args.campaigns,
+        inventory,
+        max_workers=args.max_workers,
+    )
@@ -0,0 +1,149 @@
+#! /usr/bin/env python3
+"""
+Fill in granules.filesize for radargrams that haven't been downloaded,
+by asking the server how big they are, rather than downloading them.
+The plugin uses these sizes to warn users before they start a download.
+
+How the size is found for each download method, and how results are
+cached, is described in radar_wrangler_utils/probe_utils.py.
+
+With --check-local, granules that have been downloaded are probed as well,
+and any whose local size differs from the remote size (e.g. a truncated
+download) are reported.
+"""
+
+import os
+import sqlite3
+from typing import Optional
+
+from radar_wrangler_utils.inventory_utils import Inventory, local_filesizes
+from radar_wrangler_utils.probe_utils import RemoteGranule, probe_sizes
+
+
+def load_granules(gpkg_filepath: str) -> list[RemoteGranule]:
+    with sqlite3.connect(gpkg_filepath) as connection:
+        rows = connection.execute(
+            "SELECT name, campaign, download_method, url, destination_path, filesize FROM granules"
+        ).fetchall()
+    granules = []
+    for name, campaign, download_method, url, destination_path, filesize in rows:
+        try:
+            filesize = int(filesize)
+        except (TypeError, ValueError):
+            filesize = -1
+        granules.append(
+            RemoteGranule(name, campaign, download_method, url, destination_path, filesize)
+        )
+    return granules
+
+
+def update_index(
+    data_dir: str,
+    gpkg_filepath: str,
+    cache_filepath: str,
+    max_age: float,
+    max_workers: int,
+    check_local: bool,
+    inventory: Optional[Inventory] = None,
+) -> None:
+    print(f"Updating granule sizes in {gpkg_filepath}")
+    granules = load_granules(gpkg_filepath)
+    if check_local:
+        to_probe = granules
+    else:
+        to_probe = [granule for granule in granules if granule.filesize < 0]
+    results = probe_sizes(to_probe, cache_filepath, max_age, max_workers)
+
+    updates = []
+    failures = {}
+    for granule in to_probe:
+        result = results[granule.url]
+        if result.size is None:
+            failures[result.status] = failures.get(result.status, 0) + 1
+        elif granule.filesize < 0:
+            updates.append((result.size, granule.name))
+
+    truncated = []
+    if check_local:
+        downloaded = [granule for granule in to_probe if granule.filesize >= 0]
+        local_sizes = local_filesizes(
+            [os.path.join(data_dir, granule.destination_path) for granule in downloaded],
+            inventory,
+            max_workers,
+        )
+        for granule, local_size in zip(downloaded, local_sizes):
+            remote_size = results[granule.url].size
+            if remote_size is None or local_size is None:
+                continue
+            if local_size != remote_size:
+                truncated.append((granule, local_size, remote_size))
+                # The table should hold the size the user will be downloading
+                updates.append((remote_size, granule.name))
+
+    with sqlite3.connect(gpkg_filepath) as connection:
+        connection.executemany("UPDATE granules SET filesize = ? WHERE name = ?", updates)
+    print(f"Updated filesize for {len(updates)} granules")
+
+    for status, count in sorted(failures.items()):
+        print(f"Size unknown for {count} granules: {status}")
+
+    if len(truncated) > 0:
+        print("Local files whose size doesn't match the remote file:")
+        print("{:>12} {:>12}  {}".format("local", "remote", "path"))
+        for granule, local_size, remote_size in truncated:
+            print(
+                "{:>12} {:>12}  {}".format(local_size, remote_size, granule.destination_path)
+            )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "data_directory", help="Root directory for all QIceRadar-managed radargrams."
+    )
+    parser.add_argument(
+        "indices",
+        nargs="+",
+        help="Geopackage databases whose granules table should be updated",
+    )
+    parser.add_argument(
+        "--cache",
+        default="../data/remote_sizes.sqlite",
+        help="sqlite database caching the results of previous probes",
+    )
+    parser.add_argument(
+        "--max-age-days",
+        type=float,
+        default=30,
+        help="Re-probe granules whose cached result is older than this",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=16,
+        help="Number of concurrent requests",
+    )
+    parser.add_argument(
+        "--check-local",
+        action="store_true",
+        help="Also probe downloaded granules, and report any whose size differs",
+    )
+    parser.add_argument(
+        "--inventory",
+        help="Catalog written by scan_inventory.py; used for local sizes with --check-local",
+    )
+    args = parser.parse_args()
+    inventory = None if args.inventory is None else Inventory(args.inventory)
+
+    for gpkg_filepath in args.indices:
+        update_index(
+            args.data_directory,
+            gpkg_filepath,
+            args.cache,
+            args.max_age_days * 24 * 3600,
+            args.max_workers,
+            args.check_local,
+            inventory,
+        )
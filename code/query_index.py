@@ -0,0 +1,102 @@
+#! /usr/bin/env python3
+"""
+Look up granules in a QIceRadar GeoPackage by location, without QGIS.
+
+Examples:
+~~~
+./query_index.py qiceradar_antarctic_index.gpkg bbox -- -1500000 -500000 -1400000 -400000
+./query_index.py qiceradar_antarctic_index.gpkg radius -- -1450000 -450000 5000
+./query_index.py --lonlat qiceradar_antarctic_index.gpkg nearest 110.0 -75.0
+~~~
+
+Coordinates are in the GeoPackage's CRS (EPSG:3031 for Antarctic,
+EPSG:3413 for Arctic) unless --lonlat is given.
+"""
+
+import time
+
+import pyproj
+
+from radar_wrangler_utils import TrackIndex
+
+
+def print_matches(matches) -> None:
+    for match in matches:
+        if match.distance is None:
+            print(f"{match.name}\t{match.relative_path}")
+        else:
+            print(f"{match.name}\t{match.relative_path}\t{match.distance:0.1f}")
+    print(f"{len(matches)} matching granules")
+
+
+def main(args) -> None:
+    index = TrackIndex(args.gpkg_filepath, use_cache=not args.no_cache, verbose=True)
+
+    if args.lonlat:
+        if index.srs_id is None:
+            raise Exception(f"No geometry found in {args.gpkg_filepath}")
+        transformer = pyproj.Transformer.from_crs("EPSG:4326", f"EPSG:{index.srs_id}", always_xy=True)
+
+        def project(xx, yy):
+            return transformer.transform(xx, yy)
+
+    else:
+
+        def project(xx, yy):
+            return xx, yy
+
+    t0 = time.time()
+    if args.query == "bbox":
+        xmin, ymin = project(args.xmin, args.ymin)
+        xmax, ymax = project(args.xmax, args.ymax)
+        # Projecting a lon/lat box doesn't preserve corner ordering
+        matches = index.query_bbox(min(xmin, xmax), min(ymin, ymax), max(xmin, xmax), max(ymin, ymax))
+    elif args.query == "radius":
+        xx, yy = project(args.x, args.y)
+        matches = index.query_radius(xx, yy, args.radius)
+    elif args.query == "nearest":
+        xx, yy = project(args.x, args.y)
+        matches = index.query_nearest(xx, yy, args.max_distance)
+    else:
+        raise Exception(f"Unrecognized query: {args.query}")
+    dt = time.time() - t0
+
+    print_matches(matches)
+    print("{:0.4f} s for {} query".format(dt, args.query))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("gpkg_filepath", help="GeoPackage created by create_geopackage_index")
+    parser.add_argument(
+        "--lonlat",
+        action="store_true",
+        help="Input coordinates are longitude/latitude, rather than the index's CRS",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Don't read or write the cached STRtree next to the GeoPackage",
+    )
+    subparsers = parser.add_subparsers(dest="query", required=True)
+
+    bbox_parser = subparsers.add_parser("bbox", help="Granules passing through a box")
+    bbox_parser.add_argument("xmin", type=float)
+    bbox_parser.add_argument("ymin", type=float)
+    bbox_parser.add_argument("xmax", type=float)
+    bbox_parser.add_argument("ymax", type=float)
+
+    radius_parser = subparsers.add_parser("radius", help="Granules within radius of a point")
+    radius_parser.add_argument("x", type=float)
+    radius_parser.add_argument("y", type=float)
+    radius_parser.add_argument("radius", type=float, help="in meters")
+
+    nearest_parser = subparsers.add_parser("nearest", help="Closest granule to a point")
+    nearest_parser.add_argument("x", type=float)
+    nearest_parser.add_argument("y", type=float)
+    nearest_parser.add_argument("--max-distance", type=float, default=None, help="in meters")
+
+    args = parser.parse_args()
+    main(args)
@@ -25,6 +25,25 @@ def count_skip_lines(filepath):
     return skip_lines
 
 
+def segments_to_mask(segments, length):
+    """
+    Boolean mask that is True for every index covered by one of the
+    inclusive (start, end) ranges in segments, e.g. the BEDMAP1 ranges
+    in bm1_matched_segments.json that were exported by detangle_bedmap.
+
+    Uses a difference array (+1 at each start, -1 after each end), so
+    this is linear in the number of points, and overlapping ranges are fine.
+    """
+    boundaries = np.zeros(length + 1, dtype=int)
+    if len(segments) > 0:
+        segments = np.asarray(segments, dtype=int)
+        starts = np.clip(segments[:, 0], 0, length)
+        ends = np.clip(segments[:, 1] + 1, 0, length)
+        np.add.at(boundaries, starts, 1)
+        np.add.at(boundaries, ends, -1)
+    return np.cumsum(boundaries[:-1]) > 0
+
+
 def subsample_tracks(lats, lons, min_spacing):
     """
     Subsample the input coordinates so sequential points are separated by at least min_spacing.
@@ -88,6 +107,41 @@ def subsample_tracks_uniform(xx, yy, min_spacing):
     return xx[keep_idxs], yy[keep_idxs]
 
 
+def grid_cell_keys(xx, yy, cell_size):
+    """
+    Integer key identifying the cell_size x cell_size grid cell that each
+    point falls in (in the input coordinate system). xx and yy must be
+    non-empty and NaN-free.
+    """
+    ix = np.floor(xx / cell_size).astype(np.int64)
+    iy = np.floor(yy / cell_size).astype(np.int64)
+    ix -= ix.min()
+    iy -= iy.min()
+    return ix * (iy.max() + 1) + iy
+
+
+def subsample_grid(xx, yy, cell_size):
+    """
+    Keep one point (the first, in input order) from every cell_size x cell_size
+    grid cell, in the input coordinate system.
+
+    Unlike the along-track methods, this doesn't assume anything about the
+    ordering of the input points, so it is appropriate for compilations
+    (e.g. BEDMAP1) where points from different lines are interleaved.
+    """
+    good_idxs = ~(np.isnan(xx) | np.isnan(yy))
+    xx = xx[good_idxs]
+    yy = yy[good_idxs]
+    if len(xx) == 0:
+        return xx, yy
+
+    cell_keys = grid_cell_keys(xx, yy, cell_size)
+    _, keep_idxs = np.unique(cell_keys, return_index=True)
+    # np.unique orders by key; restore the input ordering
+    keep_idxs.sort()
+    return xx[keep_idxs], yy[keep_idxs]
+
+
 def subsample_tracks_rdp(xx, yy, epsilon):
     """
     Use RDP algorithm to subsample the points, guaranteeing no point's error will be more than epsilon
@@ -1 +1,9 @@
-from .index_utils import Granule, read_granule_list, write_granule_list
+from .index_utils import (
+    Granule,
+    GranuleStore,
+    iter_granules,
+    open_granule_store,
+    read_granule_list,
+    write_granule_list,
+)
+from .track_index import TrackIndex, TrackMatch
@@ -0,0 +1,145 @@
+"""
+Streaming HTTP downloads, done in-process rather than by running
+wget/curl (and then mv) for every file.
+
+A Fetcher keeps a pooled requests.Session, so consecutive downloads
+from the same server re-use the connection. Each file is streamed to
+a hidden temporary file in the destination directory, then renamed into
+place, so an interrupted download never leaves a partial file under the
+final name (and the rename never has to copy across filesystems).
+
+Every fetch returns a FetchResult rather than raising, so callers can
+decide what to record for failures.
+"""
+
+import hashlib
+import os
+import pathlib
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+default_chunk_size = 1024 * 1024
+
+
+@dataclass
+class FetchResult:
+    url: str
+    dest_filepath: str
+    status_code: Optional[int]  # None if the server never responded
+    num_bytes: int  # Bytes received (the file's size, if successful)
+    duration: float  # seconds
+    sha256: Optional[str]  # hex digest of the file; None unless successful
+    error: Optional[str]  # None if successful
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def summary(self) -> str:
+        if not self.ok:
+            return f"{self.url}: {self.error}"
+        rate = self.num_bytes / max(self.duration, 1e-6) / 1e6
+        return "{}: {} bytes in {:0.2f} s ({:0.1f} MB/s)".format(
+            pathlib.Path(self.dest_filepath).name, self.num_bytes, self.duration, rate
+        )
+
+
+class Fetcher:
+    """
+    Not thread-safe; use one Fetcher per thread.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = default_chunk_size,
+        pool_size: int = 10,
+        timeout: float = 120,
+        retries: int = 3,
+        headers: Optional[dict[str, str]] = None,
+    ):
+        """
+        retries applies to failures to connect, and to 5xx responses
+        (with exponential backoff); the timeout is per read, not for the
+        whole file.
+        """
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.session = requests.Session()
+        if headers is not None:
+            self.session.headers.update(headers)
+        retry = Retry(
+            total=retries,
+            backoff_factor=1,
+            status_forcelist=[500, 502, 503, 504],
+            allowed_methods=["GET"],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fetch(
+        self, url: str, dest_filepath: str, headers: Optional[dict[str, str]] = None
+    ) -> FetchResult:
+        """
+        Download url to dest_filepath, creating its directory if needed
+        and replacing any existing file.
+        """
+        t0 = time.time()
+        dest_dir = os.path.dirname(os.path.abspath(dest_filepath))
+        status_code = None
+        num_bytes = 0
+        checksum = hashlib.sha256()
+        temp_filepath = None
+        error = None
+        try:
+            os.makedirs(dest_dir, exist_ok=True)
+            with self.session.get(
+                url, headers=headers, stream=True, timeout=self.timeout
+            ) as response:
+                status_code = response.status_code
+                if status_code != 200:
+                    error = f"HTTP {status_code}"
+                else:
+                    # Not tempfile, which would give the downloaded file 0600 permissions
+                    temp_filepath = os.path.join(
+                        dest_dir,
+                        f".{os.path.basename(dest_filepath)}.{uuid.uuid4().hex}.part",
+                    )
+                    with open(temp_filepath, "xb") as temp_file:
+                        for chunk in response.iter_content(chunk_size=self.chunk_size):
+                            temp_file.write(chunk)
+                            checksum.update(chunk)
+                            num_bytes += len(chunk)
+                    expected_bytes = response.headers.get("Content-Length")
+                    # Content-Length is the compressed size if the server used gzip
+                    if (
+                        expected_bytes is not None
+                        and "Content-Encoding" not in response.headers
+                        and int(expected_bytes) != num_bytes
+                    ):
+                        error = f"Truncated: got {num_bytes} of {expected_bytes} bytes"
+            if error is None:
+                os.replace(temp_filepath, dest_filepath)
+        except Exception as ex:
+            error = f"{type(ex).__name__}: {ex}"
+
+        if error is not None and temp_filepath is not None and os.path.exists(temp_filepath):
+            os.remove(temp_filepath)
+        return FetchResult(
+            url,
+            dest_filepath,
+            status_code,
+            num_bytes,
+            time.time() - t0,
+            checksum.hexdigest() if error is None else None,
+            error,
+        )
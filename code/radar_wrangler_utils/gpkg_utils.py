@@ -0,0 +1,150 @@
+"""
+Utilities for reading (and writing) the QIceRadar GeoPackage directly with sqlite3,
+without going through OGR/QGIS.
+"""
+
+import sqlite3
+import struct
+from dataclasses import dataclass
+
+# Size of the envelope that follows the fixed 8-byte GeoPackage geometry
+# header, indexed by the envelope contents indicator (bits 1-3 of flags).
+# See http://www.geopackage.org/spec/#gpb_format
+ENVELOPE_SIZES = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}
+
+# Colors used when styling campaign layers, keyed by availability.
+availability_colors = {
+    # Sometimes, it's useful to just have all black
+    # "s": "0,0,0",
+    # "a": "0,0,0",
+    # "u": "0,0,0",
+    "s": "31,120,188,255",  # blue for available and supported
+    "a": "136,136,136,255",  # grey for unsupported
+    "u": "251,154,153,255",  # Salmon for unavailable data
+}
+
+# Table holding every campaign's features, for the single-layer index.
+# (See create_geopackage_index.add_merged_layer)
+merged_layer_name = "all_campaigns"
+
+region_crs = {
+    "arctic": "EPSG:3413",
+    "antarctic": "EPSG:3031",
+}
+
+
+# Every script that writes to the granules table should use this.
+# Like INSERT OR REPLACE, except that a granule that hasn't been downloaded
+# (filesize < 0) keeps its existing filesize (e.g. from probe_remote_sizes.py), if known.
+upsert_granule = """
+INSERT INTO granules VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (name) DO UPDATE SET
+    institution = excluded.institution,
+    campaign = excluded.campaign,
+    segment = excluded.segment,
+    granule = excluded.granule,
+    data_product = excluded.data_product,
+    data_format = excluded.data_format,
+    download_method = excluded.download_method,
+    url = excluded.url,
+    destination_path = excluded.destination_path,
+    filesize = CASE
+        WHEN CAST(excluded.filesize AS INTEGER) >= 0 THEN excluded.filesize
+        ELSE granules.filesize
+    END
+"""
+
+
+@dataclass
+class CampaignMetadata:
+    institution: str
+    availability: str  # 's'upported, 'a'vailable, 'u'navailable
+    geometry_type: str  # e.g. LINESTRING, MULTIPOINT
+
+
+def list_geometry_tables(
+    connection: sqlite3.Connection, include_merged: bool = False
+) -> list[tuple[str, str, str, int]]:
+    """
+    Return (table_name, column_name, geometry_type_name, srs_id) for every
+    table registered in gpkg_geometry_columns.
+
+    With the current database design, each of these is a campaign, other
+    than the optional merged table (skipped unless include_merged).
+    """
+    cursor = connection.execute(
+        "SELECT table_name, column_name, geometry_type_name, srs_id FROM gpkg_geometry_columns"
+    )
+    return [
+        tuple(row)
+        for row in cursor
+        if include_merged or row[0] != merged_layer_name
+    ]
+
+
+def table_columns(connection: sqlite3.Connection, table_name: str) -> list[str]:
+    cursor = connection.execute(f"PRAGMA table_info('{table_name}')")
+    return [row[1] for row in cursor]
+
+
+def gpkg_blob_to_wkb(blob: bytes):
+    """
+    Strip the GeoPackage header from a geometry blob, returning plain WKB.
+
+    Returns None for empty geometries.
+    """
+    if blob is None or blob[0:2] != b"GP":
+        return None
+    (flags,) = struct.unpack("B", blob[3:4])
+    if flags & 0b00010000:
+        # Empty geometry
+        return None
+    envelope_indicator = (flags >> 1) & 0b111
+    try:
+        envelope_size = ENVELOPE_SIZES[envelope_indicator]
+    except KeyError:
+        raise Exception(f"Invalid GeoPackage envelope indicator: {envelope_indicator}")
+    return blob[8 + envelope_size :]
+
+
+def load_campaign_metadata(gpkg_filepath: str) -> dict[str, CampaignMetadata]:
+    """
+    Map each campaign table to its institution, availability and geometry type.
+
+    This uses a single connection, and only reads the first row's
+    attributes from each table: every feature in a campaign table
+    shares institution and availability, and we don't want to pull
+    geometry blobs just to read them.
+    """
+    campaigns = {}
+    with sqlite3.connect(gpkg_filepath) as connection:
+        for table_name, _, geometry_type, _ in list_geometry_tables(connection):
+            row = connection.execute(
+                f"SELECT institution, availability FROM '{table_name}' LIMIT 1"
+            ).fetchone()
+            if row is None:
+                print(f"Campaign table {table_name} is empty; skipping")
+                continue
+            institution, availability = row
+            campaigns[table_name] = CampaignMetadata(institution, availability, geometry_type)
+    return campaigns
+
+
+def group_campaigns(campaign_metadata: dict[str, CampaignMetadata]) -> dict[str, list[list[str]]]:
+    """
+    Dict mapping institution to [supported, available, unavailable]
+    campaign names, each sorted. Institutions are in alphabetical order.
+    """
+    institutions = sorted({metadata.institution for metadata in campaign_metadata.values()})
+    institution_campaigns = {inst: [[], [], []] for inst in institutions}
+    for campaign, metadata in campaign_metadata.items():
+        if metadata.availability == "s":
+            institution_campaigns[metadata.institution][0].append(campaign)
+        elif metadata.availability == "a":
+            institution_campaigns[metadata.institution][1].append(campaign)
+        elif metadata.availability == "u":
+            institution_campaigns[metadata.institution][2].append(campaign)
+    for campaign_lists in institution_campaigns.values():
+        for campaigns in campaign_lists:
+            campaigns.sort()
+    return institution_campaigns
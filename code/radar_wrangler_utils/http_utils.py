@@ -0,0 +1,172 @@
+"""
+sqlite-backed cache of HTTP responses for the scripts that crawl data
+providers' listing pages to build the granule indices.
+
+Cached pages are re-used without contacting the server until they are
+older than their host's TTL. After that, they're revalidated with a
+conditional request (If-None-Match / If-Modified-Since), so a page that
+hasn't changed isn't transferred again.
+
+In offline mode, everything is served from the cache (and a page that
+isn't cached is an error), so index builds can be reproduced exactly.
+"""
+
+import json
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Seconds that a cached page is trusted before revalidating it with the server.
+# Archived datasets rarely change; directory listings for ongoing
+# projects are checked every time (which is cheap, if they're unchanged).
+default_ttl = 0
+host_ttls = {
+    "doi.pangaea.de": 30 * 24 * 3600,
+    "ramadda.data.bas.ac.uk": 30 * 24 * 3600,
+    "dataverse.tdl.org": 7 * 24 * 3600,
+    "data.cresis.ku.edu": 24 * 3600,
+    "n5eil01u.ecs.nsidc.org": 24 * 3600,
+}
+
+
+@dataclass
+class CachedResponse:
+    """
+    The parts of a requests.Response that the crawlers use.
+    """
+
+    url: str
+    status_code: int
+    headers: CaseInsensitiveDict  # Like requests, so lookups ignore case
+    content: bytes
+    fetch_time: float  # When the content was last confirmed by the server
+    from_cache: bool
+
+    @property
+    def text(self) -> str:
+        encoding = requests.utils.get_encoding_from_headers(self.headers)
+        return self.content.decode(encoding or "utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class HTTPCache:
+    def __init__(
+        self,
+        cache_filepath: str,
+        offline: bool = False,
+        ttls: Optional[dict[str, float]] = None,
+    ):
+        self.cache_filepath = cache_filepath
+        self.offline = offline
+        self.ttls = host_ttls if ttls is None else ttls
+        self.session = requests.Session()
+        with sqlite3.connect(self.cache_filepath) as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "url TEXT PRIMARY KEY, status_code INTEGER, headers TEXT, "
+                "content BLOB, etag TEXT, last_modified TEXT, fetch_time REAL)"
+            )
+
+    def ttl(self, url: str) -> float:
+        return self.ttls.get(urlparse(url).hostname, default_ttl)
+
+    def lookup(self, url: str) -> Optional[tuple[CachedResponse, Optional[str], Optional[str]]]:
+        with sqlite3.connect(self.cache_filepath) as connection:
+            row = connection.execute(
+                "SELECT status_code, headers, content, etag, last_modified, fetch_time "
+                "FROM responses WHERE url = ?",
+                [url],
+            ).fetchone()
+        if row is None:
+            return None
+        status_code, headers, content, etag, last_modified, fetch_time = row
+        response = CachedResponse(
+            url,
+            status_code,
+            CaseInsensitiveDict(json.loads(headers)),
+            content,
+            fetch_time,
+            True,
+        )
+        return response, etag, last_modified
+
+    def store(self, response: CachedResponse) -> None:
+        with sqlite3.connect(self.cache_filepath) as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    response.url,
+                    response.status_code,
+                    json.dumps(dict(response.headers)),
+                    response.content,
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    response.fetch_time,
+                ],
+            )
+
+    def get(self, url: str, headers: Optional[dict[str, str]] = None) -> CachedResponse:
+        """
+        GET url, using the cached copy if it is fresh (or still valid).
+        Only successful responses are cached.
+
+        headers (e.g. Authorization) are sent with the request, but are
+        not part of the cache key.
+        """
+        cached = self.lookup(url)
+        if self.offline:
+            if cached is None:
+                raise Exception(f"{url} is not in {self.cache_filepath} (offline mode)")
+            return cached[0]
+
+        request_headers = dict(headers or {})
+        if cached is not None:
+            cached_response, etag, last_modified = cached
+            if time.time() - cached_response.fetch_time < self.ttl(url):
+                return cached_response
+            if etag is not None:
+                request_headers["If-None-Match"] = etag
+            if last_modified is not None:
+                request_headers["If-Modified-Since"] = last_modified
+
+        resp = self.session.get(url, headers=request_headers, timeout=120)
+        if resp.status_code == 304 and cached is not None:
+            cached_response.fetch_time = time.time()
+            self.store(cached_response)
+            return cached_response
+
+        response = CachedResponse(
+            url,
+            resp.status_code,
+            CaseInsensitiveDict(resp.headers),
+            resp.content,
+            time.time(),
+            False,
+        )
+        if resp.status_code == 200:
+            self.store(response)
+        return response
+
+
+def add_http_cache_arguments(parser, default_cache: str = "../data/http_cache.sqlite") -> None:
+    parser.add_argument(
+        "--http-cache",
+        default=default_cache,
+        help="sqlite database caching the listing pages fetched while crawling",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Only use pages from --http-cache; never contact the servers",
+    )
+
+
+def http_cache_from_args(args) -> HTTPCache:
+    return HTTPCache(args.http_cache, args.offline)
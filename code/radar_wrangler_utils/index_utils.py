@@ -1,14 +1,34 @@
 """
-Utilities for reading and writing the CSV index of granules.
+Utilities for reading and writing the index of granules.
+
+The index is stored in a sqlite table (GranuleStore), which can be queried
+by campaign/region and iterated over lazily, without loading every row.
+The original CSV format is still supported for import/export.
 """
 
 import csv
-
+import os
+import sqlite3
 from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
 
 
 @dataclass
 class Granule:
+    # There can be hundreds of thousands of these, so avoid a per-instance dict.
+    __slots__ = (
+        "granule_name",
+        "region",
+        "institution",
+        "campaign",
+        "segment",
+        "granule",
+        "data_product",
+        "data_format",
+        "relative_filepath",
+        "download_url",
+        "download_method",
+    )
     granule_name: str  # Must be unique; primary key in database
     region: str  # ANTARCTIC or ARCTIC
     institution: str
@@ -23,20 +43,191 @@ class Granule:
     download_method: str  # e.g. curl, wget, nsidc
 
 
-def write_granule_list(index_filepath: str, cresis_granules: list[Granule]) -> None:
-    with open(index_filepath, 'w', newline='') as fp:
-        fields = [field.name for field in Granule.__dataclass_fields__.values()]
-        csv_writer = csv.DictWriter(fp, fieldnames=fields)
-        csv_writer.writeheader()
+granule_fields = list(Granule.__slots__)
+
 
+def write_granule_list(index_filepath: str, cresis_granules: Iterable[Granule]) -> None:
+    with open(index_filepath, 'w', newline='') as fp:
+        csv_writer = csv.writer(fp)
+        csv_writer.writerow(granule_fields)
         for granule in cresis_granules:
-            csv_writer.writerow(granule.__dict__)
+            csv_writer.writerow([getattr(granule, field) for field in granule_fields])
 
 
-def read_granule_list(index_filepath: str) -> list[Granule]:
-    print(f"read_granule_list: {index_filepath}")
-    granules = []
+def iter_granule_list(
+    index_filepath: str, campaigns: Optional[list[str]] = None
+) -> Iterator[Granule]:
+    """
+    Lazily read granules from a CSV index, optionally only those
+    belonging to one of campaigns.
+    """
     with open(index_filepath, 'r', newline='') as fp:
         csv_reader = csv.DictReader(fp)
-        granules = [Granule(**row) for row in csv_reader]
-    return granules
+        for row in csv_reader:
+            if campaigns is None or row["campaign"] in campaigns:
+                yield Granule(**row)
+
+
+def read_granule_list(index_filepath: str) -> list[Granule]:
+    print(f"read_granule_list: {index_filepath}")
+    return list(iter_granule_list(index_filepath))
+
+
+class GranuleStore:
+    """
+    Index of granules, stored in a sqlite table with one column per
+    Granule field, and indexed by campaign.
+    """
+
+    table_name = "granule_list"
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        with sqlite3.connect(self.filepath) as connection:
+            columns = ", ".join(
+                f"{field} TEXT PRIMARY KEY" if field == "granule_name" else f"{field} TEXT"
+                for field in granule_fields
+            )
+            connection.execute(f"CREATE TABLE IF NOT EXISTS {self.table_name} ({columns})")
+            connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table_name}_campaign "
+                f"ON {self.table_name} (campaign)"
+            )
+
+    @staticmethod
+    def where_clause(
+        campaigns: Optional[list[str]] = None, region: Optional[str] = None
+    ) -> tuple[str, list[str]]:
+        conditions = []
+        params = []
+        if campaigns is not None:
+            conditions.append(f"campaign IN ({', '.join('?' for _ in campaigns)})")
+            params.extend(campaigns)
+        if region is not None:
+            conditions.append("region = ?")
+            params.append(region)
+        if len(conditions) == 0:
+            return "", params
+        return " WHERE " + " AND ".join(conditions), params
+
+    def write(self, granules: Iterable[Granule]) -> int:
+        """
+        Add (or replace, if granule_name already exists) granules, in a
+        single transaction. Returns the number of rows written.
+        """
+        placeholders = ", ".join("?" for _ in granule_fields)
+        rows = (
+            [getattr(granule, field) for field in granule_fields] for granule in granules
+        )
+        with sqlite3.connect(self.filepath) as connection:
+            cursor = connection.executemany(
+                f"INSERT OR REPLACE INTO {self.table_name} VALUES ({placeholders})", rows
+            )
+            return cursor.rowcount
+
+    def clear(self) -> None:
+        with sqlite3.connect(self.filepath) as connection:
+            connection.execute(f"DELETE FROM {self.table_name}")
+
+    def count(
+        self, campaigns: Optional[list[str]] = None, region: Optional[str] = None
+    ) -> int:
+        where, params = self.where_clause(campaigns, region)
+        with sqlite3.connect(self.filepath) as connection:
+            result = connection.execute(
+                f"SELECT COUNT(*) FROM {self.table_name}{where}", params
+            )
+            return result.fetchone()[0]
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def campaigns(self) -> list[str]:
+        with sqlite3.connect(self.filepath) as connection:
+            result = connection.execute(
+                f"SELECT DISTINCT campaign FROM {self.table_name} ORDER BY campaign"
+            )
+            return [row[0] for row in result]
+
+    def granules(
+        self,
+        campaigns: Optional[list[str]] = None,
+        region: Optional[str] = None,
+        batch_size: int = 10000,
+    ) -> Iterator[Granule]:
+        """
+        Lazily yield granules (in the order they were added), optionally
+        only those in one of campaigns and/or region. Rows are fetched
+        batch_size at a time.
+        """
+        where, params = self.where_clause(campaigns, region)
+        connection = sqlite3.connect(self.filepath)
+        try:
+            cursor = connection.execute(
+                f"SELECT {', '.join(granule_fields)} FROM {self.table_name}{where} "
+                "ORDER BY rowid",
+                params,
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if len(rows) == 0:
+                    break
+                for row in rows:
+                    yield Granule(*row)
+        finally:
+            connection.close()
+
+    def __iter__(self) -> Iterator[Granule]:
+        return self.granules()
+
+    def import_csv(self, index_filepath: str) -> int:
+        return self.write(iter_granule_list(index_filepath))
+
+    def export_csv(
+        self,
+        index_filepath: str,
+        campaigns: Optional[list[str]] = None,
+        region: Optional[str] = None,
+    ) -> None:
+        write_granule_list(index_filepath, self.granules(campaigns, region))
+
+
+def legacy_csv_filepath(store_filepath: str) -> str:
+    """
+    Where the CSV index was written before there was a GranuleStore
+    (e.g. ../data/cresis_granules.csv for ../data/cresis_granules.sqlite).
+    """
+    return os.path.splitext(store_filepath)[0] + ".csv"
+
+
+def open_granule_store(store_filepath: str) -> GranuleStore:
+    """
+    Open a GranuleStore. If it is missing (or empty) but there is a CSV
+    index next to it, from before the GranuleStore existed, that is
+    imported first, so existing installs keep working.
+    """
+    is_new = not os.path.isfile(store_filepath)
+    store = GranuleStore(store_filepath)
+    csv_filepath = legacy_csv_filepath(store_filepath)
+    if (is_new or len(store) == 0) and os.path.isfile(csv_filepath):
+        num_granules = store.import_csv(csv_filepath)
+        print(f"Imported {num_granules} granules from {csv_filepath} into {store_filepath}")
+    return store
+
+
+def iter_granules(
+    index_filepath: str, campaigns: Optional[list[str]] = None
+) -> Iterator[Granule]:
+    """
+    Lazily read granules from either a GranuleStore or (if the filename
+    ends in .csv) a CSV index, optionally only those in one of campaigns.
+    """
+    if index_filepath.endswith(".csv"):
+        if not os.path.isfile(index_filepath):
+            raise Exception(f"No granule index at {index_filepath}")
+        return iter_granule_list(index_filepath, campaigns)
+    if not os.path.isfile(index_filepath) and not os.path.isfile(
+        legacy_csv_filepath(index_filepath)
+    ):
+        raise Exception(f"No granule index at {index_filepath}")
+    return open_granule_store(index_filepath).granules(campaigns)
@@ -0,0 +1,278 @@
+"""
+Readers for the text formats that point / flight track data is released in.
+
+With pyarrow (a dependency in pyproject.toml), CSVs are parsed with its
+multithreaded reader and BEDMAP coordinates can be cached as Parquet files.
+If it isn't installed, they fall back to pandas' C parser, without caching.
+"""
+
+import concurrent.futures
+import hashlib
+import io
+import os
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.csv
+
+    have_pyarrow = True
+except ImportError:
+    have_pyarrow = False
+
+
+@dataclass
+class CSVHeader:
+    comment_lines: list[str]  # Raw lines, including '#' and newline
+    metadata: dict[str, str]  # Parsed from "#key: value" comment lines
+    columns: list[str]
+
+    def find_column(self, label: str) -> str:
+        """
+        Return the first column whose name contains label.
+        (BEDMAP column names include units, e.g. "longitude (degree_east)")
+        """
+        for column in self.columns:
+            if label in column:
+                return column
+        raise Exception(f"No column matching {label} in {self.columns}")
+
+
+def parse_csv_header(fp) -> CSVHeader:
+    """
+    Consume the block of '#' comment lines at the top of a CSV file (opened
+    in binary mode), along with the line of column names that follows it,
+    leaving fp positioned at the first row of data.
+
+    Handles a leading UTF-8 byte order mark.
+    """
+    comment_lines = []
+    metadata = {}
+    line = fp.readline().decode("utf-8-sig")
+    while line.startswith("#"):
+        comment_lines.append(line)
+        key, sep, value = line[1:].partition(":")
+        if sep:
+            metadata[key.strip()] = value.strip()
+        line = fp.readline().decode("utf-8")
+    columns = [column.strip() for column in line.split(",")]
+    return CSVHeader(comment_lines, metadata, columns)
+
+
+def read_csv_header(filepath: str) -> CSVHeader:
+    with open(filepath, "rb") as fp:
+        return parse_csv_header(fp)
+
+
+def read_commented_csv(
+    filepath: str, labels: Optional[list[str]] = None
+) -> tuple[CSVHeader, dict[str, np.ndarray]]:
+    """
+    Read a CSV that may start with '#' comment lines, opening it once.
+
+    * labels: if given, only parse the first column whose name contains
+      each label, as float64; the returned dict is keyed by label.
+      Otherwise, all columns are parsed and keyed by name.
+
+    Empty fields (e.g. trailing rows of ",,,") are returned as NaN.
+    """
+    with open(filepath, "rb") as fp:
+        header = parse_csv_header(fp)
+        if labels is None:
+            columns = header.columns
+        else:
+            columns = [header.find_column(label) for label in labels]
+        column_types = {column: np.float64 for column in columns} if labels else None
+
+        if len(fp.peek(1)) == 0:
+            # Header, but no rows (pyarrow raises on empty input)
+            data = pd.DataFrame({column: np.array([], dtype=np.float64) for column in columns})
+        elif have_pyarrow:
+            table = pyarrow.csv.read_csv(
+                fp,
+                read_options=pyarrow.csv.ReadOptions(column_names=header.columns),
+                convert_options=pyarrow.csv.ConvertOptions(
+                    include_columns=columns,
+                    column_types=None
+                    if column_types is None
+                    else {column: pyarrow.float64() for column in columns},
+                ),
+            )
+            data = table.to_pandas()
+        else:
+            data = pd.read_csv(
+                fp,
+                header=None,
+                names=header.columns,
+                usecols=columns,
+                dtype=column_types,
+            )
+
+    keys = columns if labels is None else labels
+    return header, {key: data[column].to_numpy() for key, column in zip(keys, columns)}
+
+
+def parquet_cache_filepath(filepath: str, cache_dir: str) -> str:
+    """
+    Cache files are keyed on the source's absolute path, size and
+    modification time, so an updated CSV will not match a stale cache.
+    """
+    stat = os.stat(filepath)
+    key = f"{os.path.abspath(filepath)}:{stat.st_size}:{stat.st_mtime_ns}"
+    digest = hashlib.sha256(key.encode()).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(filepath))[0]
+    return os.path.join(cache_dir, f"{stem}_{digest}.parquet")
+
+
+def read_bedmap_lonlat(
+    filepath: str, cache_dir: Optional[str] = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Load just the longitude/latitude columns from a BEDMAP CSV, as float64.
+
+    If cache_dir is given (and pyarrow is available), the coordinates are
+    saved as Parquet the first time and later calls skip the CSV entirely.
+    """
+    cache_filepath = None
+    if cache_dir is not None and have_pyarrow:
+        cache_filepath = parquet_cache_filepath(filepath, cache_dir)
+        if os.path.exists(cache_filepath):
+            data = pd.read_parquet(cache_filepath)
+            return data["longitude"].to_numpy(), data["latitude"].to_numpy()
+
+    _, data = read_commented_csv(filepath, ["longitude", "latitude"])
+
+    if cache_filepath is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Written under a temporary name, so an interrupted run can't leave
+        # a truncated cache file that later runs would load.
+        temp_filepath = f"{cache_filepath}.{uuid.uuid4().hex}.tmp"
+        try:
+            pd.DataFrame(data).to_parquet(temp_filepath, index=False)
+            os.replace(temp_filepath, cache_filepath)
+        finally:
+            if os.path.exists(temp_filepath):
+                os.remove(temp_filepath)
+    return data["longitude"], data["latitude"]
+
+
+# Whitespace-separated fields in BAS_RESPAC_Radar.xyz
+respac_fields = [
+    "record",
+    "season",
+    "lon",
+    "lat",
+    "x",
+    "y",
+    "wgs84_height",
+    "tice",
+    "srfelev",
+    "bedelev",
+]
+
+
+def read_respac_seasons(filepath: str) -> dict[str, np.ndarray]:
+    """
+    Parse the BAS RESPAC .xyz file, which has comment lines starting
+    with '/', and a "Line <season>" row before each season's records.
+
+    Returns a dict mapping season (e.g. "7475") to an (N, 2) array of
+    lon, lat. Records without position data are dropped, and repeated
+    seasons are concatenated in file order.
+    """
+    # Only drop whole comment lines; pandas' comment= would also truncate
+    # any record containing a '/'.
+    with open(filepath, "r") as fp:
+        records = "".join(line for line in fp if not line.startswith("/"))
+    data = pd.read_csv(
+        io.StringIO(records),
+        sep=r"\s+",
+        header=None,
+        names=respac_fields,
+        usecols=["record", "season", "lon", "lat"],
+        dtype=str,
+    )
+    lon = pd.to_numeric(data["lon"], errors="coerce").to_numpy()
+    lat = pd.to_numeric(data["lat"], errors="coerce").to_numpy()
+    (marker_rows,) = np.nonzero((data["record"] == "Line").to_numpy())
+    season_labels = data["season"].to_numpy()[marker_rows]
+    has_position = ~(np.isnan(lon) | np.isnan(lat))
+
+    seasons = {}
+    block_ends = np.append(marker_rows[1:], len(data))
+    for season, start, end in zip(season_labels, marker_rows + 1, block_ends):
+        good = has_position[start:end]
+        points = np.column_stack([lon[start:end][good], lat[start:end][good]])
+        if season in seasons:
+            points = np.concatenate([seasons[season], points])
+        seasons[season] = points
+    return seasons
+
+
+def read_spri_lonlat(filepath: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Stanford's SPRI flight CSVs, with fields [CBD,LAT,LON,THK,SRF].
+    Most of them start with a byte order mark, and some end with
+    rows of the form ",,,,", which are dropped.
+    """
+    _, data = read_commented_csv(filepath, ["LON", "LAT"])
+    good_idxs = ~(np.isnan(data["LON"]) | np.isnan(data["LAT"]))
+    return data["LON"][good_idxs], data["LAT"][good_idxs]
+
+
+# Whitespace-separated fields in the LVS .nav files (no header row)
+lvs_nav_fields = ["line", "trace", "lon", "lat", "alt"]
+
+
+def read_lvs_nav(filepath: str) -> tuple[np.ndarray, np.ndarray]:
+    # pyarrow can't split on runs of whitespace, so this always uses pandas.
+    data = pd.read_csv(
+        filepath,
+        sep=r"\s+",
+        header=None,
+        names=lvs_nav_fields,
+        usecols=["lon", "lat"],
+        dtype=np.float64,
+    )
+    return data["lon"].to_numpy(), data["lat"].to_numpy()
+
+
+@dataclass
+class PointBatch:
+    filepaths: list[str]
+    lon: np.ndarray
+    lat: np.ndarray
+    # Points from filepaths[i] are lon[offsets[i]:offsets[i+1]]
+    offsets: np.ndarray
+
+    def file_points(self, idx: int) -> tuple[np.ndarray, np.ndarray]:
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return self.lon[start:end], self.lat[start:end]
+
+
+def read_batch(
+    reader: Callable[[str], tuple[np.ndarray, np.ndarray]],
+    filepaths: list[str],
+    max_workers: Optional[int] = None,
+) -> PointBatch:
+    """
+    Load many small files with reader (e.g. read_spri_lonlat, read_lvs_nav)
+    in a thread pool, concatenating the results in the order of filepaths.
+
+    The parsers release the GIL for most of their work, and with small
+    files the time is dominated by opening/reading them, so threads help.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(reader, filepaths))
+    lengths = [len(lon) for lon, _ in results]
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(int)
+    if len(results) == 0:
+        return PointBatch([], np.array([]), np.array([]), offsets)
+    lon = np.concatenate([lon for lon, _ in results])
+    lat = np.concatenate([lat for _, lat in results])
+    return PointBatch(list(filepaths), lon, lat, offsets)
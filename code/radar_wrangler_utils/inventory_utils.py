@@ -0,0 +1,457 @@
+"""
+A catalog of every file under the RadarData / index directories, so the
+pipeline stages can look up what exists (and how big it is) without each
+of them re-walking the tree.
+
+The catalog is a sqlite database written by scan_inventory.py; it holds
+one "inventory" table, with a row per file under each scanned root.
+Any number of roots can share a single catalog.
+
+The downloaders also record the sha256 of each file they fetch in a
+"checksums" table, which scan_inventory.py --verify checks files against.
+That table isn't replaced by a re-scan; a checksum is only compared
+while the file still has the size and mtime it was downloaded with.
+"""
+
+import bisect
+import concurrent.futures
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class InventoryEntry:
+    relative_path: str  # relative to the scanned root, '/'-separated
+    size: int  # bytes
+    mtime_ns: int
+    # The rest are inferred from the path, assuming the
+    # {region}/{provider}/{campaign}/.../{segment}/{granule} layout
+    # used by the download scripts. Empty if they don't apply.
+    region: str
+    provider: str
+    campaign: str
+    segment: str
+    granule: str
+
+
+regions = ["ANTARCTIC", "ARCTIC"]
+
+
+def infer_fields(relative_path: str) -> tuple[str, str, str, str, str]:
+    """
+    Best-effort guess at (region, provider, campaign, segment, granule)
+    for a file, based only on its path.
+
+    * segment is the directory containing the file, if it is nested below
+      the campaign directory; otherwise, the file's stem.
+    * granule is the trailing number of the filename, if any
+      (e.g. "007" for Data_20021212_01_007.nc)
+    """
+    parts = relative_path.split("/")
+    if len(parts) < 4 or parts[0] not in regions:
+        return "", "", "", "", ""
+    region, provider, campaign = parts[0:3]
+    stem = os.path.splitext(parts[-1])[0]
+    if len(parts) > 4:
+        segment = parts[-2]
+    else:
+        segment = stem
+    mm = re.search("_(?P<granule>[0-9]+)$", stem)
+    granule = "" if mm is None else mm.group("granule")
+    return region, provider, campaign, segment, granule
+
+
+def scan_directory(directory: str) -> tuple[list[tuple[str, int, int]], list[str]]:
+    """
+    List a single directory, returning (name, size, mtime_ns) for each file
+    and the paths of its subdirectories.
+
+    Hidden files and directories (including the "._" files that macOS
+    leaves on external drives) are skipped, as are symlinks to directories.
+    """
+    files = []
+    subdirectories = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.is_file():
+                stat = entry.stat()
+                files.append((entry.name, stat.st_size, stat.st_mtime_ns))
+    return files, subdirectories
+
+
+def scan_tree(root: str, max_workers: Optional[int] = None) -> list[InventoryEntry]:
+    """
+    Walk everything under root, one directory level at a time, listing
+    all directories at each level in parallel.
+
+    On network filesystems most of the time is spent waiting on the
+    server, so using threads lets many requests be outstanding at once.
+    """
+    root = os.path.abspath(root)
+    entries = []
+    frontier = [root]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while len(frontier) > 0:
+            next_frontier = []
+            for directory, (files, subdirectories) in zip(
+                frontier, executor.map(scan_directory, frontier)
+            ):
+                relative_dir = os.path.relpath(directory, root).replace(os.sep, "/")
+                for name, size, mtime_ns in files:
+                    if relative_dir == ".":
+                        relative_path = name
+                    else:
+                        relative_path = f"{relative_dir}/{name}"
+                    entries.append(
+                        InventoryEntry(
+                            relative_path, size, mtime_ns, *infer_fields(relative_path)
+                        )
+                    )
+                next_frontier.extend(subdirectories)
+            frontier = next_frontier
+    entries.sort(key=lambda entry: entry.relative_path)
+    return entries
+
+
+def create_tables(connection: sqlite3.Connection) -> None:
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS inventory_roots (
+            root TEXT PRIMARY KEY,
+            scan_time REAL,
+            num_files INTEGER
+        )"""
+    )
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS inventory (
+            root TEXT,
+            relative_path TEXT,
+            size INTEGER,
+            mtime_ns INTEGER,
+            region TEXT,
+            provider TEXT,
+            campaign TEXT,
+            segment TEXT,
+            granule TEXT,
+            PRIMARY KEY (root, relative_path)
+        )"""
+    )
+    connection.execute(
+        """CREATE TABLE IF NOT EXISTS checksums (
+            root TEXT,
+            relative_path TEXT,
+            size INTEGER,
+            mtime_ns INTEGER,
+            sha256 TEXT,
+            PRIMARY KEY (root, relative_path)
+        )"""
+    )
+
+
+def file_sha256(filepath: str, chunk_size: int = 2**20) -> str:
+    hasher = hashlib.sha256()
+    with open(filepath, "rb") as fp:
+        for chunk in iter(lambda: fp.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def verify_checksums(
+    catalog_filepath: str, root: str, max_workers: Optional[int] = None
+) -> tuple[int, list[tuple[str, str]]]:
+    """
+    Re-hash every file under root that has a recorded checksum.
+    Returns the number of files checked, and (relative_path, problem)
+    for each one that is missing or whose contents have changed.
+    Files modified since they were recorded are skipped.
+    """
+    root = os.path.abspath(root)
+    with sqlite3.connect(catalog_filepath) as connection:
+        create_tables(connection)
+        rows = connection.execute(
+            "SELECT relative_path, size, mtime_ns, sha256 FROM checksums WHERE root = ?",
+            [root],
+        ).fetchall()
+
+    def check(row) -> Optional[str]:
+        relative_path, size, mtime_ns, sha256 = row
+        filepath = os.path.join(root, relative_path)
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            return "missing"
+        if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+            return None
+        if file_sha256(filepath) != sha256:
+            return "checksum mismatch"
+        return None
+
+    # hashlib releases the GIL while hashing large chunks
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        problems = [
+            (row[0], problem)
+            for row, problem in zip(rows, executor.map(check, rows))
+            if problem is not None
+        ]
+    return len(rows), problems
+
+
+def write_inventory(
+    catalog_filepath: str, root: str, entries: list[InventoryEntry]
+) -> None:
+    """
+    Replace all of root's rows in the catalog with entries, in a single
+    transaction, so readers never see a partially-written scan.
+    """
+    root = os.path.abspath(root)
+    with sqlite3.connect(catalog_filepath) as connection:
+        create_tables(connection)
+        connection.execute("DELETE FROM inventory WHERE root = ?", [root])
+        connection.executemany(
+            "INSERT INTO inventory VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    root,
+                    entry.relative_path,
+                    entry.size,
+                    entry.mtime_ns,
+                    entry.region,
+                    entry.provider,
+                    entry.campaign,
+                    entry.segment,
+                    entry.granule,
+                )
+                for entry in entries
+            ],
+        )
+        connection.execute(
+            "INSERT OR REPLACE INTO inventory_roots VALUES (?, ?, ?)",
+            [root, time.time(), len(entries)],
+        )
+
+
+class Inventory:
+    """
+    In-memory view of a catalog, answering the questions that the pipeline
+    stages would otherwise ask the filesystem.
+
+    All paths are given and returned as regular (absolute or cwd-relative)
+    filesystem paths; each one is looked up under the most specific scanned
+    root that contains it. Asking about a path that isn't under any scanned
+    root raises, rather than silently reporting that it doesn't exist.
+    """
+
+    def __init__(self, catalog_filepath: str):
+        if not os.path.isfile(catalog_filepath):
+            raise Exception(
+                f"No inventory catalog at {catalog_filepath}; run scan_inventory.py"
+            )
+        self.catalog_filepath = catalog_filepath
+        # filepath -> (size, mtime_ns)
+        self.files: dict[str, tuple[int, int]] = {}
+        with sqlite3.connect(catalog_filepath) as connection:
+            self.roots = [
+                row[0] for row in connection.execute("SELECT root FROM inventory_roots")
+            ]
+            self.roots.sort(key=len)
+            for root in self.roots:
+                rows = connection.execute(
+                    "SELECT relative_path, size, mtime_ns FROM inventory WHERE root = ?",
+                    [root],
+                )
+                for relative_path, size, mtime_ns in rows:
+                    filepath = os.path.join(root, relative_path)
+                    # If one scanned root contains another, files below the
+                    # inner one come from its own (possibly more recent) scan.
+                    if self.find_root(filepath) == root:
+                        self.files[filepath] = (size, mtime_ns)
+        self.sorted_files = sorted(self.files)
+
+    def find_root(self, filepath: str) -> str:
+        for root in reversed(self.roots):
+            if filepath == root or filepath.startswith(root + os.sep):
+                return root
+        raise Exception(
+            f"{filepath} is not under any root in {self.catalog_filepath}; "
+            "add it with scan_inventory.py"
+        )
+
+    def normalize(self, filepath: str) -> str:
+        filepath = os.path.abspath(filepath)
+        self.find_root(filepath)
+        return filepath
+
+    def exists(self, filepath: str) -> bool:
+        return self.normalize(filepath) in self.files
+
+    def size(self, filepath: str) -> Optional[int]:
+        """Size of filepath in bytes, or None if it wasn't found."""
+        entry = self.files.get(self.normalize(filepath))
+        return None if entry is None else entry[0]
+
+    def files_under(self, directory: str, suffixes: tuple[str, ...] = ()) -> list[str]:
+        """
+        Sorted paths of all files below directory (recursively), optionally
+        restricted to those ending in one of suffixes.
+        """
+        prefix = self.normalize(directory) + os.sep
+        start = bisect.bisect_left(self.sorted_files, prefix)
+        filepaths = []
+        for filepath in self.sorted_files[start:]:
+            if not filepath.startswith(prefix):
+                break
+            if len(suffixes) == 0 or filepath.endswith(suffixes):
+                filepaths.append(filepath)
+        return filepaths
+
+    def listdir(self, directory: str) -> tuple[list[str], list[str]]:
+        """
+        Sorted names of (subdirectories, files) directly inside directory.
+        Empty directories aren't in the catalog, so aren't returned.
+        """
+        prefix = self.normalize(directory) + os.sep
+        subdirectories = set()
+        filenames = []
+        for filepath in self.files_under(directory):
+            name, sep, _ = filepath[len(prefix) :].partition(os.sep)
+            if sep:
+                subdirectories.add(name)
+            else:
+                filenames.append(name)
+        return sorted(subdirectories), filenames
+
+    def record(self, filepath: str, sha256: Optional[str] = None) -> Optional[int]:
+        """
+        Update the catalog after a stage creates, replaces or removes
+        filepath, so later stages see it without a re-scan.
+        If sha256 is given (e.g. from a download's FetchResult), it is
+        kept for scan_inventory.py --verify.
+        Returns the file's size, or None if it no longer exists.
+        """
+        filepath = self.normalize(filepath)
+        root = self.find_root(filepath)
+        relative_path = os.path.relpath(filepath, root).replace(os.sep, "/")
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            stat = None
+
+        with sqlite3.connect(self.catalog_filepath) as connection:
+            create_tables(connection)
+            # Any previous checksum is for a different version of the file
+            connection.execute(
+                "DELETE FROM checksums WHERE root = ? AND relative_path = ?",
+                [root, relative_path],
+            )
+            if stat is None:
+                connection.execute(
+                    "DELETE FROM inventory WHERE root = ? AND relative_path = ?",
+                    [root, relative_path],
+                )
+            else:
+                connection.execute(
+                    "INSERT OR REPLACE INTO inventory VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [root, relative_path, stat.st_size, stat.st_mtime_ns]
+                    + list(infer_fields(relative_path)),
+                )
+                if sha256 is not None:
+                    connection.execute(
+                        "INSERT INTO checksums VALUES (?, ?, ?, ?, ?)",
+                        [root, relative_path, stat.st_size, stat.st_mtime_ns, sha256],
+                    )
+
+        if stat is None:
+            if self.files.pop(filepath, None) is not None:
+                self.sorted_files.remove(filepath)
+            return None
+        if filepath not in self.files:
+            bisect.insort(self.sorted_files, filepath)
+        self.files[filepath] = (stat.st_size, stat.st_mtime_ns)
+        return stat.st_size
+
+
+def local_filesize(filepath: str, inventory: Optional[Inventory] = None) -> Optional[int]:
+    """
+    Size of an already-downloaded file, or None if it doesn't exist.
+    If an inventory is given, it is used instead of the filesystem.
+    """
+    if inventory is not None:
+        return inventory.size(filepath)
+    try:
+        return os.path.getsize(filepath)
+    except OSError:
+        return None
+
+
+def list_directory(
+    directory: str, inventory: Optional[Inventory] = None
+) -> tuple[list[str], list[str]]:
+    """
+    Sorted names of the (subdirectories, files) in directory, skipping
+    hidden ones. If an inventory is given, it is used instead of the
+    filesystem. A directory that doesn't exist has no contents.
+    """
+    if inventory is not None:
+        return inventory.listdir(directory)
+    if not os.path.isdir(directory):
+        return [], []
+    files, subdirectories = scan_directory(directory)
+    return (
+        sorted(os.path.basename(subdirectory) for subdirectory in subdirectories),
+        sorted(name for name, _, _ in files),
+    )
+
+
+def find_files(
+    directory: str, suffixes: tuple[str, ...] = (), inventory: Optional[Inventory] = None
+) -> list[str]:
+    """
+    Sorted paths of all non-hidden files below directory (recursively) that
+    end with one of suffixes (or all of them, if no suffixes are given).
+    If an inventory is given, it is used instead of the filesystem.
+    """
+    if inventory is not None:
+        return inventory.files_under(directory, suffixes)
+    filepaths = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames[:] = [dirname for dirname in dirnames if not dirname.startswith(".")]
+        for filename in filenames:
+            if filename.startswith("."):
+                continue
+            if len(suffixes) == 0 or filename.endswith(suffixes):
+                filepaths.append(os.path.join(dirpath, filename))
+    filepaths.sort()
+    return filepaths
+
+
+def local_filesizes(
+    filepaths: list[str],
+    inventory: Optional[Inventory] = None,
+    max_workers: Optional[int] = None,
+) -> list[Optional[int]]:
+    """
+    local_filesize for many files. Without an inventory, the files are
+    stat-ed in a thread pool, since on network storage each call is
+    dominated by waiting on the server. (They're handed out in chunks,
+    since the per-task overhead is larger than a local stat.)
+    """
+    if inventory is not None:
+        return [inventory.size(filepath) for filepath in filepaths]
+    chunk_size = 256
+    chunks = [
+        filepaths[start : start + chunk_size]
+        for start in range(0, len(filepaths), chunk_size)
+    ]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            lambda chunk: [local_filesize(filepath) for filepath in chunk], chunks
+        )
+        return [filesize for chunk_sizes in results for filesize in chunk_sizes]
@@ -0,0 +1,254 @@
+"""
+Finding out how big a granule's file is on the server, without
+downloading it. Used by probe_remote_sizes.py (to fill in
+granules.filesize) and plan_sync.py (to size the download).
+
+How the size is found depends on the download method:
+* wget / curl: HEAD request (falling back to the headers of a GET,
+  for servers that don't support HEAD)
+* wget, for files from the Texas Data Repository: Dataverse file metadata
+* nsidc: HEAD request with an Earthdata bearer token, taken from
+  $EARTHDATA_TOKEN or a "token" login for urs.earthdata.nasa.gov in ~/.netrc
+* aad_s3: S3 head_object, if boto3 is installed and the
+  {campaign}_ACCESS_KEY / {campaign}_SECRET_KEY credentials are set
+* usapdc_*: not supported; these require a human in the loop.
+
+Results are cached in a sqlite database (with the time they were probed)
+so re-runs only contact the servers for granules that are new or whose
+result is stale.
+"""
+
+import concurrent.futures
+import netrc
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import requests
+
+try:
+    import boto3
+
+    have_boto3 = True
+except ImportError:
+    have_boto3 = False
+
+dataverse_download_url = "https://dataverse.tdl.org/api/access/datafile/"
+dataverse_metadata_url = "https://dataverse.tdl.org/api/files/"
+
+aad_endpoint_url = "https://transfer.data.aad.gov.au"
+aad_bucket = "aadc-datasets"
+
+# Server responses that mean the file really isn't available, so are worth
+# caching. Others (e.g. 401 for expired credentials, 429 for rate limiting)
+# are likely to be different next time.
+definitive_statuses = ["HTTP 403", "HTTP 404", "HTTP 410"]
+
+
+@dataclass
+class RemoteGranule:
+    name: str
+    campaign: str
+    download_method: str
+    url: str
+    destination_path: str
+    filesize: int  # -1 if unknown
+
+
+@dataclass
+class ProbeResult:
+    url: str
+    size: Optional[int]  # None if it couldn't be determined
+    status: str  # "ok", or why the size is unknown
+    probe_time: float
+
+
+def get_earthdata_token() -> Optional[str]:
+    token = os.environ.get("EARTHDATA_TOKEN")
+    if token:
+        return token
+    try:
+        info = netrc.netrc()
+        username, _, password = info.authenticators("urs.earthdata.nasa.gov")
+        if username == "token":
+            return password
+    except Exception:
+        pass
+    return None
+
+
+# Neither requests.Session nor boto3's default session is guaranteed to be
+# thread-safe, so each thread gets its own (and re-uses its connections).
+thread_data = threading.local()
+
+
+def get_session() -> requests.Session:
+    if not hasattr(thread_data, "session"):
+        thread_data.session = requests.Session()
+    return thread_data.session
+
+
+def get_s3_client(campaign: str, access_key: str, secret_key: str):
+    if not hasattr(thread_data, "s3_clients"):
+        thread_data.boto_session = boto3.session.Session()
+        thread_data.s3_clients = {}
+    if campaign not in thread_data.s3_clients:
+        thread_data.s3_clients[campaign] = thread_data.boto_session.client(
+            "s3",
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            endpoint_url=aad_endpoint_url,
+        )
+    return thread_data.s3_clients[campaign]
+
+
+def probe_http(url: str, headers: Optional[dict[str, str]] = None) -> tuple[Optional[int], str]:
+    session = get_session()
+    response = session.head(url, headers=headers, allow_redirects=True, timeout=60)
+    if response.status_code == 405 or "Content-Length" not in response.headers:
+        # Some servers don't support HEAD (or omit the length);
+        # the headers of a streamed GET have it, without the body.
+        with session.get(
+            url, headers=headers, allow_redirects=True, stream=True, timeout=60
+        ) as response:
+            pass
+    if response.status_code != 200:
+        return None, f"HTTP {response.status_code}"
+    if "Content-Length" not in response.headers:
+        return None, "no Content-Length"
+    return int(response.headers["Content-Length"]), "ok"
+
+
+def probe_dataverse(url: str) -> tuple[Optional[int], str]:
+    fileid = url[len(dataverse_download_url) :]
+    response = get_session().get(f"{dataverse_metadata_url}{fileid}", timeout=60)
+    if response.status_code != 200:
+        return None, f"HTTP {response.status_code}"
+    return int(response.json()["data"]["dataFile"]["filesize"]), "ok"
+
+
+def probe_aad_s3(key: str, campaign: str) -> tuple[Optional[int], str]:
+    if not have_boto3:
+        return None, "boto3 not installed"
+    try:
+        access_key = os.environ[f"{campaign}_ACCESS_KEY"]
+        secret_key = os.environ[f"{campaign}_SECRET_KEY"]
+    except KeyError:
+        return None, f"no AAD credentials for {campaign}"
+    s3_client = get_s3_client(campaign, access_key, secret_key)
+    result = s3_client.head_object(Bucket=aad_bucket, Key=key)
+    return int(result["ContentLength"]), "ok"
+
+
+def probe_granule(granule: RemoteGranule, earthdata_token: Optional[str]) -> ProbeResult:
+    t0 = time.time()
+    try:
+        if granule.download_method in ["wget", "curl"]:
+            if granule.url.startswith(dataverse_download_url):
+                size, status = probe_dataverse(granule.url)
+            else:
+                size, status = probe_http(granule.url)
+        elif granule.download_method == "nsidc":
+            if earthdata_token is None:
+                size, status = None, "no Earthdata token"
+            else:
+                headers = {"Authorization": f"Bearer {earthdata_token}"}
+                size, status = probe_http(granule.url, headers)
+        elif granule.download_method == "aad_s3":
+            size, status = probe_aad_s3(granule.url, granule.campaign)
+        else:
+            size, status = None, f"can't probe download method {granule.download_method}"
+    except Exception as ex:
+        size, status = None, f"{type(ex).__name__}: {ex}"
+    return ProbeResult(granule.url, size, status, t0)
+
+
+def load_cache(cache_filepath: str, max_age: float) -> dict[str, ProbeResult]:
+    """
+    Results probed within the last max_age seconds, keyed by URL.
+    """
+    with sqlite3.connect(cache_filepath) as connection:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS remote_sizes ("
+            "url TEXT PRIMARY KEY, size INTEGER, status TEXT, probe_time REAL)"
+        )
+        rows = connection.execute(
+            "SELECT url, size, status, probe_time FROM remote_sizes WHERE probe_time > ?",
+            [time.time() - max_age],
+        ).fetchall()
+    return {row[0]: ProbeResult(*row) for row in rows}
+
+
+def save_cache(cache_filepath: str, results: list[ProbeResult]) -> None:
+    """
+    Only sizes and definitive answers from the server (403, 404 or 410)
+    are cached; missing or rejected credentials, rate limiting and
+    network errors are retried next time.
+    """
+    with sqlite3.connect(cache_filepath) as connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO remote_sizes VALUES (?, ?, ?, ?)",
+            [
+                (result.url, result.size, result.status, result.probe_time)
+                for result in results
+                if result.size is not None or result.status in definitive_statuses
+            ],
+        )
+
+
+def probe_sizes(
+    granules: list[RemoteGranule],
+    cache_filepath: str,
+    max_age: float,
+    max_workers: int,
+) -> dict[str, ProbeResult]:
+    """
+    Look up the remote size of every granule, using cached results where
+    they're fresh enough, and probing the rest concurrently.
+    """
+    results = load_cache(cache_filepath, max_age)
+    todo = {}
+    for granule in granules:
+        if granule.url not in results and granule.url not in todo:
+            todo[granule.url] = granule
+    print(f"{len(results)} cached results; probing {len(todo)} URLs")
+    if len(todo) == 0:
+        return results
+
+    earthdata_token = get_earthdata_token()
+    t0 = time.time()
+    new_results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(probe_granule, granule, earthdata_token)
+            for granule in todo.values()
+        ]
+        for idx, future in enumerate(concurrent.futures.as_completed(futures)):
+            new_results.append(future.result())
+            # Save progress periodically, since probing can take a while
+            if len(new_results) >= 1000 or idx == len(futures) - 1:
+                save_cache(cache_filepath, new_results)
+                results.update({result.url: result for result in new_results})
+                new_results = []
+                print(
+                    "Probed {} / {} in {:0.2f} s".format(
+                        idx + 1, len(futures), time.time() - t0
+                    )
+                )
+    return results
+
+
+def load_remote_sizes(cache_filepath: Optional[str]) -> dict[str, int]:
+    """
+    Every size in the cache (however old), by URL.
+    """
+    if cache_filepath is None or not os.path.isfile(cache_filepath):
+        return {}
+    with sqlite3.connect(cache_filepath) as connection:
+        rows = connection.execute(
+            "SELECT url, size FROM remote_sizes WHERE size IS NOT NULL"
+        ).fetchall()
+    return dict(rows)
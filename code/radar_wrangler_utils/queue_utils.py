@@ -0,0 +1,216 @@
+"""
+sqlite-backed job queue, so several download workers (possibly on
+different hosts, sharing the database and the data directory) can split
+a large download between them.
+
+A worker claims jobs by taking a lease on them; the claim happens inside
+a BEGIN IMMEDIATE transaction, so two workers can never claim the same
+job. While a job is being worked on, keep_lease renews its lease in a
+background thread, so slow downloads aren't taken over; a worker that
+crashes stops renewing its leases, and once a lease expires the job can
+be claimed by another worker. Jobs that fail are retried until they've
+been attempted max_attempts times.
+
+NB: this relies on sqlite's file locking, which works on local disks and
+most SMB mounts, but is unreliable on some NFS configurations.
+"""
+
+import contextlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+# Job states
+pending = "pending"
+claimed = "claimed"
+done = "done"
+failed = "failed"
+
+
+@dataclass
+class Job:
+    job_id: str
+    payload: dict
+    attempts: int  # Including the current one
+    lease_expires: float
+
+
+class JobQueue:
+    def __init__(self, filepath: str, max_attempts: int = 3, timeout: float = 60):
+        """
+        timeout is how long to wait for another worker to release the
+        database lock, in seconds.
+        """
+        self.filepath = filepath
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        with self.connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, payload TEXT, state TEXT, worker TEXT, "
+                "lease_expires REAL, attempts INTEGER, last_error TEXT, updated REAL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_expires)"
+            )
+
+    def connect(self) -> sqlite3.Connection:
+        # Autocommit mode, so transactions are started explicitly
+        # with BEGIN IMMEDIATE where it matters.
+        return sqlite3.connect(self.filepath, timeout=self.timeout, isolation_level=None)
+
+    def enqueue(self, jobs: Iterable[tuple[str, dict]]) -> int:
+        """
+        Add (job_id, payload) pairs as pending jobs. Jobs that are already
+        in the queue (in any state) are left alone, so re-enqueueing the
+        same list is harmless. Returns the number of jobs added.
+        """
+        now = time.time()
+        rows = (
+            (job_id, json.dumps(payload), pending, None, 0, 0, None, now)
+            for job_id, payload in jobs
+        )
+        connection = self.connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            cursor = connection.executemany(
+                "INSERT OR IGNORE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            connection.execute("COMMIT")
+            return cursor.rowcount
+        finally:
+            connection.close()
+
+    def claim(self, worker: str, lease_seconds: float, num_jobs: int = 1) -> list[Job]:
+        """
+        Claim up to num_jobs jobs that are pending, or whose lease has
+        expired, for lease_seconds. Returns an empty list if there are none.
+        """
+        now = time.time()
+        lease_expires = now + lease_seconds
+        connection = self.connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            rows = connection.execute(
+                "SELECT job_id, payload, attempts FROM jobs "
+                "WHERE (state = ? OR (state = ? AND lease_expires < ?)) AND attempts < ? "
+                "ORDER BY rowid LIMIT ?",
+                [pending, claimed, now, self.max_attempts, num_jobs],
+            ).fetchall()
+            connection.executemany(
+                "UPDATE jobs SET state = ?, worker = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated = ? WHERE job_id = ?",
+                [(claimed, worker, lease_expires, now, row[0]) for row in rows],
+            )
+            # Expired leases on jobs that have run out of attempts are failures
+            connection.execute(
+                "UPDATE jobs SET state = ?, last_error = COALESCE(last_error, ?), updated = ? "
+                "WHERE state = ? AND lease_expires < ? AND attempts >= ?",
+                [failed, "lease expired", now, claimed, now, self.max_attempts],
+            )
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+        return [
+            Job(job_id, json.loads(payload), attempts + 1, lease_expires)
+            for job_id, payload, attempts in rows
+        ]
+
+    def update(self, job: Job, worker: str, sql: str, params: list) -> bool:
+        """
+        Run an UPDATE on job, but only if worker still holds its lease.
+        Returns whether it did.
+        """
+        with self.connect() as connection:
+            cursor = connection.execute(
+                f"{sql} WHERE job_id = ? AND state = ? AND worker = ?",
+                params + [job.job_id, claimed, worker],
+            )
+            return cursor.rowcount == 1
+
+    def renew(self, job: Job, worker: str, lease_seconds: float) -> bool:
+        job.lease_expires = time.time() + lease_seconds
+        return self.update(
+            job, worker, "UPDATE jobs SET lease_expires = ?", [job.lease_expires]
+        )
+
+    @contextlib.contextmanager
+    def keep_lease(self, job: Job, worker: str, lease_seconds: float):
+        """
+        Renew job's lease every lease_seconds / 3 until the with block exits.
+        """
+        stop = threading.Event()
+
+        def renew_until_stopped():
+            while not stop.wait(lease_seconds / 3):
+                try:
+                    renewed = self.renew(job, worker, lease_seconds)
+                except sqlite3.OperationalError as ex:
+                    # e.g. database locked for too long; try again next time
+                    print(f"Could not renew lease on {job.job_id}: {ex}")
+                    continue
+                if not renewed:
+                    print(f"Lost lease on {job.job_id}; another worker may take it over")
+                    return
+
+        thread = threading.Thread(target=renew_until_stopped, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, job: Job, worker: str) -> bool:
+        return self.update(
+            job,
+            worker,
+            "UPDATE jobs SET state = ?, last_error = NULL, updated = ?",
+            [done, time.time()],
+        )
+
+    def fail(self, job: Job, worker: str, error: str) -> bool:
+        """
+        Record the error; the job will be retried unless it has been
+        attempted max_attempts times.
+        """
+        state = failed if job.attempts >= self.max_attempts else pending
+        return self.update(
+            job,
+            worker,
+            "UPDATE jobs SET state = ?, last_error = ?, updated = ?",
+            [state, error, time.time()],
+        )
+
+    def retry_failed(self) -> int:
+        """
+        Give failed jobs another max_attempts attempts.
+        """
+        with self.connect() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET state = ?, attempts = 0, updated = ? WHERE state = ?",
+                [pending, time.time(), failed],
+            )
+            return cursor.rowcount
+
+    def counts(self) -> dict[str, int]:
+        with self.connect() as connection:
+            rows = connection.execute(
+                "SELECT state, COUNT(*) FROM jobs GROUP BY state"
+            ).fetchall()
+        return dict(rows)
+
+    def failures(self, limit: Optional[int] = None) -> list[tuple[str, int, str]]:
+        """
+        (job_id, attempts, last_error) for jobs that have failed.
+        """
+        sql = "SELECT job_id, attempts, last_error FROM jobs WHERE state = ? ORDER BY updated"
+        params = [failed]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self.connect() as connection:
+            return connection.execute(sql, params).fetchall()
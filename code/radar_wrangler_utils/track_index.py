@@ -0,0 +1,209 @@
+"""
+Spatial queries against the track geometry in a QIceRadar GeoPackage.
+
+Opening every campaign layer through OGR (or QGIS) in order to answer
+"which granules go through this box" is slow, so this reads the
+geometry blobs straight out of sqlite, bulk-loads them into a shapely
+STRtree, and caches the result next to the GeoPackage. The cache is
+keyed on the GeoPackage's mtime, so re-running create_geopackage_index
+invalidates it.
+"""
+
+import os
+import pathlib
+import pickle
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import shapely
+
+from .gpkg_utils import gpkg_blob_to_wkb, list_geometry_tables, table_columns
+
+# Bump this if the contents of the cache file change.
+CACHE_VERSION = 1
+
+
+@dataclass
+class TrackMatch:
+    name: str  # matches granules.name
+    campaign: str
+    institution: str
+    relative_path: str  # "" if no radargram is associated (e.g. BEDMAP)
+    distance: Optional[float] = None  # in index CRS units; None for bbox queries
+
+
+class TrackIndex:
+    """
+    In-memory STRtree over all track geometries in a single GeoPackage.
+
+    Coordinates for all queries are in the GeoPackage's CRS
+    (EPSG:3031 for Antarctic, EPSG:3413 for Arctic).
+
+    A track may be stored as several features (e.g. BEDMAP campaigns are
+    split into tiles); queries return each track (by name) at most once.
+    """
+
+    def __init__(
+        self,
+        gpkg_filepath: str,
+        cache_filepath: Optional[str] = None,
+        use_cache: bool = True,
+        verbose: bool = False,
+    ):
+        """
+        If verbose, print timings and any problems with the cache.
+        """
+        self.gpkg_filepath = gpkg_filepath
+        self.verbose = verbose
+        if cache_filepath is None:
+            cache_filepath = f"{gpkg_filepath}.tracks.pkl"
+        self.cache_filepath = cache_filepath
+
+        t0 = time.time()
+        data = None
+        if use_cache:
+            data = self._load_cache()
+        if data is None:
+            data = self._load_gpkg()
+            if use_cache:
+                self._save_cache(data)
+        t1 = time.time()
+
+        self.srs_id = data["srs_id"]
+        self.names = data["names"]
+        self.campaigns = data["campaigns"]
+        self.institutions = data["institutions"]
+        self.relative_paths = data["relative_paths"]
+        self.geometries = shapely.from_wkb(data["wkb"])
+        self.tree = shapely.STRtree(self.geometries)
+        t2 = time.time()
+        self.log(
+            "{:0.4f} s loading {} track geometries; {:0.4f} s building STRtree".format(
+                t1 - t0, len(self.names), t2 - t1
+            )
+        )
+
+    def log(self, msg: str) -> None:
+        if self.verbose:
+            print(msg)
+
+    def _gpkg_mtime(self) -> int:
+        return os.stat(self.gpkg_filepath).st_mtime_ns
+
+    def _load_cache(self):
+        if not pathlib.Path(self.cache_filepath).is_file():
+            return None
+        try:
+            with open(self.cache_filepath, "rb") as fp:
+                data = pickle.load(fp)
+        except Exception as ex:
+            self.log(f"Could not load track cache {self.cache_filepath}: {ex}")
+            return None
+        if data.get("version") != CACHE_VERSION or data.get("mtime") != self._gpkg_mtime():
+            self.log(f"Track cache {self.cache_filepath} is stale; regenerating")
+            return None
+        return data
+
+    def _save_cache(self, data) -> None:
+        try:
+            with open(self.cache_filepath, "wb") as fp:
+                pickle.dump(data, fp)
+        except OSError as ex:
+            # Not fatal; we just won't have a cache next time.
+            self.log(f"Could not write track cache {self.cache_filepath}: {ex}")
+
+    def _load_gpkg(self):
+        mtime = self._gpkg_mtime()
+        wkbs = []
+        names = []
+        campaigns = []
+        institutions = []
+        relative_paths = []
+        srs_ids = set()
+        with sqlite3.connect(self.gpkg_filepath) as connection:
+            for table_name, column_name, _, srs_id in list_geometry_tables(connection):
+                columns = table_columns(connection, table_name)
+                # BEDMAP layers don't have a relative_path.
+                path_column = "relative_path" if "relative_path" in columns else "''"
+                cursor = connection.execute(
+                    f"SELECT \"{column_name}\", name, campaign, institution, {path_column} FROM '{table_name}'"
+                )
+                srs_ids.add(srs_id)
+                for blob, name, campaign, institution, relative_path in cursor:
+                    wkb = gpkg_blob_to_wkb(blob)
+                    if wkb is None:
+                        continue
+                    wkbs.append(wkb)
+                    names.append(name)
+                    campaigns.append(campaign)
+                    institutions.append(institution)
+                    relative_paths.append(relative_path or "")
+
+        if len(srs_ids) > 1:
+            raise Exception(f"Expected a single CRS in {self.gpkg_filepath}; found {srs_ids}")
+        srs_id = srs_ids.pop() if len(srs_ids) == 1 else None
+
+        return {
+            "version": CACHE_VERSION,
+            "mtime": mtime,
+            "srs_id": srs_id,
+            "wkb": np.array(wkbs, dtype=object),
+            "names": np.array(names, dtype=object),
+            "campaigns": np.array(campaigns, dtype=object),
+            "institutions": np.array(institutions, dtype=object),
+            "relative_paths": np.array(relative_paths, dtype=object),
+        }
+
+    def _matches(self, idxs, distances=None) -> list[TrackMatch]:
+        """
+        One match per track name; since matches are sorted by distance
+        first, each track keeps its closest feature's distance.
+        """
+        if distances is None:
+            distances = [None for _ in idxs]
+        else:
+            order = np.argsort(distances, kind="stable")
+            idxs = idxs[order]
+            distances = [float(dd) for dd in distances[order]]
+        matches = []
+        seen_names = set()
+        for idx, dist in zip(idxs, distances):
+            name = self.names[idx]
+            if name in seen_names:
+                continue
+            seen_names.add(name)
+            matches.append(
+                TrackMatch(
+                    name,
+                    self.campaigns[idx],
+                    self.institutions[idx],
+                    self.relative_paths[idx],
+                    dist,
+                )
+            )
+        return matches
+
+    def query_bbox(self, xmin: float, ymin: float, xmax: float, ymax: float) -> list[TrackMatch]:
+        """Tracks that pass through the box (not just whose extents overlap it)."""
+        idxs = self.tree.query(shapely.box(xmin, ymin, xmax, ymax), predicate="intersects")
+        idxs.sort()
+        return self._matches(idxs)
+
+    def query_radius(self, xx: float, yy: float, radius: float) -> list[TrackMatch]:
+        """Tracks within radius of the point, sorted by distance."""
+        point = shapely.Point(xx, yy)
+        idxs = self.tree.query(point, predicate="dwithin", distance=radius)
+        distances = shapely.distance(self.geometries[idxs], point)
+        return self._matches(idxs, distances)
+
+    def query_nearest(self, xx: float, yy: float, max_distance: Optional[float] = None) -> list[TrackMatch]:
+        """
+        Closest track to the point. Returns multiple matches only if they
+        are equidistant; returns none if nothing is within max_distance.
+        """
+        point = shapely.Point(xx, yy)
+        idxs, distances = self.tree.query_nearest(point, max_distance=max_distance, return_distance=True)
+        return self._matches(idxs, distances)
@@ -32,19 +32,24 @@ Single zip from Zenodo. Same naming convention as ICECAP, but with instrument KH
 import os
 import pathlib
 import re
+from typing import Optional
 
+from radar_wrangler_utils.inventory_utils import Inventory, find_files
 
-def rearrange_files(directory):
+
+def rearrange_files(directory, inventory: Optional[Inventory] = None):
     """
     Find all UTIG netCDF files within input directory and sort them
     into directories based on PSTs.
+
+    If an inventory is given, files are found using it (and it is
+    updated with each move), rather than walking the directory.
     """
     print("Rearranging files in {}".format(directory))
     regex = "(?P<instrument>[0-9a-zA-Z]+)_(?P<year>[0-9]{4})(?P<doy>[0-9]{3})_(?P<project>[0-9a-zA-Z]+)_(?P<set>[0-9a-zA-Z]+)_(?P<transect>[0-9a-zA-Z]*)_(?P<granule>[0-9]*).nc"
-    for path in pathlib.Path(directory).rglob("*.nc"):
-        if path.name.startswith("."):
-            # Ignore the MAC extended attribute files
-            continue
+    # NB: find_files ignores the MAC extended attribute files
+    for filepath in find_files(directory, (".nc",), inventory):
+        path = pathlib.Path(filepath)
         mm = re.match(regex, path.name)
         if mm is None:
             print("netCDF file that doesn't match name regex: {}".format(path.name))
@@ -61,25 +66,28 @@ def rearrange_files(directory):
                 raise (ex)
         dest_filepath = os.path.join(pst_dir, path.name)
         # Don't move files that are already in the right spot
-        if dest_filepath == path.absolute().as_posix():
+        if os.path.abspath(dest_filepath) == os.path.abspath(filepath):
             continue
         print("{} -> {}".format(path.name, dest_filepath))
         os.rename(path.absolute(), dest_filepath)
+        if inventory is not None:
+            inventory.record(filepath)
+            inventory.record(dest_filepath)
 
 
-def main(data_directory):
+def main(data_directory, inventory: Optional[Inventory] = None):
     antarctic_dir = os.path.join(data_directory, "ANTARCTIC", "UTIG")
     for campaign in ["EAGLE", "OIA"]:
         campaign_dir = os.path.join(antarctic_dir, campaign)
-        rearrange_files(campaign_dir)
+        rearrange_files(campaign_dir, inventory)
 
     kopri_dir = os.path.join(data_directory, "ANTARCTIC", "KOPRI")
     for campaign in ["KRT1"]:
         campaign_dir = os.path.join(kopri_dir, campaign)
-        rearrange_files(campaign_dir)
+        rearrange_files(campaign_dir, inventory)
 
     dic_dir = os.path.join(data_directory, "ARCTIC", "UTIG", "2018_DIC")
-    rearrange_files(dic_dir)
+    rearrange_files(dic_dir, inventory)
 
 
 if __name__ == "__main__":
@@ -89,5 +97,11 @@ if __name__ == "__main__":
     parser.add_argument(
         "data_directory", help="Root directory for all QIceRadar-managed radargrams."
     )
+    parser.add_argument(
+        "--inventory",
+        help="Catalog written by scan_inventory.py; if given, it is used "
+        "(and kept up to date) instead of walking the directories",
+    )
     args = parser.parse_args()
-    main(args.data_directory)
+    inventory = None if args.inventory is None else Inventory(args.inventory)
+    main(args.data_directory, inventory)
@@ -0,0 +1,73 @@
+#! /usr/bin/env python3
+"""
+Walk the RadarData (and/or index) directories once, recording every file's
+size and modification time in a sqlite catalog.
+
+The download, extraction, index and populate scripts all accept
+`--inventory CATALOG`, and will then query the catalog rather than
+walking / stat-ing the filesystem themselves.
+
+With --verify, files whose sha256 was recorded when they were downloaded
+are re-hashed, and any that are missing or have changed are reported.
+"""
+
+import time
+
+from radar_wrangler_utils.inventory_utils import (
+    scan_tree,
+    verify_checksums,
+    write_inventory,
+)
+
+
+def main(catalog_filepath: str, roots: list[str], max_workers: int, verify: bool) -> None:
+    for root in roots:
+        print(f"Scanning {root}")
+        t0 = time.time()
+        entries = scan_tree(root, max_workers)
+        t1 = time.time()
+        write_inventory(catalog_filepath, root, entries)
+        t2 = time.time()
+        total_bytes = sum(entry.size for entry in entries)
+        print(
+            "{:0.2f} s scanning {} files ({:0.1f} GB); {:0.2f} s writing catalog".format(
+                t1 - t0, len(entries), total_bytes / 1e9, t2 - t1
+            )
+        )
+        if verify:
+            num_checked, problems = verify_checksums(catalog_filepath, root, max_workers)
+            print(
+                "{:0.2f} s verifying {} checksums; {} problems".format(
+                    time.time() - t2, num_checked, len(problems)
+                )
+            )
+            for relative_path, problem in problems:
+                print(f"  {relative_path}: {problem}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "catalog", help="sqlite database to write the inventory to (created if needed)"
+    )
+    parser.add_argument(
+        "roots",
+        nargs="+",
+        help="Directories to scan, e.g. the RadarData and index directories. "
+        "Each root's previous inventory is replaced.",
+    )
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        default=32,
+        help="Number of directories to list (or files to verify) concurrently",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Check downloaded files against the checksums recorded when they were fetched",
+    )
+    args = parser.parse_args()
+    main(args.catalog, args.roots, args.max_workers, args.verify)
@@ -18,8 +18,6 @@ export DYLD_INSERT_LIBRARIES=/Applications/${QGIS_VERSION}.app/Contents/MacOS/li
 HOWEVER, doing this makes other python stuff break.
 """
 
-import sqlite3
-
 from qgis.core import (
     QgsApplication,
     QgsCoordinateReferenceSystem,
@@ -31,80 +29,45 @@ from qgis.core import (
     QgsVectorLayer,
 )
 
+from radar_wrangler_utils.gpkg_utils import (
+    availability_colors,
+    group_campaigns,
+    load_campaign_metadata,
+    region_crs,
+)
+
 
 def style_gpkg_geometries(region: str, root_group, gpkg_filepath):
-    institutions = set()
-    campaigns = set()
-    campaign_availability = {}
-    with sqlite3.connect(gpkg_filepath) as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.execute("SELECT * FROM {}".format("gpkg_geometry_columns"))
-        for row in cursor:
-            campaigns.add(row["table_name"])  # I think this is also the primary key
-
-        for campaign in campaigns:
-            cursor = conn.execute("SELECT * FROM '{}'".format(campaign))
-            # NOTE: With the current database design, these tables only have one row.
-            for row in cursor:
-                institutions.add(row["institution"])
-                campaign_availability[campaign] = (
-                    row["institution"],
-                    row["availability"],
-                )
+    campaign_metadata = load_campaign_metadata(gpkg_filepath)
+    institutions = {metadata.institution for metadata in campaign_metadata.values()}
+    campaigns = set(campaign_metadata.keys())
 
     print("{} granules from {} institutions".format(len(campaigns), len(institutions)))
 
     # Create per-institution groups
-    institutions = list(institutions)
-    institutions.sort()
+    institution_campaigns = group_campaigns(campaign_metadata)
     institution_groups = {}
-    for institution in institutions:
+    for institution in institution_campaigns.keys():
         institution_groups[institution] = root_group.addGroup(institution)
         institution_groups[institution].setExpanded(False)
 
-    # Consider namedtuple for this list of lists?
-    # Dict mapping institution to list of [supported, available, unavailable] campaign names
-    institution_campaigns = {inst: [[], [], []] for inst in institutions}
-    for campaign, (institution, availability) in campaign_availability.items():
-        if availability == "s":
-            institution_campaigns[institution][0].append(campaign)
-        elif availability == "a":
-            institution_campaigns[institution][1].append(campaign)
-        elif availability == "u":
-            institution_campaigns[institution][2].append(campaign)
-
-    for institution, (
-        supported,
-        available,
-        unavailable,
-    ) in institution_campaigns.items():
-        supported.sort()
-        for campaign in supported:
-            add_campaign(
-                region, gpkg_filepath, institution_groups[institution], campaign, "s"
-            )
-        available.sort()
-        for campaign in available:
-            add_campaign(
-                region, gpkg_filepath, institution_groups[institution], campaign, "a"
-            )
-        unavailable.sort()
-        for campaign in unavailable:
-            add_campaign(
-                region, gpkg_filepath, institution_groups[institution], campaign, "u"
-            )
+    for institution, campaign_lists in institution_campaigns.items():
+        for availability, campaign_names in zip(["s", "a", "u"], campaign_lists):
+            for campaign in campaign_names:
+                add_campaign(
+                    region,
+                    gpkg_filepath,
+                    institution_groups[institution],
+                    campaign,
+                    availability,
+                    campaign_metadata[campaign].geometry_type,
+                )
 
 
-def add_campaign(region: str, gpkg_filepath, group, campaign, availability):
-    # Figure out whether it's points or lines
-    geometry = None
-    with sqlite3.connect(gpkg_filepath) as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.execute("SELECT * FROM {}".format("gpkg_geometry_columns"))
-        for row in cursor:
-            if row["table_name"] == campaign:
-                geometry = row["geometry_type_name"]
-                break
+def add_campaign(region: str, gpkg_filepath, group, campaign, availability, geometry):
+    """
+    * geometry: geometry_type_name from gpkg_geometry_columns; points or lines
+    """
     if geometry not in ["LINESTRING", "MULTIPOINT"]:
         print(
             "Unrecognized geometry {} for campaign {}; cannot style".format(
@@ -117,15 +80,7 @@ def add_campaign(region: str, gpkg_filepath, group, campaign, availability):
     uri = "file://{}|layername={}".format(gpkg_filepath, campaign)
     layer = QgsVectorLayer(uri, campaign, "ogr")
     # Add campaigns to the institution
-    colors = {
-        # Sometimes, it's useful to just have all black
-        # "s": "0,0,0",
-        # "a": "0,0,0",
-        # "u": "0,0,0",
-        "s": "31,120,188,255",  # blue for available and supported
-        "a": "136,136,136,255",  # grey for unsupported
-        "u": "251,154,153,255",  # Salmon for unavailable data
-    }
+    colors = availability_colors
     if geometry == "MULTIPOINT":
         # BEDMAP1 points are NOT in order, so we can't connect them with lines
         symbol = QgsMarkerSymbol.createSimple(
@@ -161,11 +116,9 @@ def add_campaign(region: str, gpkg_filepath, group, campaign, availability):
 
     renderer = QgsSingleSymbolRenderer(symbol)
     layer.setRenderer(renderer)
-    if region.lower() == "arctic":
-        crs = QgsCoordinateReferenceSystem("EPSG:3413")
-    elif region.lower() == "antarctic":
-        crs = QgsCoordinateReferenceSystem("EPSG:3031")
-    else:
+    try:
+        crs = QgsCoordinateReferenceSystem(region_crs[region.lower()])
+    except KeyError:
         raise Exception("Unrecognized region: {}".format(region))
     layer.setCrs(crs)
 
@@ -0,0 +1,375 @@
+#! /usr/bin/env python3
+"""
+Write the QLR that organizes and styles a QIceRadar GeoPackage, without
+starting QGIS.
+
+style_geopackage_index.py produces the same layer tree, but it needs a
+full QgsApplication (and the environment hacks described in its
+docstring) just to construct layers that are immediately serialized.
+This script writes the layer definition XML directly from the
+GeoPackage metadata, so it runs in any python environment.
+
+With --layout merged, the QLR instead points at the single merged
+table written by `create_geopackage_index.py --merged`, using one layer
+for tracks and one for BEDMAP points. Each layer has a rule-based
+renderer with a rule per institution containing a rule per campaign,
+so campaigns can still be toggled from the layer tree without QGIS
+having to open hundreds of OGR datasources.
+
+Passing --validate loads the resulting QLR into QGIS and checks that
+every layer is valid; that step does require the QGIS python bindings.
+"""
+
+import pathlib
+import uuid
+from xml.etree import ElementTree
+
+from radar_wrangler_utils.gpkg_utils import (
+    availability_colors,
+    group_campaigns,
+    load_campaign_metadata,
+    merged_layer_name,
+    region_crs,
+)
+
+# QGIS's names for the gpkg_geometry_columns geometry types we support
+layer_geometries = {
+    # geometry_type_name: (maplayer geometry, wkbType, symbol type)
+    "LINESTRING": ("Line", "LineString", "line"),
+    "MULTIPOINT": ("Point", "MultiPoint", "marker"),
+}
+
+
+def add_options(parent, options: dict[str, str]) -> None:
+    option_map = ElementTree.SubElement(parent, "Option", type="Map")
+    for key, value in options.items():
+        ElementTree.SubElement(
+            option_map, "Option", type="QString", name=key, value=value
+        )
+
+
+def symbol_element(geometry: str, color: str):
+    """
+    Equivalent to the QgsMarkerSymbol / QgsLineSymbol created in
+    style_geopackage_index.add_campaign.
+    """
+    _, _, symbol_type = layer_geometries[geometry]
+    symbol = ElementTree.Element(
+        "symbol",
+        type=symbol_type,
+        name="0",
+        alpha="1",
+        clip_to_extent="1",
+        force_rhr="0",
+    )
+    if geometry == "MULTIPOINT":
+        # BEDMAP1 points are NOT in order, so we can't connect them with lines
+        layer = ElementTree.SubElement(
+            symbol, "layer", {"class": "SimpleMarker", "enabled": "1", "locked": "0", "pass": "0"}
+        )
+        add_options(
+            layer,
+            {
+                "name": "circle",
+                "color": color,
+                "outline_style": "no",
+                "size": "1",
+                "size_unit": "Point",
+            },
+        )
+    else:
+        layer = ElementTree.SubElement(
+            symbol, "layer", {"class": "SimpleLine", "enabled": "1", "locked": "0", "pass": "0"}
+        )
+        add_options(
+            layer,
+            {
+                "line_color": color,
+                "line_style": "solid",
+                "line_width": "1",
+                "line_width_unit": "Point",
+            },
+        )
+    return symbol
+
+
+def layer_id(gpkg_filepath: str, campaign: str) -> str:
+    # Deterministic, so regenerating the QLR doesn't produce a spurious diff.
+    layer_uuid = uuid.uuid5(uuid.NAMESPACE_URL, f"{pathlib.Path(gpkg_filepath).name}/{campaign}")
+    return f"{campaign}_{str(layer_uuid).replace('-', '_')}"
+
+
+def add_tree_group(parent, name: str, expanded: bool):
+    group = ElementTree.SubElement(
+        parent,
+        "layer-tree-group",
+        expanded="1" if expanded else "0",
+        checked="Qt::Checked",
+        name=name,
+    )
+    ElementTree.SubElement(group, "customproperties")
+    return group
+
+
+def add_maplayer(maplayers, crs: str, layer_id: str, datasource: str, name: str, geometry: str):
+    maplayer_geometry, wkb_type, _ = layer_geometries[geometry]
+    maplayer = ElementTree.SubElement(
+        maplayers,
+        "maplayer",
+        type="vector",
+        geometry=maplayer_geometry,
+        wkbType=wkb_type,
+        hasScaleBasedVisibilityFlag="0",
+        autoRefreshEnabled="0",
+    )
+    ElementTree.SubElement(maplayer, "id").text = layer_id
+    ElementTree.SubElement(maplayer, "datasource").text = datasource
+    ElementTree.SubElement(maplayer, "layername").text = name
+    srs = ElementTree.SubElement(maplayer, "srs")
+    spatialrefsys = ElementTree.SubElement(srs, "spatialrefsys")
+    ElementTree.SubElement(spatialrefsys, "authid").text = crs
+    ElementTree.SubElement(maplayer, "provider", encoding="UTF-8").text = "ogr"
+    return maplayer
+
+
+def quote_literal(value: str) -> str:
+    """Quote a string for use in a QGIS expression."""
+    escaped = value.replace("'", "''")
+    return f"'{escaped}'"
+
+
+def rule_key(gpkg_filepath: str, label: str) -> str:
+    rule_uuid = uuid.uuid5(uuid.NAMESPACE_URL, f"{pathlib.Path(gpkg_filepath).name}/rule/{label}")
+    return "{" + str(rule_uuid) + "}"
+
+
+def build_campaign_qlr(region: str, gpkg_filepath: str):
+    """
+    One layer per campaign table, grouped by institution.
+    """
+    try:
+        crs = region_crs[region.lower()]
+    except KeyError:
+        raise Exception("Unrecognized region: {}".format(region))
+
+    campaign_metadata = load_campaign_metadata(gpkg_filepath)
+    institution_campaigns = group_campaigns(campaign_metadata)
+    print(
+        "{} campaigns from {} institutions".format(
+            len(campaign_metadata), len(institution_campaigns)
+        )
+    )
+
+    qlr = ElementTree.Element("qlr")
+    root_group = add_tree_group(qlr, "", True)
+    qiceradar_group = add_tree_group(root_group, f"{region} QIceRadar Index", True)
+    maplayers = ElementTree.Element("maplayers")
+
+    for institution, campaign_lists in institution_campaigns.items():
+        institution_group = add_tree_group(qiceradar_group, institution, False)
+        for availability, campaign_names in zip(["s", "a", "u"], campaign_lists):
+            for campaign in campaign_names:
+                geometry = campaign_metadata[campaign].geometry_type
+                if geometry not in layer_geometries:
+                    print(
+                        "Unrecognized geometry {} for campaign {}; cannot style".format(
+                            geometry, campaign
+                        )
+                    )
+                    continue
+                campaign_id = layer_id(gpkg_filepath, campaign)
+                datasource = "{}|layername={}".format(gpkg_filepath, campaign)
+                tree_layer = ElementTree.SubElement(
+                    institution_group,
+                    "layer-tree-layer",
+                    expanded="1",
+                    checked="Qt::Checked",
+                    id=campaign_id,
+                    name=campaign,
+                    source=datasource,
+                    providerKey="ogr",
+                )
+                ElementTree.SubElement(tree_layer, "customproperties")
+
+                maplayer = add_maplayer(maplayers, crs, campaign_id, datasource, campaign, geometry)
+                renderer = ElementTree.SubElement(
+                    maplayer,
+                    "renderer-v2",
+                    type="singleSymbol",
+                    symbollevels="0",
+                    enableorderby="0",
+                    forceraster="0",
+                )
+                symbols = ElementTree.SubElement(renderer, "symbols")
+                symbols.append(symbol_element(geometry, availability_colors[availability]))
+
+    qlr.append(maplayers)
+    return qlr
+
+
+def build_merged_qlr(region: str, gpkg_filepath: str):
+    """
+    One layer per geometry type on the merged table, with a rule-based
+    renderer providing the institution/campaign tree.
+    """
+    try:
+        crs = region_crs[region.lower()]
+    except KeyError:
+        raise Exception("Unrecognized region: {}".format(region))
+
+    campaign_metadata = load_campaign_metadata(gpkg_filepath)
+    institution_campaigns = group_campaigns(campaign_metadata)
+    print(
+        "{} campaigns from {} institutions".format(
+            len(campaign_metadata), len(institution_campaigns)
+        )
+    )
+
+    qlr = ElementTree.Element("qlr")
+    root_group = add_tree_group(qlr, "", True)
+    qiceradar_group = add_tree_group(root_group, f"{region} QIceRadar Index", True)
+    maplayers = ElementTree.Element("maplayers")
+
+    layer_names = {"LINESTRING": "Radar tracks", "MULTIPOINT": "BEDMAP points"}
+    for geometry, name in layer_names.items():
+        _, wkb_type, _ = layer_geometries[geometry]
+        merged_id = layer_id(gpkg_filepath, f"{merged_layer_name}_{wkb_type}")
+        datasource = "{}|layername={}|geometrytype={}".format(
+            gpkg_filepath, merged_layer_name, wkb_type
+        )
+
+        renderer = ElementTree.Element(
+            "renderer-v2",
+            type="RuleRenderer",
+            symbollevels="0",
+            enableorderby="0",
+            forceraster="0",
+        )
+        rules = ElementTree.SubElement(
+            renderer, "rules", key=rule_key(gpkg_filepath, f"{name}/root")
+        )
+        symbols = ElementTree.SubElement(renderer, "symbols")
+        symbol_count = 0
+        for institution, campaign_lists in institution_campaigns.items():
+            institution_rule = None
+            for availability, campaign_names in zip(["s", "a", "u"], campaign_lists):
+                for campaign in campaign_names:
+                    if campaign_metadata[campaign].geometry_type != geometry:
+                        continue
+                    if institution_rule is None:
+                        institution_rule = ElementTree.SubElement(
+                            rules,
+                            "rule",
+                            key=rule_key(gpkg_filepath, f"{name}/{institution}"),
+                            label=institution,
+                            filter='"institution" = {}'.format(quote_literal(institution)),
+                        )
+                    ElementTree.SubElement(
+                        institution_rule,
+                        "rule",
+                        key=rule_key(gpkg_filepath, f"{name}/{institution}/{campaign}"),
+                        label=campaign,
+                        filter='"campaign" = {}'.format(quote_literal(campaign)),
+                        symbol=str(symbol_count),
+                    )
+                    symbol = symbol_element(geometry, availability_colors[availability])
+                    symbol.set("name", str(symbol_count))
+                    symbols.append(symbol)
+                    symbol_count += 1
+
+        if symbol_count == 0:
+            print(f"No {geometry} campaigns; not adding layer {name}")
+            continue
+
+        tree_layer = ElementTree.SubElement(
+            qiceradar_group,
+            "layer-tree-layer",
+            expanded="0",
+            checked="Qt::Checked",
+            id=merged_id,
+            name=name,
+            source=datasource,
+            providerKey="ogr",
+        )
+        ElementTree.SubElement(tree_layer, "customproperties")
+        maplayer = add_maplayer(maplayers, crs, merged_id, datasource, name, geometry)
+        maplayer.append(renderer)
+
+    qlr.append(maplayers)
+    return qlr
+
+
+def write_qlr(region: str, gpkg_filepath: str, qlr_filepath: str, layout: str = "campaigns") -> None:
+    # QGIS resolves the datasource relative to the QLR unless it's absolute
+    gpkg_filepath = str(pathlib.Path(gpkg_filepath).resolve())
+    if layout == "campaigns":
+        qlr = build_campaign_qlr(region, gpkg_filepath)
+    elif layout == "merged":
+        qlr = build_merged_qlr(region, gpkg_filepath)
+    else:
+        raise Exception(f"Unrecognized QLR layout: {layout}")
+    tree = ElementTree.ElementTree(qlr)
+    ElementTree.indent(tree)
+    with open(qlr_filepath, "w") as fp:
+        fp.write("<!DOCTYPE qgis-layer-definition>\n")
+        tree.write(fp, encoding="unicode")
+        fp.write("\n")
+    print(f"Wrote {qlr_filepath}")
+
+
+def validate_qlr(qlr_filepath: str) -> bool:
+    """
+    Load the QLR into a headless QGIS and check that every layer is valid.
+    """
+    from qgis.core import QgsApplication, QgsLayerDefinition, QgsProject
+
+    print("Initializing QGIS")
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+    try:
+        project = QgsProject.instance()
+        ok, error = QgsLayerDefinition.loadLayerDefinition(
+            qlr_filepath, project, project.layerTreeRoot()
+        )
+        if not ok:
+            print(f"QGIS could not load {qlr_filepath}: {error}")
+            return False
+
+        invalid_layers = [
+            layer.name() for layer in project.mapLayers().values() if not layer.isValid()
+        ]
+        for name in invalid_layers:
+            print(f"Invalid layer: {name}")
+        print(
+            "{} / {} layers valid".format(
+                len(project.mapLayers()) - len(invalid_layers), len(project.mapLayers())
+            )
+        )
+        return len(invalid_layers) == 0
+    finally:
+        qgs.exitQgis()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("region", help="ARCTIC or ANTARCTIC")
+    parser.add_argument("gpkg_filepath", help="Path to input GeoPackage file")
+    parser.add_argument("qlr_filepath", help="Path to output qlr file")
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="Load the output in QGIS and check all layers are valid (requires QGIS)",
+    )
+    parser.add_argument(
+        "--layout",
+        choices=["campaigns", "merged"],
+        default="campaigns",
+        help="One layer per campaign, or rule-based layers over the merged table",
+    )
+    args = parser.parse_args()
+
+    write_qlr(args.region, args.gpkg_filepath, args.qlr_filepath, args.layout)
+    if args.validate and not validate_qlr(args.qlr_filepath):
+        raise Exception(f"Validation failed for {args.qlr_filepath}")
@@ -1,29 +1,22 @@
 """
 Common functions used by the detangle_bedmap1_{institution} jupyter notebooks.
+
+Like the other data_exploration modules, this expects the repo's code/
+directory to be on PYTHONPATH.
 """
 import numpy as np
-import pandas as pd
 import pyproj
+import scipy.spatial
 
+from radar_wrangler_utils.ingest_utils import read_bedmap_lonlat
 
-def load_bedmap_ll(filepath):
-    data = pd.read_csv(filepath, skiprows=18)
-
-    lon_index = [col for col in data.columns if "longitude" in col][0]
-    lat_index = [col for col in data.columns if "latitude" in col][0]
-    lon = data[lon_index]
-    lat = data[lat_index]
 
-    return lon, lat
+def load_bedmap_ll(filepath, cache_dir=None):
+    return read_bedmap_lonlat(filepath, cache_dir)
 
 
-def load_bedmap_xy_new(filepath) -> np.ndarray:
-    data = pd.read_csv(filepath, skiprows=18)
-
-    lon_index = [col for col in data.columns if "longitude" in col][0]
-    lat_index = [col for col in data.columns if "latitude" in col][0]
-    lon = data[lon_index]
-    lat = data[lat_index]
+def load_bedmap_xy_new(filepath, cache_dir=None) -> np.ndarray:
+    lon, lat = read_bedmap_lonlat(filepath, cache_dir)
     ps71 = pyproj.Proj("epsg:3031")
     xx, yy = ps71.transform(lon, lat)
 
@@ -32,13 +25,8 @@ def load_bedmap_xy_new(filepath) -> np.ndarray:
     return coords
 
 
-def load_bedmap_xy(filepath):
-    data = pd.read_csv(filepath, skiprows=18)
-
-    lon_index = [col for col in data.columns if "longitude" in col][0]
-    lat_index = [col for col in data.columns if "latitude" in col][0]
-    lon = data[lon_index]
-    lat = data[lat_index]
+def load_bedmap_xy(filepath, cache_dir=None):
+    lon, lat = read_bedmap_lonlat(filepath, cache_dir)
     ps71 = pyproj.Proj("epsg:3031")
     xx, yy = ps71.transform(lon, lat)
 
@@ -79,14 +67,46 @@ def subsample_tracks_uniform(xx, yy, min_spacing):
     return xx[keep_idxs], yy[keep_idxs]
 
 
+# The notebooks call find_closest_bedmap / expand_range once per campaign
+# (or flight) with the same BEDMAP1 arrays, so the last few trees are kept
+# as (xx, yy, tree), most recently used last.
+recent_trees = []
+max_recent_trees = 4
+
+
+def make_tree(xx, yy):
+    """
+    Build a KD-tree over the input points, which can be passed to
+    find_closest_bedmap (BEDMAP1 points) and expand_range (survey points).
+
+    Trees are re-used when called again with the same array objects, so
+    those arrays shouldn't be modified in place afterwards.
+    """
+    for idx, (tree_xx, tree_yy, tree) in enumerate(recent_trees):
+        if tree_xx is xx and tree_yy is yy:
+            recent_trees.append(recent_trees.pop(idx))
+            return tree
+    tree = scipy.spatial.cKDTree(np.column_stack([xx, yy]))
+    recent_trees.append((xx, yy, tree))
+    del recent_trees[:-max_recent_trees]
+    return tree
+
+
 def find_closest_bedmap(
-    survey_xx, survey_yy, bm1_xx, bm1_yy, decimation=None, subsampling=None
+    survey_xx,
+    survey_yy,
+    bm1_xx,
+    bm1_yy,
+    decimation=None,
+    subsampling=None,
+    bm1_tree=None,
 ):
     """
     For every point in the input survey, find the closest point in BM1.
-    For computational reasons, it is usually best to subsample/decimate the input data
+    Returns the sorted, unique BM1 indices.
     * subsampling: distance (in meters) between output subsampled points
     * decimation: only keep the N-th input point
+    * bm1_tree: optional result of make_tree(bm1_xx, bm1_yy)
     """
     if subsampling is not None:
         xx, yy = subsample_tracks_uniform(survey_xx, survey_yy, subsampling)
@@ -97,24 +117,24 @@ def find_closest_bedmap(
         xx = survey_xx[survey_idxs]
         yy = survey_yy[survey_idxs]
     else:
-        print("WARNING: attempting to find closest bedmap points at full resolution!")
         xx = survey_xx
         yy = survey_yy
 
-    min_bm1_idxs = -1 * np.ones(xx.shape)
-
-    for idx in np.arange(len(xx)):
-        dx = np.abs(bm1_xx - xx[idx])
-        dy = np.abs(bm1_yy - yy[idx])
-        dists = np.sqrt(dx * dx + dy * dy)
-        min_bm1_idxs[idx] = np.argmin(dists)
-    # Need array of ints to use as indices
-    min_bm1_idxs = list({int(el) for el in min_bm1_idxs})
-    return np.array(min_bm1_idxs)
+    if bm1_tree is None:
+        bm1_tree = make_tree(bm1_xx, bm1_yy)
+    _, min_bm1_idxs = bm1_tree.query(np.column_stack([xx, yy]), k=1, workers=-1)
+    return np.unique(min_bm1_idxs)
 
 
 def expand_range(
-    group_idxs, survey_xx, survey_yy, bm1_xx, bm1_yy, tolerance=10000, max_gap=np.inf
+    group_idxs,
+    survey_xx,
+    survey_yy,
+    bm1_xx,
+    bm1_yy,
+    tolerance=10000,
+    max_gap=np.inf,
+    survey_tree=None,
 ):
     """
     Our calculated range may miss a few points from the BEDMAP1 dataset, so see if we
@@ -126,7 +146,11 @@ def expand_range(
          are generally contiguous within a survey, so the next survey is likely
          to be a large jump.)
     * max_gap: distance between successive points in BM1 that we'll expand between
+    * survey_tree: optional result of make_tree(survey_xx, survey_yy)
     """
+    if survey_tree is None:
+        survey_tree = make_tree(survey_xx, survey_yy)
+
     # Distance from point in segment to closest point in the survey
     min_dist = 0
     group_start = min(group_idxs)
@@ -138,13 +162,10 @@ def expand_range(
         group_start -= 1
         if group_start < 0:
             break
-        dx = np.abs(bm1_xx[group_start] - survey_xx)
-        dy = np.abs(bm1_yy[group_start] - survey_yy)
-        dists = np.sqrt(dx * dx + dy * dy)
-        min_dist = np.min(dists)
-
         curr_x = bm1_xx[group_start]
         curr_y = bm1_yy[group_start]
+        min_dist, _ = survey_tree.query([curr_x, curr_y], k=1)
+
         delta = np.sqrt((curr_x - prev_x) ** 2 + (curr_y - prev_y) ** 2)
         prev_x, prev_y = curr_x, curr_y
 
@@ -160,12 +181,9 @@ def expand_range(
         group_end += 1
         if group_end >= len(bm1_xx):
             break
-        dx = np.abs(bm1_xx[group_end] - survey_xx)
-        dy = np.abs(bm1_yy[group_end] - survey_yy)
-        dists = np.sqrt(dx * dx + dy * dy)
-        min_dist = np.min(dists)
         curr_x = bm1_xx[group_end]
         curr_y = bm1_yy[group_end]
+        min_dist, _ = survey_tree.query([curr_x, curr_y], k=1)
         delta = np.sqrt((curr_x - prev_x) ** 2 + (curr_y - prev_y) ** 2)
         prev_x, prev_y = curr_x, curr_y
     print("For BM1 idx {}, min_dist = {:0.2f} km".format(group_end, min_dist / 1000))